@@ -1,7 +1,10 @@
 from .backends import *
+from .compression import *
 from .fields import *
 from .index import *
+from .metrics import *
 from .model import *
 from .serializers import *
+from .tracing import *
 
 __version__ = "0.0.1"
@@ -1,9 +1,37 @@
+import asyncio
+import atexit
+import bisect
+import hashlib
+import heapq
+import json
+import logging
 import math
+import mmap
+import os
 import random
+import re
+import socket
+import sqlite3
+import struct
+import tempfile
+import threading
 import time
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict, defaultdict
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+)
+from contextlib import contextmanager
+from functools import partial
 
 from .types import to_bytes
 
+logger = logging.getLogger(__name__)
+
 
 class BaseBackend(object):  # pragma: no cover
     """Base class for the cache backends.
@@ -51,6 +79,25 @@ class BaseBackend(object):  # pragma: no cover
         """
         return True
 
+    def add(self, key, value, ttl=None):
+        """Add the key/value to the cache only if the key does not already
+        exist in the cache.
+
+        For supporting caches this is an atomic operation.
+
+        :param key: the key to add
+        :param value: the value for the key
+        :param ttl: the cache ttl for the key in seconds (if not
+                    specified, it uses the default ttl). A ttl of
+                    0 indicates that the cache never expires.
+        :returns: ``True`` if key has been added, ``False`` if key already exists
+                  or for backend errors.
+        :rtype: boolean
+        """
+        if self.get(key) is not None:
+            return False
+        return self.set(key, value, ttl)
+
     def get(self, key):
         """Look up key in the cache and return the value for it.
 
@@ -96,6 +143,21 @@ class BaseBackend(object):  # pragma: no cover
         """
         return {k: self.replace(k, v, ttl) for k, v in mapping.items()}
 
+    def add_many(self, mapping, ttl=None):
+        """Adds multiple keys and values from a mapping, every key is only
+        added if it does not already exist.
+
+        :param mapping: a mapping with the keys/values to add.
+        :param ttl: the cache ttl for the key in seconds (if not
+                    specified, it uses the default ttl). A ttl of
+                    0 indicates that the cache never expires.
+        :returns: A dict, the keys is the keys in the mapping,
+                  and the value is whether the corresponding key is added.
+                  ``True`` if key has been added, else ``False``.
+        :rtype: dict
+        """
+        return {k: self.add(k, v, ttl) for k, v in mapping.items()}
+
     def get_many(self, *keys):
         """Returns a list of values for the given keys.
         For each key an item in the list is created.
@@ -131,6 +193,23 @@ class BaseBackend(object):  # pragma: no cover
         """
         return all(self.delete(k) for k in keys)
 
+    def write_batch(self, mappings, deletes=()):
+        """Deletes the keys of `deletes`, then sets the keys and values of
+        `mappings`, for supporting caches in one round trip.
+
+        :param mappings: a dict of the mappings to set by ttl.
+        :param deletes: the keys to delete, none of them is in `mappings`.
+        :returns: A dict, the keys is the keys in the mappings,
+                  and the value is whether the corresponding key is updated.
+        :rtype: dict
+        """
+        if deletes:
+            self.delete_many(*deletes)
+        rv = {}
+        for ttl, mapping in mappings.items():
+            rv.update(self.set_many(mapping, ttl))
+        return rv
+
     def has(self, key):
         """Checks if a key exists in the cache without returning it. This is a
         cheap operation that bypasses loading the actual data on the backend.
@@ -141,6 +220,16 @@ class BaseBackend(object):  # pragma: no cover
         """
         raise NotImplementedError
 
+    def has_many(self, *keys):
+        """Checks if the keys exist in the cache.
+
+        :param keys: The keys to check.
+        :returns: A dict, the keys is the keys to check,
+                  and the value is whether the corresponding key exists.
+        :rtype: dict
+        """
+        return {key: self.has(key) for key in keys}
+
     def incr(self, key, delta=1, ttl=None):
         """Increments the value of a key by `delta`. If the key key does
         not exist, its value will be initialized to 0 first, and
@@ -176,71 +265,351 @@ class BaseBackend(object):  # pragma: no cover
         return value if self.set(key, value, ttl) else None
 
 
+class _Quota(object):
+    def __init__(self, prefix, max_bytes):
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.keys = OrderedDict()
+
+
 class SimpleBackend(BaseBackend):
     """Simple backend for single process environments.  This class exists
     mainly for the development server and is not 100% thread safe.  It tries
     to use as many atomic operations as possible and no locks for simplicity
     but it could happen under heavy load that keys are added multiple times.
 
+    Expired keys are reclaimed incrementally through an expiry index (a heap
+    ordered by expiration time), every write reclaims at most
+    `RECLAIM_BATCH_SIZE` of them, so no operation walks the whole store.
+
+    Values are converted to bytes once when they are set, `max_bytes` and
+    `quotas` bound the total size of the stored values.
+
     :param threshold: the maximum number of items the cache stores before
                       it starts deleting some.
     :param default_ttl: the default ttl that is used if no ttl is
                         specified on :meth:`~BaseBackend.set`. A ttl of
                         0 indicates that the cache never expires.
+    :param policy: the eviction policy used when `threshold` is reached.
+                   ``"lru"`` evicts the least recently used key in O(1),
+                   ``"random"`` drops the expired keys, or 20% randomly
+                   selected keys if none has expired.
+    :param clock: a callable returns the current time in seconds,
+                  defaults to :func:`time.time`.
+    :param max_bytes: the maximum total size of the stored values, keys
+                      are evicted according to `policy` when it's exceeded.
+                      ``None`` means unlimited.
+    :param quotas: a mapping of key prefix to the maximum total size of
+                   the values whose key starts with it, such as
+                   ``{"m:user:": 1 << 20}`` for the default key format of
+                   the `User` model. The least recently set/used key of the
+                   prefix is evicted when its quota is exceeded.
     """
 
-    def __init__(self, threshold=100, default_ttl=300):
+    POLICIES = ("lru", "random")
+    RECLAIM_BATCH_SIZE = 16
+
+    def __init__(
+        self,
+        threshold=100,
+        default_ttl=300,
+        policy="lru",
+        clock=None,
+        max_bytes=None,
+        quotas=None,
+    ):
         super(SimpleBackend, self).__init__(default_ttl)
+        if policy not in self.POLICIES:
+            raise ValueError("unsupported eviction policy %r" % policy)
         self._threshold = threshold
-        self._store = {}
+        self._policy = policy
+        self._clock = clock or time.time
+        self._max_bytes = max_bytes
+        # longest prefix first, so that the most specific quota matches.
+        self._quotas = [
+            _Quota(prefix, quota_bytes)
+            for prefix, quota_bytes in sorted(
+                (quotas or {}).items(), key=lambda item: -len(item[0])
+            )
+        ]
+        self._used_bytes = 0
+        self._store = OrderedDict()
+        self._expiry = []
 
     def _normalize_ttl(self, ttl):
         ttl = super(SimpleBackend, self)._normalize_ttl(ttl)
-        return time.time() + ttl if ttl > 0 else 0
+        return self._clock() + ttl if ttl > 0 else 0
+
+    def _match_quota(self, key):
+        for quota in self._quotas:
+            if key.startswith(quota.prefix):
+                return quota
+        return None
+
+    def _pop(self, key):
+        item = self._store.pop(key, None)
+        if item is not None:
+            size = len(item[1])
+            self._used_bytes -= size
+            quota = self._match_quota(key)
+            if quota is not None:
+                quota.used_bytes -= size
+                del quota.keys[key]
+        return item
+
+    def _index_expiry(self, key, expireat):
+        if expireat == 0:
+            return
+        if len(self._expiry) > 2 * len(self._store) + self.RECLAIM_BATCH_SIZE:
+            # too many outdated entries left by overwritten or deleted keys.
+            self._expiry = [(e, k) for k, (e, _) in self._store.items() if e != 0]
+            heapq.heapify(self._expiry)
+        heapq.heappush(self._expiry, (expireat, key))
+
+    def _reclaim(self, now, limit=math.inf):
+        """Deletes at most `limit` expired keys, returns the number of them."""
+        reclaimed = 0
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now and reclaimed < limit:
+            expireat, key = heapq.heappop(expiry)
+            item = self._store.get(key)
+            # skip the outdated entries of overwritten or deleted keys.
+            if item is not None and item[0] == expireat:
+                self._pop(key)
+                reclaimed += 1
+        return reclaimed
 
     def _randomly_select(self, ratio=0.2):
         keys = list(self._store.keys())
         random.shuffle(keys)
         return [keys[i] for i in range(math.ceil(len(keys) * ratio))]
 
-    def _prune(self):
-        if len(self._store) >= self._threshold:
-            now = time.time()
-            toremove = []
-            for key, (expireat, _) in self._store.items():
-                if expireat != 0 and expireat < now:
-                    toremove.append(key)
-            toremove = toremove or self._randomly_select(0.2)
-            for key in toremove:
-                self._store.pop(key, None)
+    def _evict(self):
+        if self._policy == "lru":
+            self._pop(next(iter(self._store)))
+        elif not self._reclaim(self._clock()):
+            for key in self._randomly_select(0.2):
+                self._pop(key)
+
+    def _prune(self, key, size):
+        self._reclaim(self._clock(), self.RECLAIM_BATCH_SIZE)
+        while len(self._store) >= self._threshold:
+            self._evict()
+        quota = self._match_quota(key)
+        if quota is not None:
+            while quota.keys and quota.used_bytes + size > quota.max_bytes:
+                self._pop(next(iter(quota.keys)))
+        if self._max_bytes is not None:
+            while self._store and self._used_bytes + size > self._max_bytes:
+                self._evict()
+        return quota
+
+    def _oversized(self, key, size):
+        if self._max_bytes is not None and size > self._max_bytes:
+            return True
+        quota = self._match_quota(key)
+        return quota is not None and size > quota.max_bytes
+
+    def _touch(self, key):
+        if self._policy == "lru":
+            self._store.move_to_end(key)
+            quota = self._match_quota(key)
+            if quota is not None:
+                quota.keys.move_to_end(key)
 
     def set(self, key, value, ttl=None):
+        value = to_bytes(value)
+        size = len(value)
+        if self._oversized(key, size):
+            # like memcached, a rejected write drops the outdated value.
+            self._pop(key)
+            return False
         expireat = self._normalize_ttl(ttl)
-        self._prune()
+        self._pop(key)
+        quota = self._prune(key, size)
         self._store[key] = (expireat, value)
+        self._used_bytes += size
+        if quota is not None:
+            quota.used_bytes += size
+            quota.keys[key] = None
+        self._index_expiry(key, expireat)
         return True
 
     def replace(self, key, value, ttl=None):
         if key not in self._store:
             return False
-        expireat = self._normalize_ttl(ttl)
-        self._store[key] = (expireat, value)
-        return True
+        return self.set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        if self.has(key):
+            return False
+        return self.set(key, value, ttl)
 
     def get(self, key):
         try:
             expireat, value = self._store[key]
-            if expireat == 0 or expireat > time.time():
-                return to_bytes(value)
+            if expireat == 0 or expireat > self._clock():
+                self._touch(key)
+                return value
         except KeyError:
             return None
 
     def delete(self, key):
-        return self._store.pop(key, None) is not None
+        return self._pop(key) is not None
+
+    def has(self, key):
+        return self.get(key) is not None
+
+
+class ConcurrentSimpleBackend(BaseBackend):
+    """Thread safe variant of :class:`SimpleBackend` for multi-threaded
+    environments.  Keys are split across `shards` :class:`SimpleBackend`,
+    each one guarded by its own lock, so that operations on keys of
+    different shards never serialize.  Batch operations acquire the lock
+    of every involved shard only once.
+
+    :param shards: the number of shards(locks) the keys are split across.
+    :param threshold: the maximum number of items the cache stores before
+                      it starts deleting some, shared evenly by the shards.
+    :param default_ttl: the default ttl that is used if no ttl is
+                        specified on :meth:`~BaseBackend.set`. A ttl of
+                        0 indicates that the cache never expires.
+    :param policy: the eviction policy of every shard,
+                   see :class:`SimpleBackend`.
+    :param clock: a callable returns the current time in seconds,
+                  defaults to :func:`time.time`.
+    :param max_bytes: the maximum total size of the stored values,
+                      shared evenly by the shards.
+    :param quotas: a mapping of key prefix to the maximum total size of
+                   the values whose key starts with it, every quota is
+                   shared evenly by the shards.
+    """
+
+    def __init__(
+        self,
+        shards=16,
+        threshold=1600,
+        default_ttl=300,
+        policy="lru",
+        clock=None,
+        max_bytes=None,
+        quotas=None,
+    ):
+        super(ConcurrentSimpleBackend, self).__init__(default_ttl)
+        if shards < 1:
+            raise ValueError("shards must be a positive number")
+
+        def split(n):
+            return max(math.ceil(n / shards), 1)
+
+        options = {
+            "threshold": split(threshold),
+            "default_ttl": default_ttl,
+            "policy": policy,
+            "clock": clock,
+            "max_bytes": split(max_bytes) if max_bytes is not None else None,
+            "quotas": {p: split(n) for p, n in (quotas or {}).items()},
+        }
+        self._shards = [
+            (threading.Lock(), SimpleBackend(**options)) for _ in range(shards)
+        ]
+
+    def _get_shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _group_by_shard(self, keys):
+        groups = defaultdict(list)
+        for key in keys:
+            groups[hash(key) % len(self._shards)].append(key)
+        return [(self._shards[i], group) for i, group in groups.items()]
+
+    def set(self, key, value, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        lock, shard = self._get_shard(key)
+        with lock:
+            return shard.set(key, value, ttl)
+
+    def replace(self, key, value, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        lock, shard = self._get_shard(key)
+        with lock:
+            return shard.replace(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        lock, shard = self._get_shard(key)
+        with lock:
+            return shard.add(key, value, ttl)
+
+    def get(self, key):
+        lock, shard = self._get_shard(key)
+        with lock:
+            return shard.get(key)
+
+    def delete(self, key):
+        lock, shard = self._get_shard(key)
+        with lock:
+            return shard.delete(key)
+
+    def set_many(self, mapping, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        rv = {}
+        for (lock, shard), keys in self._group_by_shard(mapping):
+            with lock:
+                rv.update(shard.set_many({k: mapping[k] for k in keys}, ttl))
+        return {k: rv[k] for k in mapping}
+
+    def replace_many(self, mapping, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        rv = {}
+        for (lock, shard), keys in self._group_by_shard(mapping):
+            with lock:
+                rv.update(shard.replace_many({k: mapping[k] for k in keys}, ttl))
+        return {k: rv[k] for k in mapping}
+
+    def add_many(self, mapping, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        rv = {}
+        for (lock, shard), keys in self._group_by_shard(mapping):
+            with lock:
+                rv.update(shard.add_many({k: mapping[k] for k in keys}, ttl))
+        return {k: rv[k] for k in mapping}
+
+    def get_many(self, *keys):
+        mapping = self.get_dict(*keys)
+        return [mapping[key] for key in keys]
+
+    def get_dict(self, *keys):
+        rv = {}
+        for (lock, shard), group in self._group_by_shard(keys):
+            with lock:
+                rv.update(shard.get_dict(*group))
+        return rv
+
+    def delete_many(self, *keys):
+        deleted = True
+        for (lock, shard), group in self._group_by_shard(keys):
+            with lock:
+                for key in group:
+                    deleted = shard.delete(key) and deleted
+        return deleted
 
     def has(self, key):
         return self.get(key) is not None
 
+    def incr(self, key, delta=1, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        lock, shard = self._get_shard(key)
+        with lock:
+            return shard.incr(key, delta, ttl)
+
+    def decr(self, key, delta=1, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        lock, shard = self._get_shard(key)
+        with lock:
+            return shard.decr(key, delta, ttl)
+
 
 class RedisBackend(BaseBackend):
     """Uses the Redis key-value store as a cache backend.
@@ -293,6 +662,10 @@ class RedisBackend(BaseBackend):
         ttl = self._normalize_ttl(ttl)
         return bool(self._client.set(key, value, ex=ttl, xx=True))
 
+    def add(self, key, value, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        return bool(self._client.set(key, value, ex=ttl, nx=True))
+
     def get(self, key):
         return to_bytes(self._client.get(key))
 
@@ -320,12 +693,35 @@ class RedisBackend(BaseBackend):
             values = pipe.execute()
             return dict(zip(keys, map(bool, values)))
 
+    def add_many(self, mapping, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        with self._client.pipeline() as pipe:
+            keys = list(mapping.keys())
+            for key in keys:
+                pipe.set(name=key, value=mapping[key], ex=ttl, nx=True)
+            values = pipe.execute()
+            return dict(zip(keys, map(bool, values)))
+
     def get_many(self, *keys):
         return [to_bytes(v) for v in self._client.mget(keys)]
 
     def delete_many(self, *keys):
         return self._client.delete(*keys) == len(keys)
 
+    def write_batch(self, mappings, deletes=()):
+        # one MULTI/EXEC, the other clients never see a partial batch.
+        with self._client.pipeline(transaction=True) as pipe:
+            if deletes:
+                pipe.delete(*deletes)
+            keys = []
+            for ttl, mapping in mappings.items():
+                ttl = self._normalize_ttl(ttl)
+                for key, value in mapping.items():
+                    pipe.set(name=key, value=value, ex=ttl)
+                    keys.append(key)
+            values = pipe.execute()
+        return dict(zip(keys, map(bool, values[1:] if deletes else values)))
+
     def has(self, key):
         return bool(self._client.exists(key))
 
@@ -350,11 +746,169 @@ class RedisBackend(BaseBackend):
             return values[0]
 
 
+class _Chunker(object):
+    """Stores every value over `max_value_size` bytes as chunks of
+    `chunk_size` bytes, under the keys ``<key>:chunk:<generation>:<n>``,
+    and a manifest under the key itself, which refers to the chunks by the
+    generation of the write, so that a reader never assembles the chunks
+    of different writes. ``None`` `max_value_size` disables the chunking.
+
+    The chunks of every batch are written with one `set_many` before the
+    manifests, and read with one `get_many` after them. The chunks of the
+    overwritten or deleted values are left to expire with their ttl.
+
+    The chunk keys of the keys too long to be suffixed within
+    `max_key_length` bytes use the digest of the key instead of the key.
+    """
+
+    MAGIC = b"\xc1cacheorm:chunks:"
+    # ":chunk:", a generation, ":" and up to 8 digits.
+    SUFFIX_LENGTH = 7 + 32 + 1 + 8
+
+    def __init__(self, max_value_size=None, chunk_size=None, max_key_length=250):
+        self.max_value_size = max_value_size
+        self.chunk_size = chunk_size or max_value_size
+        self.max_key_length = max_key_length
+
+    def oversized(self, value):
+        if self.max_value_size is None or not isinstance(
+            value, (bytes, bytearray, str)
+        ):
+            return False
+        return len(to_bytes(value)) > self.max_value_size
+
+    def _chunk_keys(self, key, generation, count):
+        encoded = key.encode("utf-8")
+        if len(encoded) + self.SUFFIX_LENGTH > self.max_key_length:
+            key = hashlib.blake2b(encoded, digest_size=16).hexdigest()
+        return ["%s:chunk:%s:%d" % (key, generation, i) for i in range(count)]
+
+    def _parse(self, value):
+        if not isinstance(value, bytes) or not value.startswith(self.MAGIC):
+            return None
+        # an ordinary value may start with the magic too.
+        fields = value[len(self.MAGIC) :].split(b":")
+        if len(fields) != 3:
+            return None
+        generation, count, size = fields
+        if not (generation.isalnum() and count.isdigit() and size.isdigit()):
+            return None
+        return generation.decode("ascii"), int(count), int(size)
+
+    def write(self, mapping, ttl, write_many, set_many):
+        """Writes `mapping` with `write_many`, the chunks with `set_many`."""
+        manifests, chunks, chunk_keys = {}, {}, {}
+        for key, value in mapping.items():
+            if not self.oversized(value):
+                continue
+            value, generation = to_bytes(value), uuid.uuid4().hex
+            parts = [
+                value[i : i + self.chunk_size]
+                for i in range(0, len(value), self.chunk_size)
+            ]
+            chunk_keys[key] = self._chunk_keys(key, generation, len(parts))
+            chunks.update(zip(chunk_keys[key], parts))
+            manifests[key] = self.MAGIC + b"%s:%d:%d" % (
+                generation.encode("ascii"),
+                len(parts),
+                len(value),
+            )
+        if not manifests:
+            return write_many(mapping, ttl)
+        stored = set_many(chunks, ttl)
+        valid_mapping = {
+            k: manifests.get(k, v)
+            for k, v in mapping.items()
+            if all(stored[ck] for ck in chunk_keys.get(k, ()))
+        }
+        rv = write_many(valid_mapping, ttl) if valid_mapping else {}
+        return {k: rv.get(k, False) for k in mapping}
+
+    def read(self, values, get_dict):
+        """Replaces the manifests in `values` with the values assembled
+        from the chunks got by `get_dict`."""
+        manifests = {}
+        for key, value in values.items():
+            manifest = self._parse(value)
+            if manifest is not None:
+                manifests[key] = manifest
+        if not manifests:
+            return values
+        chunk_keys = {
+            key: self._chunk_keys(key, generation, count)
+            for key, (generation, count, _) in manifests.items()
+        }
+        chunks = get_dict(*[ck for cks in chunk_keys.values() for ck in cks])
+        rv = dict(values)
+        for key, cks in chunk_keys.items():
+            parts = [chunks.get(ck) for ck in cks]
+            value = None if None in parts else b"".join(parts)
+            # some chunks have been evicted.
+            if value is None or len(value) != manifests[key][2]:
+                value = None
+            rv[key] = value
+        return rv
+
+
+class KeyNormalizer(object):
+    """Normalizes the keys a backend can't store, such as the memcached keys
+    over 250 bytes or containing whitespace or control characters, instead of
+    dropping them. A normalized key keeps the readable prefix of the key, with
+    the forbidden characters replaced by ``_``, followed by the blake2b digest
+    of the whole key.
+
+    The calls which normalized a key, reads included, are counted in
+    `normalizations`, not the distinct keys, which would need to remember
+    all of them.
+
+    :param max_length: the maximum length in bytes of the keys.
+    :param normalize_all: normalize every key, not only the invalid ones.
+    :param digest_size: the size in bytes of the digest.
+    """
+
+    FORBIDDEN_CHARS = re.compile(r"[\x00-\x20\x7f]")
+
+    def __init__(self, max_length=250, normalize_all=False, digest_size=16):
+        self.max_length = max_length
+        self.normalize_all = normalize_all
+        self.digest_size = digest_size
+        self.normalizations = 0
+        self._lock = threading.Lock()
+
+    def is_valid(self, key):
+        return len(
+            key.encode("utf-8")
+        ) <= self.max_length and not self.FORBIDDEN_CHARS.search(key)
+
+    def __call__(self, key):
+        if not self.normalize_all and self.is_valid(key):
+            return key
+        with self._lock:
+            self.normalizations += 1
+        digest = hashlib.blake2b(
+            key.encode("utf-8"), digest_size=self.digest_size
+        ).hexdigest()
+        prefix = self.FORBIDDEN_CHARS.sub("_", key).encode("utf-8")
+        prefix = prefix[: self.max_length - len(digest) - 1]
+        return "%s:%s" % (prefix.decode("utf-8", "ignore"), digest)
+
+
 class MemcachedBackend(BaseBackend):
     """A cache that uses memcached as backend.
 
-    Implementation notes: All methods have processed the key over 250 characters,
-    ensure that no errors will be thrown, ignoring the operation of illegal keys.
+    Implementation notes: the keys over 250 bytes or containing whitespace or
+    control characters are normalized by a :class:`KeyNormalizer`, or, when
+    `normalize_keys` is ``False``, ignored by all the methods without raising
+    errors.
+
+    `incr` uses the atomic memcached ``incr``, and initializes the missing keys
+    with ``add``. As memcached can neither decrement below 0 nor increment a
+    negative value, `decr` and those increments use a ``gets``/``cas`` loop,
+    which needs the ``cas`` behavior of the pylibmc client, a client without it
+    falls back to the non-atomic :meth:`BaseBackend.decr`.
+
+    The values over `max_value_size` bytes, which memcached would reject,
+    are split into several keys, see :class:`ChunkedBackend`.
 
     :param servers: a list or tuple of server addresses or alternatively
                     a :class:`memcache.Client` or a compatible client.
@@ -363,23 +917,43 @@ class MemcachedBackend(BaseBackend):
     :param default_ttl: the default ttl that is used if no ttl is
                             specified on :meth:`~BaseBackend.set`. A ttl of
                             0 indicates that the cache never expires.
+    :param max_value_size: the maximum size of the values stored as one item,
+                           ``None`` disables the chunking.
+    :param normalize_keys: ``True``, ``False`` or a :class:`KeyNormalizer`,
+                           such as ``KeyNormalizer(normalize_all=True)``.
     """
 
     KEY_MAX_LENGTH = 250
 
-    def __init__(self, servers=(("localhost", 11211),), client=None, default_ttl=600):
+    def __init__(
+        self,
+        servers=(("localhost", 11211),),
+        client=None,
+        default_ttl=600,
+        max_value_size=1000 * 1000,
+        normalize_keys=True,
+    ):
         super(MemcachedBackend, self).__init__(default_ttl)
+        self._chunker = _Chunker(max_value_size)
+        if normalize_keys is True:
+            normalize_keys = KeyNormalizer(self.KEY_MAX_LENGTH)
+        self.key_normalizer = normalize_keys or None
+        try:
+            import pylibmc
+        except ImportError:  # pragma: no cover
+            pylibmc = None
         if client is None:
-            try:
-                import pylibmc
-            except ImportError:  # pragma: no cover
+            if pylibmc is None:  # pragma: no cover
                 raise ModuleNotFoundError("no memcached module found")
             self._client = pylibmc.Client(
                 ["{}:{}".format(*server) for server in servers],
-                behaviors={"no_block": True, "tcp_nodelay": True},
+                behaviors={"no_block": True, "tcp_nodelay": True, "cas": True},
             )
         else:
             self._client = client
+        # the errors of pylibmc `incr`, the other clients return ``None``.
+        self._not_found_errors = (pylibmc.NotFound,) if pylibmc else ()
+        self._client_errors = (pylibmc.ClientError,) if pylibmc else ()
 
     def _normalize_ttl(self, ttl):
         ttl = super(MemcachedBackend, self)._normalize_ttl(ttl)
@@ -388,55 +962,2727 @@ class MemcachedBackend(BaseBackend):
             return int(time.time()) + ttl
         return ttl
 
+    def _key(self, key):
+        """Returns the key stored in memcached, ``None`` for invalid keys."""
+        if self.key_normalizer is not None:
+            return self.key_normalizer(key)
+        if len(key.encode("utf-8")) > self.KEY_MAX_LENGTH:
+            return None
+        return key
+
     def set(self, key, value, ttl=None):
-        if self._key_invalid(key):
+        if self._chunker.oversized(value):
+            return self.set_many({key: value}, ttl)[key]
+        key = self._key(key)
+        if key is None:
             return False
         ttl = self._normalize_ttl(ttl)
         return self._client.set(key, value, ttl)
 
     def replace(self, key, value, ttl=None):
-        if self._key_invalid(key):
+        if self._chunker.oversized(value):
+            return self.replace_many({key: value}, ttl)[key]
+        key = self._key(key)
+        if key is None:
             return False
         ttl = self._normalize_ttl(ttl)
         return self._client.replace(key, value, ttl)
 
+    def add(self, key, value, ttl=None):
+        if self._chunker.oversized(value):
+            return self.add_many({key: value}, ttl)[key]
+        key = self._key(key)
+        if key is None:
+            return False
+        ttl = self._normalize_ttl(ttl)
+        return self._client.add(key, value, ttl)
+
     def get(self, key):
-        if self._key_invalid(key):
+        stored_key = self._key(key)
+        if stored_key is None:
             return None
-        return to_bytes(self._client.get(key))
+        value = to_bytes(self._client.get(stored_key))
+        return self._chunker.read({key: value}, self._get_dict)[key]
 
     def delete(self, key):
-        if self._key_invalid(key):
+        key = self._key(key)
+        if key is None:
             return False
         return self._client.delete(key)
 
     def set_many(self, mapping, ttl=None):
-        valid_mapping = {k: v for k, v in mapping.items() if not self._key_invalid(k)}
+        return self._chunker.write(mapping, ttl, self._set_many, self._set_many)
+
+    def add_many(self, mapping, ttl=None):
+        return self._chunker.write(mapping, ttl, self._add_many, self._set_many)
+
+    def replace_many(self, mapping, ttl=None):
+        return self._chunker.write(mapping, ttl, self._replace_many, self._set_many)
+
+    def _store_many(self, mapping, ttl, store_multi):
+        keys = {k: self._key(k) for k in mapping}
+        valid_mapping = {sk: mapping[k] for k, sk in keys.items() if sk is not None}
         failed_keys = []
         if valid_mapping:
-            ttl = self._normalize_ttl(ttl)
-            failed_keys = self._client.set_multi(valid_mapping, ttl)
-        return {k: k in valid_mapping and k not in failed_keys for k in mapping}
+            failed_keys = store_multi(valid_mapping, self._normalize_ttl(ttl))
+        return {k: sk is not None and sk not in failed_keys for k, sk in keys.items()}
+
+    def _set_many(self, mapping, ttl):
+        return self._store_many(mapping, ttl, self._client.set_multi)
+
+    def _add_many(self, mapping, ttl):
+        return self._store_many(mapping, ttl, self._client.add_multi)
+
+    def _replace_many(self, mapping, ttl):
+        # pylibmc has no `replace_multi`, see `PipelinedMemcachedBackend`.
+        def replace_multi(valid_mapping, ttl):
+            return [
+                k
+                for k, v in valid_mapping.items()
+                if not self._client.replace(k, v, ttl)
+            ]
+
+        return self._store_many(mapping, ttl, replace_multi)
 
     def get_many(self, *keys):
         mapping = self.get_dict(*keys)
         return [mapping[key] for key in keys]
 
     def get_dict(self, *keys):
-        valid_keys = [k for k in keys if not self._key_invalid(k)]
-        mapping = self._client.get_multi(valid_keys)
-        return {key: to_bytes(mapping.get(key, None)) for key in keys}
+        return self._chunker.read(self._get_dict(*keys), self._get_dict)
+
+    def _get_dict(self, *keys):
+        keys = {k: self._key(k) for k in keys}
+        valid_keys = [sk for sk in keys.values() if sk is not None]
+        mapping = self._client.get_multi(valid_keys) if valid_keys else {}
+        return {k: to_bytes(mapping.get(sk)) for k, sk in keys.items()}
 
     def delete_many(self, *keys):
-        valid_keys = [k for k in keys if not self._key_invalid(k)]
+        valid_keys = [sk for sk in map(self._key, keys) if sk is not None]
         rv = self._client.delete_multi(valid_keys)
         return len(valid_keys) == len(keys) and rv
 
     def has(self, key):
-        if self._key_invalid(key):
+        return self.has_many(key)[key]
+
+    def has_many(self, *keys):
+        keys = {k: self._key(k) for k in keys}
+        valid_keys = [sk for sk in keys.values() if sk is not None]
+        mapping = self._client.get_multi(valid_keys) if valid_keys else {}
+        return {k: sk in mapping for k, sk in keys.items()}
+
+    def incr(self, key, delta=1, ttl=None):
+        if delta < 0:
+            return self.decr(key, -delta, ttl)
+        stored_key = self._key(key)
+        if stored_key is None:
+            return None
+        ttl = self._normalize_ttl(ttl)
+        while True:
+            try:
+                value = self._client.incr(stored_key, delta)
+            except self._not_found_errors:
+                value = None
+            except self._client_errors:
+                # the value is negative, memcached can't increment it.
+                return self._cas_update(key, stored_key, delta, ttl)
+            if value is None:
+                if self._client.add(stored_key, delta, ttl):
+                    return delta
+                continue
+            # memcached `incr` doesn't refresh the ttl.
+            self._client.touch(stored_key, ttl)
+            return value
+
+    def decr(self, key, delta=1, ttl=None):
+        stored_key = self._key(key)
+        if stored_key is None:
+            return None
+        # memcached `decr` never goes below 0.
+        return self._cas_update(key, stored_key, -delta, self._normalize_ttl(ttl))
+
+    def _cas_update(self, key, stored_key, delta, ttl):
+        while True:
+            try:
+                value, cas = self._client.gets(stored_key)
+            except ValueError:
+                # gets without cas behavior
+                return super(MemcachedBackend, self).incr(key, delta, ttl)
+            if value is None:
+                if self._client.add(stored_key, delta, ttl):
+                    return delta
+                continue
+            value = int(value) + delta
+            if self._client.cas(stored_key, value, cas, ttl):
+                return value
+
+
+class FileSystemBackend(BaseBackend):
+    """A cache that stores the items on the file system, survives the
+    restarts of the processes, and can be shared by the processes of a host.
+
+    Every key is stored in its own file, named by the md5 of the key, under
+    a two levels hashed directory fan-out, such as ``<cache_dir>/ac/bd/acbd...``.
+    A file starts with a fixed header holding the expiration time, so that an
+    expired item is rejected without reading the value. Files are written to
+    a temporary file and then renamed, so a reader never sees a partial value.
+
+    When `max_bytes` is set, the cleaner removes the expired files and then
+    the least recently written ones, until the total size of the files drops
+    below 80% of `max_bytes`. It runs whenever the size written since its last
+    run may exceed the limit, or explicitly through :meth:`cleanup`.
+
+    Note that `incr`, `decr`, `replace` and `add` are only atomic among the
+    threads of one process.
+
+    :param cache_dir: the directory where the cache files are stored.
+    :param max_bytes: the maximum total size of the cache files,
+                      ``None`` means unlimited.
+    :param default_ttl: the default ttl that is used if no ttl is
+                        specified on :meth:`~BaseBackend.set`. A ttl of
+                        0 indicates that the cache never expires.
+    :param mode: the file mode wanted for the cache files.
+    """
+
+    HEADER = struct.Struct("!d")
+    TMP_SUFFIX = ".__tmp"
+    CLEANUP_LOW_WATERMARK = 0.8
+
+    def __init__(self, cache_dir, max_bytes=None, default_ttl=300, mode=0o600):
+        super(FileSystemBackend, self).__init__(default_ttl)
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._mode = mode
+        self._known_dirs = set()
+        self._lock = threading.Lock()
+        # the estimated total size of the cache files, `None` before the
+        # first scan of the cache directory.
+        self._approx_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _normalize_ttl(self, ttl):
+        ttl = super(FileSystemBackend, self)._normalize_ttl(ttl)
+        return time.time() + ttl if ttl > 0 else 0
+
+    def _get_filename(self, key):
+        digest = hashlib.md5(key.encode("utf-8")).hexdigest()
+        return os.path.join(self._cache_dir, digest[:2], digest[2:4], digest)
+
+    @staticmethod
+    def _expired(expireat, now):
+        return expireat != 0 and expireat <= now
+
+    def _read(self, filename, now, header_only=False):
+        try:
+            with open(filename, "rb") as f:
+                (expireat,) = self.HEADER.unpack(f.read(self.HEADER.size))
+                if self._expired(expireat, now):
+                    return None
+                return True if header_only else f.read()
+        except (OSError, struct.error):
+            return None
+
+    def _write(self, filename, value, expireat):
+        fd, tmp = tempfile.mkstemp(suffix=self.TMP_SUFFIX, dir=self._cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.HEADER.pack(expireat))
+                f.write(value)
+            os.chmod(tmp, self._mode)
+            dirname = os.path.dirname(filename)
+            if dirname not in self._known_dirs:
+                os.makedirs(dirname, exist_ok=True)
+                self._known_dirs.add(dirname)
+            try:
+                os.replace(tmp, filename)
+            except FileNotFoundError:
+                # the directory has been removed by others.
+                os.makedirs(dirname, exist_ok=True)
+                os.replace(tmp, filename)
+            return True
+        except OSError:
+            self._remove_file(tmp)
+            return False
+
+    @staticmethod
+    def _file_size(filename):
+        try:
+            return os.stat(filename).st_size
+        except OSError:
+            return 0
+
+    def _set_many(self, mapping, ttl):
+        expireat = self._normalize_ttl(ttl)
+        rv, written = {}, 0
+        for key, value in mapping.items():
+            value = to_bytes(value)
+            filename = self._get_filename(key)
+            # an overwrite only grows the cache by the difference of sizes.
+            replaced = 0 if self._max_bytes is None else self._file_size(filename)
+            rv[key] = self._write(filename, value, expireat)
+            if rv[key]:
+                written += self.HEADER.size + len(value) - replaced
+        self._maybe_cleanup(written)
+        return rv
+
+    def set(self, key, value, ttl=None):
+        return self._set_many({key: value}, ttl)[key]
+
+    def set_many(self, mapping, ttl=None):
+        return self._set_many(mapping, ttl)
+
+    def replace(self, key, value, ttl=None):
+        with self._lock:
+            return self.has(key) and self.set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            return not self.has(key) and self.set(key, value, ttl)
+
+    def get(self, key):
+        return self._read(self._get_filename(key), time.time())
+
+    def get_many(self, *keys):
+        now = time.time()
+        return [self._read(self._get_filename(key), now) for key in keys]
+
+    def delete(self, key):
+        filename = self._get_filename(key)
+        existed = self._read(filename, time.time(), header_only=True) is not None
+        return self._remove_file(filename) and existed
+
+    def delete_many(self, *keys):
+        deleted = True
+        for key in keys:
+            deleted = self.delete(key) and deleted
+        return deleted
+
+    def has(self, key):
+        filename = self._get_filename(key)
+        return self._read(filename, time.time(), header_only=True) is not None
+
+    def incr(self, key, delta=1, ttl=None):
+        with self._lock:
+            return super(FileSystemBackend, self).incr(key, delta, ttl)
+
+    def decr(self, key, delta=1, ttl=None):
+        with self._lock:
+            return super(FileSystemBackend, self).decr(key, delta, ttl)
+
+    def _list_files(self):
+        for dirpath, _, filenames in os.walk(self._cache_dir):
+            for filename in filenames:
+                if not filename.endswith(self.TMP_SUFFIX):
+                    yield os.path.join(dirpath, filename)
+
+    def _maybe_cleanup(self, written):
+        if self._max_bytes is None:
+            return
+        if self._approx_bytes is not None:
+            self._approx_bytes += written
+            if self._approx_bytes <= self._max_bytes:
+                return
+        self.cleanup()
+
+    def cleanup(self):
+        """Removes the expired files, then removes the least recently written
+        files if the total size still exceeds `max_bytes`.
+
+        :returns: the number of removed files.
+        """
+        now = time.time()
+        removed, total, alive = 0, 0, []
+        for filename in self._list_files():
+            try:
+                stat = os.stat(filename)
+                with open(filename, "rb") as f:
+                    (expireat,) = self.HEADER.unpack(f.read(self.HEADER.size))
+            except (OSError, struct.error):
+                continue
+            if self._expired(expireat, now):
+                removed += self._remove_file(filename)
+            else:
+                total += stat.st_size
+                alive.append((stat.st_mtime, stat.st_size, filename))
+        if self._max_bytes is not None and total > self._max_bytes:
+            low_watermark = self._max_bytes * self.CLEANUP_LOW_WATERMARK
+            alive.sort()
+            for _, size, filename in alive:
+                if total <= low_watermark:
+                    break
+                if self._remove_file(filename):
+                    removed += 1
+                    total -= size
+        self._approx_bytes = total
+        return removed
+
+    @staticmethod
+    def _remove_file(filename):
+        try:
+            os.remove(filename)
+        except OSError:
             return False
-        return self._client.append(key, b"")
+        return True
+
+
+class SharedMemoryBackend(BaseBackend):
+    """A cache shared by all the processes of a host, stored in a memory
+    mapped file, such as a file under ``/dev/shm``.  Pre-forked workers
+    using the same `path` share one cache instead of holding a copy each.
+
+    The file holds an open addressing hash table (linear probing with
+    backward shift deletion) and a slab area of fixed size chunks, the key
+    and the value of an item are stored in a chain of chunks.  Writers are
+    serialized by a lock on the file, readers take no lock, they retry when
+    the sequence number of the table (a seqlock) changed during the read.
+    When the table or the slab area is full, the items under a sweeping
+    hand are evicted, expired ones first.
+
+    The geometry is decided by the process which creates the file,
+    the other processes use the one stored in the file.  Only available
+    on the platforms that support :mod:`fcntl`.
+
+    :param path: the path of the memory mapped file.
+    :param capacity: the maximum number of items.
+    :param max_bytes: the size of the slab area, which stores the keys
+                      and the values.
+    :param chunk_size: the size of a slab chunk.
+    :param default_ttl: the default ttl that is used if no ttl is
+                        specified on :meth:`~BaseBackend.set`. A ttl of
+                        0 indicates that the cache never expires.
+    """
+
+    MAGIC = b"COSM"
+    VERSION = 1
+    # magic, version, slots, capacity, chunk size, chunks,
+    # seq, count, used chunks, bump, free head, hand
+    HEADER = struct.Struct("<4sIIIIIQIIIII")
+    SEQ = struct.Struct("<Q")
+    U32 = struct.Struct("<I")
+    SEQ_OFFSET = 24
+    COUNT_OFFSET = 32
+    USED_CHUNKS_OFFSET = 36
+    BUMP_OFFSET = 40
+    FREE_HEAD_OFFSET = 44
+    HAND_OFFSET = 48
+    # hash, expireat, head chunk, key length, value length, used
+    SLOT = struct.Struct("<QdIIIB3x")
+    NEXT = struct.Struct("<I")
+    END = 0xFFFFFFFF
+    SWEEP_LIMIT = 16
+    READ_RETRIES = 100
+
+    def __init__(
+        self,
+        path,
+        capacity=4096,
+        max_bytes=4 << 20,
+        chunk_size=128,
+        default_ttl=300,
+    ):
+        super(SharedMemoryBackend, self).__init__(default_ttl)
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover
+            raise ModuleNotFoundError("no fcntl module found")
+        if capacity < 1 or chunk_size <= self.NEXT.size or max_bytes < chunk_size:
+            raise ValueError("invalid shared memory geometry")
+        self._fcntl = fcntl
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                slots = 1 << math.ceil(math.log2(capacity * 4 / 3 + 1))
+                chunks = max_bytes // chunk_size
+                header = (self.MAGIC, self.VERSION, slots, capacity, chunk_size)
+                header += (chunks, 0, 0, 0, 0, self.END, 0)
+                os.ftruncate(self._fd, self._layout(slots, chunk_size, chunks))
+                self._mm = mmap.mmap(self._fd, 0)
+                self.HEADER.pack_into(self._mm, 0, *header)
+            else:
+                self._mm = mmap.mmap(self._fd, 0)
+                header = self.HEADER.unpack_from(self._mm, 0)
+                if header[:2] != (self.MAGIC, self.VERSION):
+                    raise ValueError("%s is not a shared memory cache file" % path)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        _, _, self._slots, self._capacity, self._chunk_size, self._chunks = header[:6]
+        self._slots_offset = self.HEADER.size
+        self._chunks_offset = self.HEADER.size + self._slots * self.SLOT.size
+
+    @classmethod
+    def _layout(cls, slots, chunk_size, chunks):
+        return cls.HEADER.size + slots * cls.SLOT.size + chunks * chunk_size
+
+    def close(self):
+        """Unmaps and closes the shared memory file."""
+        self._mm.close()
+        os.close(self._fd)
+
+    def _normalize_ttl(self, ttl):
+        ttl = super(SharedMemoryBackend, self)._normalize_ttl(ttl)
+        return time.time() + ttl if ttl > 0 else 0
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return int.from_bytes(digest, "little")
 
     @staticmethod
-    def _key_invalid(key):
-        return len(key) > MemcachedBackend.KEY_MAX_LENGTH
+    def _expired(expireat, now):
+        return expireat != 0 and expireat <= now
+
+    def _get_u32(self, offset):
+        return self.U32.unpack_from(self._mm, offset)[0]
+
+    def _set_u32(self, offset, value):
+        self.U32.pack_into(self._mm, offset, value)
+
+    def _get_seq(self):
+        return self.SEQ.unpack_from(self._mm, self.SEQ_OFFSET)[0]
+
+    def _read_slot(self, i):
+        return self.SLOT.unpack_from(self._mm, self._slots_offset + i * self.SLOT.size)
+
+    def _write_slot(self, i, slot):
+        self.SLOT.pack_into(self._mm, self._slots_offset + i * self.SLOT.size, *slot)
+
+    def _clear_slot(self, i):
+        self._write_slot(i, (0, 0, 0, 0, 0, 0))
+
+    def _chunk_offset(self, chunk):
+        return self._chunks_offset + chunk * self._chunk_size
+
+    def _chunks_needed(self, size):
+        return max(math.ceil(size / (self._chunk_size - self.NEXT.size)), 1)
+
+    def _read_data(self, head, size):
+        mm, parts, chunk = self._mm, [], head
+        for _ in range(self._chunks_needed(size)):
+            offset = self._chunk_offset(chunk)
+            (chunk,) = self.NEXT.unpack_from(mm, offset)
+            parts.append(mm[offset + self.NEXT.size : offset + self._chunk_size])
+        return b"".join(parts)[:size]
+
+    def _alloc(self, data):
+        """Writes `data` into a chain of free chunks, returns the head chunk."""
+        chunks = []
+        free_head = self._get_u32(self.FREE_HEAD_OFFSET)
+        bump = self._get_u32(self.BUMP_OFFSET)
+        for _ in range(self._chunks_needed(len(data))):
+            if free_head != self.END:
+                chunks.append(free_head)
+                (free_head,) = self.NEXT.unpack_from(
+                    self._mm, self._chunk_offset(free_head)
+                )
+            else:
+                chunks.append(bump)
+                bump += 1
+        self._set_u32(self.FREE_HEAD_OFFSET, free_head)
+        self._set_u32(self.BUMP_OFFSET, bump)
+        used_chunks = self._get_u32(self.USED_CHUNKS_OFFSET) + len(chunks)
+        self._set_u32(self.USED_CHUNKS_OFFSET, used_chunks)
+        payload = self._chunk_size - self.NEXT.size
+        for n, chunk in enumerate(chunks):
+            offset = self._chunk_offset(chunk)
+            nxt = chunks[n + 1] if n + 1 < len(chunks) else self.END
+            self.NEXT.pack_into(self._mm, offset, nxt)
+            piece = data[n * payload : (n + 1) * payload]
+            start = offset + self.NEXT.size
+            self._mm[start : start + len(piece)] = piece
+        return chunks[0]
+
+    def _free(self, head, size):
+        chunk, count = head, self._chunks_needed(size)
+        for _ in range(count - 1):
+            (chunk,) = self.NEXT.unpack_from(self._mm, self._chunk_offset(chunk))
+        self.NEXT.pack_into(
+            self._mm, self._chunk_offset(chunk), self._get_u32(self.FREE_HEAD_OFFSET)
+        )
+        self._set_u32(self.FREE_HEAD_OFFSET, head)
+        used_chunks = self._get_u32(self.USED_CHUNKS_OFFSET) - count
+        self._set_u32(self.USED_CHUNKS_OFFSET, used_chunks)
+
+    def _find(self, key, h):
+        """Returns the slot index of the key and the slot, or the empty slot
+        index where the key could be placed and ``None``."""
+        mask = self._slots - 1
+        i = h & mask
+        for _ in range(self._slots):
+            slot = self._read_slot(i)
+            if not slot[5]:
+                return i, None
+            if slot[0] == h and slot[3] == len(key):
+                if self._read_data(slot[2], slot[3]) == key:
+                    return i, slot
+            i = (i + 1) & mask
+        return None, None  # pragma: no cover
+
+    def _remove_at(self, i, slot):
+        self._free(slot[2], slot[3] + slot[4])
+        self._set_u32(self.COUNT_OFFSET, self._get_u32(self.COUNT_OFFSET) - 1)
+        # backward shift deletion, keeps the probe sequences intact.
+        mask = self._slots - 1
+        j = i
+        while True:
+            j = (j + 1) & mask
+            moved = self._read_slot(j)
+            if not moved[5]:
+                break
+            home = moved[0] & mask
+            if (i <= j and i < home <= j) or (i > j and (home > i or home <= j)):
+                continue
+            self._write_slot(i, moved)
+            i = j
+        self._clear_slot(i)
+
+    def _evict(self, now):
+        mask = self._slots - 1
+        hand = self._get_u32(self.HAND_OFFSET)
+        victim, scanned = None, 0
+        for _ in range(self._slots):
+            slot = self._read_slot(hand)
+            if slot[5]:
+                if victim is None or self._expired(slot[1], now):
+                    victim = (hand, slot)
+                scanned += 1
+                if self._expired(slot[1], now) or scanned >= self.SWEEP_LIMIT:
+                    break
+            hand = (hand + 1) & mask
+        self._set_u32(self.HAND_OFFSET, hand)
+        self._remove_at(*victim)
+
+    @contextmanager
+    def _write_lock(self):
+        if os.getpid() != self._pid:
+            # the lock may be held by a thread which does not exist after fork.
+            self._pid, self._lock = os.getpid(), threading.Lock()
+        with self._lock:
+            self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX)
+            # an odd sequence number left by a crashed writer is fixed here.
+            seq = self._get_seq() & ~1
+            self.SEQ.pack_into(self._mm, self.SEQ_OFFSET, seq + 1)
+            try:
+                yield
+            finally:
+                self.SEQ.pack_into(self._mm, self.SEQ_OFFSET, seq + 2)
+                self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN)
+
+    def _lookup(self, key, now, with_value=True):
+        key = key.encode("utf-8")
+        _, slot = self._find(key, self._hash(key))
+        if slot is None or self._expired(slot[1], now):
+            return None
+        if not with_value:
+            return True
+        return self._read_data(slot[2], slot[3] + slot[4])[slot[3] :]
+
+    def _read(self, key, now, with_value=True):
+        for _ in range(self.READ_RETRIES):
+            seq = self._get_seq()
+            if seq & 1:
+                time.sleep(0)
+                continue
+            try:
+                rv = self._lookup(key, now, with_value)
+            except (struct.error, IndexError):
+                # read a half-written table.
+                rv = None
+            if seq == self._get_seq():
+                return rv
+        # too many writes in progress, or a writer crashed.
+        with self._write_lock():
+            return self._lookup(key, now, with_value)
+
+    def _set(self, key, value, expireat, now, only_exists=False, only_absent=False):
+        key, value = key.encode("utf-8"), to_bytes(value)
+        data = key + value
+        if self._chunks_needed(len(data)) > self._chunks:
+            return False
+        h = self._hash(key)
+        i, slot = self._find(key, h)
+        if slot is not None:
+            if only_absent and not self._expired(slot[1], now):
+                return False
+            self._remove_at(i, slot)
+            if only_exists and self._expired(slot[1], now):
+                return False
+        elif only_exists:
+            return False
+        while (
+            self._get_u32(self.COUNT_OFFSET) >= self._capacity
+            or self._get_u32(self.USED_CHUNKS_OFFSET) + self._chunks_needed(len(data))
+            > self._chunks
+        ):
+            self._evict(now)
+        # the slots may have been shifted by the removals.
+        i, _ = self._find(key, h)
+        self._write_slot(i, (h, expireat, self._alloc(data), len(key), len(value), 1))
+        self._set_u32(self.COUNT_OFFSET, self._get_u32(self.COUNT_OFFSET) + 1)
+        return True
+
+    def set(self, key, value, ttl=None):
+        return self.set_many({key: value}, ttl)[key]
+
+    def set_many(self, mapping, ttl=None):
+        expireat, now = self._normalize_ttl(ttl), time.time()
+        with self._write_lock():
+            return {k: self._set(k, v, expireat, now) for k, v in mapping.items()}
+
+    def replace(self, key, value, ttl=None):
+        return self.replace_many({key: value}, ttl)[key]
+
+    def replace_many(self, mapping, ttl=None):
+        expireat, now = self._normalize_ttl(ttl), time.time()
+        with self._write_lock():
+            return {
+                k: self._set(k, v, expireat, now, only_exists=True)
+                for k, v in mapping.items()
+            }
+
+    def add(self, key, value, ttl=None):
+        return self.add_many({key: value}, ttl)[key]
+
+    def add_many(self, mapping, ttl=None):
+        expireat, now = self._normalize_ttl(ttl), time.time()
+        with self._write_lock():
+            return {
+                k: self._set(k, v, expireat, now, only_absent=True)
+                for k, v in mapping.items()
+            }
+
+    def get(self, key):
+        return self._read(key, time.time())
+
+    def get_many(self, *keys):
+        now = time.time()
+        return [self._read(key, now) for key in keys]
+
+    def _delete(self, key, now):
+        key = key.encode("utf-8")
+        i, slot = self._find(key, self._hash(key))
+        if slot is None:
+            return False
+        self._remove_at(i, slot)
+        return not self._expired(slot[1], now)
+
+    def delete(self, key):
+        return self.delete_many(key)
+
+    def delete_many(self, *keys):
+        now = time.time()
+        with self._write_lock():
+            deleted = True
+            for key in keys:
+                deleted = self._delete(key, now) and deleted
+            return deleted
+
+    def has(self, key):
+        return self._read(key, time.time(), with_value=False) is not None
+
+    def incr(self, key, delta=1, ttl=None):
+        expireat, now = self._normalize_ttl(ttl), time.time()
+        with self._write_lock():
+            value = int(self._lookup(key, now) or 0) + delta
+            return value if self._set(key, value, expireat, now) else None
+
+    def decr(self, key, delta=1, ttl=None):
+        return self.incr(key, -delta, ttl)
+
+
+class SQLiteBackend(BaseBackend):
+    """A durable local cache stored in a SQLite database, which needs no
+    running server and handles millions of keys.
+
+    The items are stored in one table, keyed by the primary key index, with
+    their expiration time.  The database runs in WAL mode, so that readers
+    never block the writer. Every batch operation is one statement or one
+    transaction. Each thread (and process) uses its own connection.
+
+    Expired items are not removed until they are overwritten or
+    :meth:`cleanup` is called.
+
+    :param path: the path of the database file.
+    :param table: the name of the table the items are stored in.
+    :param default_ttl: the default ttl that is used if no ttl is
+                        specified on :meth:`~BaseBackend.set`. A ttl of
+                        0 indicates that the cache never expires.
+
+    Any additional keyword arguments will be passed to :func:`sqlite3.connect`.
+    """
+
+    # keeps below the default SQLITE_MAX_VARIABLE_NUMBER of old versions.
+    MAX_VARIABLES = 900
+
+    def __init__(self, path, table="cacheorm", default_ttl=600, **kwargs):
+        super(SQLiteBackend, self).__init__(default_ttl)
+        if not table.isidentifier():
+            raise ValueError("invalid table name %r" % table)
+        self._path = path
+        self._table = table
+        self._connect_kwargs = kwargs
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, "
+                "value BLOB NOT NULL, expireat REAL NOT NULL) WITHOUT ROWID" % table
+            )
+
+    def _get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self._path,
+                isolation_level=None,
+                check_same_thread=False,
+                **self._connect_kwargs
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _normalize_ttl(self, ttl):
+        ttl = super(SQLiteBackend, self)._normalize_ttl(ttl)
+        return time.time() + ttl if ttl > 0 else 0
+
+    def _chunked(self, keys):
+        for i in range(0, len(keys), self.MAX_VARIABLES):
+            chunk = keys[i : i + self.MAX_VARIABLES]
+            yield chunk, ",".join("?" * len(chunk))
+
+    def set(self, key, value, ttl=None):
+        self._get_connection().execute(
+            "INSERT OR REPLACE INTO %s VALUES (?, ?, ?)" % self._table,
+            (key, to_bytes(value), self._normalize_ttl(ttl)),
+        )
+        return True
+
+    def set_many(self, mapping, ttl=None):
+        expireat = self._normalize_ttl(ttl)
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO %s VALUES (?, ?, ?)" % self._table,
+                [(k, to_bytes(v), expireat) for k, v in mapping.items()],
+            )
+        return {k: True for k in mapping}
+
+    def replace(self, key, value, ttl=None):
+        return self.replace_many({key: value}, ttl)[key]
+
+    def replace_many(self, mapping, ttl=None):
+        expireat, now = self._normalize_ttl(ttl), time.time()
+        sql = (
+            "UPDATE %s SET value = ?, expireat = ? "
+            "WHERE key = ? AND (expireat = 0 OR expireat > ?)" % self._table
+        )
+        with self._transaction() as conn:
+            return {
+                k: conn.execute(sql, (to_bytes(v), expireat, k, now)).rowcount == 1
+                for k, v in mapping.items()
+            }
+
+    def add(self, key, value, ttl=None):
+        return self.add_many({key: value}, ttl)[key]
+
+    def add_many(self, mapping, ttl=None):
+        expireat, now, rv = self._normalize_ttl(ttl), time.time(), {}
+        with self._transaction() as conn:
+            keys = list(mapping)
+            for chunk, placeholders in self._chunked(keys):
+                # the expired ones do not count as existing.
+                conn.execute(
+                    "DELETE FROM %s WHERE key IN (%s) "
+                    "AND expireat != 0 AND expireat <= ?" % (self._table, placeholders),
+                    (*chunk, now),
+                )
+            sql = "INSERT OR IGNORE INTO %s VALUES (?, ?, ?)" % self._table
+            for key in keys:
+                rv[key] = (
+                    conn.execute(sql, (key, to_bytes(mapping[key]), expireat)).rowcount
+                    == 1
+                )
+        return rv
+
+    def get(self, key):
+        row = (
+            self._get_connection()
+            .execute(
+                "SELECT value FROM %s WHERE key = ? AND (expireat = 0 OR expireat > ?)"
+                % self._table,
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+    def get_many(self, *keys):
+        mapping = self.get_dict(*keys)
+        return [mapping[key] for key in keys]
+
+    def get_dict(self, *keys):
+        conn, now, rv = self._get_connection(), time.time(), dict.fromkeys(keys)
+        for chunk, placeholders in self._chunked(keys):
+            rv.update(
+                conn.execute(
+                    "SELECT key, value FROM %s WHERE key IN (%s) "
+                    "AND (expireat = 0 OR expireat > ?)" % (self._table, placeholders),
+                    (*chunk, now),
+                )
+            )
+        return rv
+
+    def delete(self, key):
+        return self.delete_many(key)
+
+    def delete_many(self, *keys):
+        keys = tuple(dict.fromkeys(keys))
+        now, deleted = time.time(), 0
+        with self._transaction() as conn:
+            for chunk, placeholders in self._chunked(keys):
+                deleted += conn.execute(
+                    "DELETE FROM %s WHERE key IN (%s) "
+                    "AND (expireat = 0 OR expireat > ?)" % (self._table, placeholders),
+                    (*chunk, now),
+                ).rowcount
+                # the expired ones do not count as deleted.
+                conn.execute(
+                    "DELETE FROM %s WHERE key IN (%s)" % (self._table, placeholders),
+                    chunk,
+                )
+        return deleted == len(keys)
+
+    def has(self, key):
+        return (
+            self._get_connection()
+            .execute(
+                "SELECT 1 FROM %s WHERE key = ? AND (expireat = 0 OR expireat > ?)"
+                % self._table,
+                (key, time.time()),
+            )
+            .fetchone()
+            is not None
+        )
+
+    def incr(self, key, delta=1, ttl=None):
+        expireat = self._normalize_ttl(ttl)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM %s WHERE key = ? AND (expireat = 0 OR expireat > ?)"
+                % self._table,
+                (key, time.time()),
+            ).fetchone()
+            value = int(row[0] if row is not None else 0) + delta
+            conn.execute(
+                "INSERT OR REPLACE INTO %s VALUES (?, ?, ?)" % self._table,
+                (key, to_bytes(value), expireat),
+            )
+            return value
+
+    def decr(self, key, delta=1, ttl=None):
+        return self.incr(key, -delta, ttl)
+
+    def cleanup(self):
+        """Removes the expired items.
+
+        :returns: the number of removed items.
+        """
+        return (
+            self._get_connection()
+            .execute(
+                "DELETE FROM %s WHERE expireat != 0 AND expireat <= ?" % self._table,
+                (time.time(),),
+            )
+            .rowcount
+        )
+
+
+class BaseInvalidationChannel(object):  # pragma: no cover
+    """Base class for the channels that broadcast the invalidated keys among
+    the :class:`TieredBackend` of different processes.
+    """
+
+    def publish(self, origin, keys):
+        """Broadcasts that `keys` have been changed by `origin`.
+
+        :param origin: the unique id of the publisher.
+        :param keys: a list of the changed keys.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, callback):
+        """Registers `callback(origin, keys)`, called for every message."""
+        raise NotImplementedError
+
+
+class LocalInvalidationChannel(BaseInvalidationChannel):
+    """Broadcasts the messages to the subscribers of the same process,
+    mainly for the tests and the single process environments.
+    """
+
+    def __init__(self):
+        self._callbacks = []
+
+    def publish(self, origin, keys):
+        for callback in self._callbacks:
+            callback(origin, keys)
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+
+
+class RedisInvalidationChannel(BaseInvalidationChannel):
+    """Broadcasts the messages through the Redis pub/sub, the messages are
+    received by a daemon thread which is started on the first subscription.
+
+    :param client: an object resembling an instance of a redis.Redis class.
+    :param channel: the name of the pub/sub channel.
+    """
+
+    def __init__(self, client, channel="cacheorm:invalidation"):
+        self._client = client
+        self._channel = channel
+        self._callbacks = []
+        self._thread = None
+
+    def publish(self, origin, keys):
+        message = json.dumps({"origin": origin, "keys": list(keys)})
+        self._client.publish(self._channel, message)
+
+    def _on_message(self, message):
+        data = json.loads(message["data"])
+        for callback in self._callbacks:
+            callback(data["origin"], data["keys"])
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+        if self._thread is None:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self._channel: self._on_message})
+            self._thread = pubsub.run_in_thread(sleep_time=0.01, daemon=True)
+
+    def close(self):
+        """Stops receiving the messages."""
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+
+
+class TieredBackend(BaseBackend):
+    """An in-process L1 backend in front of a remote L2 backend.
+
+    Reads check L1 first, the L1 misses are fetched from L2 with one
+    :meth:`~BaseBackend.get_many` and populate L1.  Writes and deletes go
+    through to L2 and invalidate L1, the invalidated keys are also published
+    to `channel`, so that the L1 of the peer processes are invalidated.
+    The values of `set` and `set_many` are also written to L1, with their
+    ttl capped to `l1_ttl`, so that L1 never outlives L2.
+
+    The remaining ttl of the items read from L2 is unknown, they populate L1
+    for `l1_ttl` capped to the default ttl of L2, for which they may outlive
+    L2, or be stale if a peer's invalidation is lost.
+
+    :param l1: the local backend, such as a :class:`SimpleBackend`.
+    :param l2: the remote backend, such as a :class:`RedisBackend`.
+    :param channel: an instance of :class:`BaseInvalidationChannel`,
+                    ``None`` if no peer needs to be invalidated.
+    :param l1_ttl: the maximum ttl of the L1 items, ``None`` caches in L1
+                   only the items written through this backend.
+    """
+
+    def __init__(self, l1, l2, channel=None, l1_ttl=60):
+        super(TieredBackend, self).__init__(l2.default_ttl)
+        self.l1 = l1
+        self.l2 = l2
+        self._channel = channel
+        self._l1_ttl = l1_ttl
+        self._origin = uuid.uuid4().hex
+        if channel is not None:
+            channel.subscribe(self._on_invalidate)
+
+    def _on_invalidate(self, origin, keys):
+        if origin != self._origin:
+            self.l1.delete_many(*keys)
+
+    def _invalidate(self, keys):
+        self.l1.delete_many(*keys)
+        if self._channel is not None:
+            self._channel.publish(self._origin, keys)
+
+    def _l1_ttl_of(self, ttl):
+        """Returns the ttl of an L1 item written with `ttl`, 0 never expires."""
+        if ttl is None:
+            ttl = self.default_ttl
+        if not self._l1_ttl:
+            return ttl
+        if not ttl:
+            return self._l1_ttl
+        return min(ttl, self._l1_ttl)
+
+    def set(self, key, value, ttl=None):
+        return self.set_many({key: value}, ttl)[key]
+
+    def set_many(self, mapping, ttl=None):
+        rv = self.l2.set_many(mapping, ttl)
+        self._invalidate(list(mapping))
+        written = {k: v for k, v in mapping.items() if rv.get(k)}
+        if written:
+            self.l1.set_many(written, self._l1_ttl_of(ttl))
+        return rv
+
+    def replace(self, key, value, ttl=None):
+        rv = self.l2.replace(key, value, ttl)
+        self._invalidate([key])
+        return rv
+
+    def replace_many(self, mapping, ttl=None):
+        rv = self.l2.replace_many(mapping, ttl)
+        self._invalidate(list(mapping))
+        return rv
+
+    def add(self, key, value, ttl=None):
+        return self.add_many({key: value}, ttl)[key]
+
+    def add_many(self, mapping, ttl=None):
+        rv = self.l2.add_many(mapping, ttl)
+        added = [k for k, v in rv.items() if v]
+        if added:
+            self._invalidate(added)
+        return rv
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys):
+        values = self.l1.get_many(*keys)
+        missing = [k for k, v in zip(keys, values) if v is None]
+        if not missing:
+            return values
+        found = {k: v for k, v in self.l2.get_dict(*missing).items() if v is not None}
+        if found and self._l1_ttl is not None:
+            self.l1.set_many(found, self._l1_ttl_of(None))
+        return [v if v is not None else found.get(k) for k, v in zip(keys, values)]
+
+    def delete(self, key):
+        rv = self.l2.delete(key)
+        self._invalidate([key])
+        return rv
+
+    def delete_many(self, *keys):
+        rv = self.l2.delete_many(*keys)
+        self._invalidate(list(keys))
+        return rv
+
+    def has(self, key):
+        return self.l1.has(key) or self.l2.has(key)
+
+    def incr(self, key, delta=1, ttl=None):
+        rv = self.l2.incr(key, delta, ttl)
+        self._invalidate([key])
+        return rv
+
+    def decr(self, key, delta=1, ttl=None):
+        rv = self.l2.decr(key, delta, ttl)
+        self._invalidate([key])
+        return rv
+
+
+class ShardedBackend(BaseBackend):
+    """Spreads the keys over several backends through a consistent hash
+    ring with virtual nodes, adding or removing a shard only moves about
+    1/N of the keys.
+
+    The batch operations are split per shard and sent to all the involved
+    shards concurrently from a thread pool, the results are merged back
+    in the original key order.
+
+    :param backends: a list of backends, or a dict of shard name to backend.
+                     The ring is built on the names, which default to the
+                     indexes of the backends, so keep them stable when the
+                     shards change.
+    :param vnodes: the number of virtual nodes of every shard on the ring.
+    :param max_workers: the size of the thread pool, defaults to the number
+                        of shards.
+    """
+
+    def __init__(self, backends, vnodes=160, max_workers=None):
+        if not isinstance(backends, dict):
+            backends = {str(i): backend for i, backend in enumerate(backends)}
+        if not backends:
+            raise ValueError("at least one backend is required")
+        super(ShardedBackend, self).__init__(next(iter(backends.values())).default_ttl)
+        self._backends = backends
+        ring = sorted(
+            (self._hash("%s#%d" % (name, i)), name)
+            for name in backends
+            for i in range(vnodes)
+        )
+        self._ring_hashes = [h for h, _ in ring]
+        self._ring_names = [name for _, name in ring]
+        self._executor = ThreadPoolExecutor(max_workers or len(backends))
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.md5(key.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def get_shard_name(self, key):
+        """Returns the name of the shard which `key` is routed to."""
+        i = bisect.bisect(self._ring_hashes, self._hash(key))
+        return self._ring_names[i % len(self._ring_names)]
+
+    def get_backend(self, key):
+        """Returns the backend which `key` is routed to."""
+        return self._backends[self.get_shard_name(key)]
+
+    def _fan_out(self, keys, call):
+        """Calls `call(backend, shard_keys)` for every shard concurrently,
+        returns a list of `(shard_keys, result)`."""
+        groups = defaultdict(list)
+        for key in keys:
+            groups[self.get_shard_name(key)].append(key)
+        if len(groups) == 1:
+            name, shard_keys = groups.popitem()
+            return [(shard_keys, call(self._backends[name], shard_keys))]
+        futures = [
+            (shard_keys, self._executor.submit(call, self._backends[name], shard_keys))
+            for name, shard_keys in groups.items()
+        ]
+        return [(shard_keys, future.result()) for shard_keys, future in futures]
+
+    def close(self):
+        """Shuts the thread pool down, the shards are left open."""
+        self._executor.shutdown()
+
+    def set(self, key, value, ttl=None):
+        return self.get_backend(key).set(key, value, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        rv = {}
+        for _, result in self._fan_out(
+            mapping,
+            lambda backend, keys: backend.set_many({k: mapping[k] for k in keys}, ttl),
+        ):
+            rv.update(result)
+        return {k: rv[k] for k in mapping}
+
+    def replace(self, key, value, ttl=None):
+        return self.get_backend(key).replace(key, value, ttl)
+
+    def replace_many(self, mapping, ttl=None):
+        rv = {}
+        for _, result in self._fan_out(
+            mapping,
+            lambda backend, keys: backend.replace_many(
+                {k: mapping[k] for k in keys}, ttl
+            ),
+        ):
+            rv.update(result)
+        return {k: rv[k] for k in mapping}
+
+    def add(self, key, value, ttl=None):
+        return self.get_backend(key).add(key, value, ttl)
+
+    def add_many(self, mapping, ttl=None):
+        rv = {}
+        for _, result in self._fan_out(
+            mapping,
+            lambda backend, keys: backend.add_many({k: mapping[k] for k in keys}, ttl),
+        ):
+            rv.update(result)
+        return {k: rv[k] for k in mapping}
+
+    def get(self, key):
+        return self.get_backend(key).get(key)
+
+    def get_many(self, *keys):
+        mapping = self.get_dict(*keys)
+        return [mapping[key] for key in keys]
+
+    def get_dict(self, *keys):
+        rv = {}
+        for shard_keys, values in self._fan_out(
+            keys, lambda backend, shard_keys: backend.get_many(*shard_keys)
+        ):
+            rv.update(zip(shard_keys, values))
+        return rv
+
+    def delete(self, key):
+        return self.get_backend(key).delete(key)
+
+    def delete_many(self, *keys):
+        results = self._fan_out(
+            keys, lambda backend, shard_keys: backend.delete_many(*shard_keys)
+        )
+        return all(result for _, result in results)
+
+    def has(self, key):
+        return self.get_backend(key).has(key)
+
+    def incr(self, key, delta=1, ttl=None):
+        return self.get_backend(key).incr(key, delta, ttl)
+
+    def decr(self, key, delta=1, ttl=None):
+        return self.get_backend(key).decr(key, delta, ttl)
+
+
+class ChunkedBackend(BaseBackend):
+    """Wraps any backend, and stores the values over `max_value_size`
+    bytes, such as the values rejected by the item size limit of memcached,
+    as `chunk_size` bytes chunk keys plus a manifest key.
+
+    The chunks of a batch are written with one `set_many` before the
+    manifests, and fetched with one `get_many`. Every write has its own
+    generation id, which names its chunks, so that a reader never
+    assembles the chunks of two different writes. The chunks of the
+    overwritten or deleted values are not deleted, but left to expire
+    with their ttl, or to be evicted. `has` only checks the manifest, it
+    doesn't guarantee that `get` finds all the chunks of the value.
+
+    :param backend: the wrapped backend.
+    :param max_value_size: the maximum size of the values stored as is.
+    :param chunk_size: the size of the chunks, defaults to `max_value_size`.
+    :param max_key_length: the maximum length in bytes of the chunk keys.
+    """
+
+    def __init__(
+        self, backend, max_value_size=1000 * 1000, chunk_size=None, max_key_length=250
+    ):
+        super(ChunkedBackend, self).__init__(backend.default_ttl)
+        self.backend = backend
+        self._chunker = _Chunker(max_value_size, chunk_size, max_key_length)
+
+    def set(self, key, value, ttl=None):
+        if self._chunker.oversized(value):
+            return self.set_many({key: value}, ttl)[key]
+        return self.backend.set(key, value, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        return self._chunker.write(
+            mapping, ttl, self.backend.set_many, self.backend.set_many
+        )
+
+    def replace(self, key, value, ttl=None):
+        if self._chunker.oversized(value):
+            return self.replace_many({key: value}, ttl)[key]
+        return self.backend.replace(key, value, ttl)
+
+    def replace_many(self, mapping, ttl=None):
+        return self._chunker.write(
+            mapping, ttl, self.backend.replace_many, self.backend.set_many
+        )
+
+    def add(self, key, value, ttl=None):
+        if self._chunker.oversized(value):
+            return self.add_many({key: value}, ttl)[key]
+        return self.backend.add(key, value, ttl)
+
+    def add_many(self, mapping, ttl=None):
+        return self._chunker.write(
+            mapping, ttl, self.backend.add_many, self.backend.set_many
+        )
+
+    def get(self, key):
+        return self.get_dict(key)[key]
+
+    def get_many(self, *keys):
+        mapping = self.get_dict(*keys)
+        return [mapping[key] for key in keys]
+
+    def get_dict(self, *keys):
+        return self._chunker.read(self.backend.get_dict(*keys), self.backend.get_dict)
+
+    def delete(self, key):
+        return self.backend.delete(key)
+
+    def delete_many(self, *keys):
+        return self.backend.delete_many(*keys)
+
+    def has(self, key):
+        # checks the manifest, not the chunks, which may have been evicted.
+        return self.backend.has(key)
+
+    def has_many(self, *keys):
+        return self.backend.has_many(*keys)
+
+    def incr(self, key, delta=1, ttl=None):
+        return self.backend.incr(key, delta, ttl)
+
+    def decr(self, key, delta=1, ttl=None):
+        return self.backend.decr(key, delta, ttl)
+
+
+class MetricsBackend(BaseBackend):
+    """Wraps any backend, and records the call count, the key count, the
+    hits and misses of the reads, the bytes read and written and the latency
+    of every operation to a sink, see :class:`cacheorm.metrics.MetricsSink`.
+
+    Wrap it in an :class:`AsyncBackendAdapter` to use it with asyncio.
+
+    :param backend: the wrapped backend.
+    :param sink: a :class:`cacheorm.metrics.MetricsSink`.
+    :param name: the name of the backend in the metrics, defaults to the class
+                 name of the wrapped backend.
+    """
+
+    def __init__(self, backend, sink, name=None):
+        super(MetricsBackend, self).__init__(backend.default_ttl)
+        self.backend = backend
+        self.sink = sink
+        self.name = name or type(backend).__name__
+
+    def _record(self, operation, started, keys, read=None, written=()):
+        latency = time.perf_counter() - started
+        hits = misses = bytes_in = 0
+        for value in read or ():
+            if value is None:
+                misses += 1
+            else:
+                hits, bytes_in = hits + 1, bytes_in + len(value)
+        self.sink.record(
+            "backend",
+            self.name,
+            operation,
+            latency,
+            keys=keys,
+            hits=hits,
+            misses=misses,
+            bytes_in=bytes_in,
+            bytes_out=sum(len(to_bytes(v)) for v in written),
+        )
+
+    def _write(self, operation, key, value, ttl):
+        started = time.perf_counter()
+        rv = getattr(self.backend, operation)(key, value, ttl)
+        self._record(operation, started, 1, written=(value,))
+        return rv
+
+    def _write_many(self, operation, mapping, ttl):
+        started = time.perf_counter()
+        rv = getattr(self.backend, operation)(mapping, ttl)
+        self._record(operation, started, len(mapping), written=mapping.values())
+        return rv
+
+    def set(self, key, value, ttl=None):
+        return self._write("set", key, value, ttl)
+
+    def replace(self, key, value, ttl=None):
+        return self._write("replace", key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        return self._write("add", key, value, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        return self._write_many("set_many", mapping, ttl)
+
+    def replace_many(self, mapping, ttl=None):
+        return self._write_many("replace_many", mapping, ttl)
+
+    def add_many(self, mapping, ttl=None):
+        return self._write_many("add_many", mapping, ttl)
+
+    def write_batch(self, mappings, deletes=()):
+        started = time.perf_counter()
+        rv = self.backend.write_batch(mappings, deletes)
+        written = [v for mapping in mappings.values() for v in mapping.values()]
+        self._record(
+            "write_batch", started, len(written) + len(deletes), written=written
+        )
+        return rv
+
+    def get(self, key):
+        started = time.perf_counter()
+        rv = self.backend.get(key)
+        self._record("get", started, 1, read=(rv,))
+        return rv
+
+    def get_many(self, *keys):
+        started = time.perf_counter()
+        rv = self.backend.get_many(*keys)
+        self._record("get_many", started, len(keys), read=rv)
+        return rv
+
+    def get_dict(self, *keys):
+        started = time.perf_counter()
+        rv = self.backend.get_dict(*keys)
+        self._record("get_dict", started, len(keys), read=rv.values())
+        return rv
+
+    def _call(self, operation, keys, *args):
+        started = time.perf_counter()
+        rv = getattr(self.backend, operation)(*args)
+        self._record(operation, started, keys)
+        return rv
+
+    def delete(self, key):
+        return self._call("delete", 1, key)
+
+    def delete_many(self, *keys):
+        return self._call("delete_many", len(keys), *keys)
+
+    def has(self, key):
+        return self._call("has", 1, key)
+
+    def has_many(self, *keys):
+        return self._call("has_many", len(keys), *keys)
+
+    def incr(self, key, delta=1, ttl=None):
+        return self._call("incr", 1, key, delta, ttl)
+
+    def decr(self, key, delta=1, ttl=None):
+        return self._call("decr", 1, key, delta, ttl)
+
+
+class ResilientBackend(BaseBackend):
+    """Wraps any backend, and keeps a degraded backend from turning the
+    cache into an outage amplifier, by failing open: instead of raising or
+    hanging, the reads report misses and the writes report failures.
+
+    - A per-operation deadline: with a `timeout`, the calls run in a thread
+      pool and are given up after `timeout` seconds, the ones not started yet
+      are cancelled. The calls fail open at once while `max_workers` calls,
+      including the given up ones, are still running, so a hung backend
+      never piles up a backlog of stale calls.
+    - A circuit breaker: after `failure_threshold` consecutive errors,
+      timeouts or calls slower than `slow_call_threshold` seconds, the circuit
+      opens and the calls fail open without reaching the backend. After
+      `recovery_timeout` seconds, the circuit half-opens and lets
+      `half_open_probes` calls probe the backend, it closes again if a probe
+      succeeds, or reopens if it fails.
+
+    The `state` is one of `CLOSED`, `OPEN` and `HALF_OPEN`, and
+    `on_state_change(old_state, new_state)` is called on every transition.
+    The errors are logged to the ``cacheorm.backends`` logger.
+
+    :param backend: the wrapped backend.
+    :param timeout: the deadline in seconds of every operation, ``None`` calls
+                    the backend directly without deadline.
+    :param failure_threshold: the consecutive failures which open the circuit.
+    :param slow_call_threshold: the duration in seconds over which a call,
+                                even successful, counts as a failure.
+    :param recovery_timeout: the seconds the circuit stays open.
+    :param half_open_probes: the number of calls let through when half open.
+    :param max_workers: the size of the thread pool running the calls with
+                        a deadline.
+    :param on_state_change: a callable notified of the state transitions.
+    :param clock: a callable returns the current time in seconds,
+                  defaults to :func:`time.monotonic`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        backend,
+        timeout=None,
+        failure_threshold=5,
+        slow_call_threshold=None,
+        recovery_timeout=30,
+        half_open_probes=1,
+        max_workers=8,
+        on_state_change=None,
+        clock=None,
+    ):
+        super(ResilientBackend, self).__init__(backend.default_ttl)
+        self.backend = backend
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self.max_workers = max_workers
+        self.on_state_change = on_state_change
+        self._clock = clock or time.monotonic
+        self._executor = ThreadPoolExecutor(max_workers) if timeout else None
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.RLock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._probes = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def _transition(self, state):
+        old_state, self._state = self._state, state
+        self._probes = 0
+        if state == self.OPEN:
+            self._opened_at = self._clock()
+        elif state == self.CLOSED:
+            self._failures = 0
+        if self.on_state_change is not None:
+            self.on_state_change(old_state, state)
+
+    def _acquire(self):
+        with self._lock:
+            if self._state == self.OPEN:
+                if self._clock() - self._opened_at < self.recovery_timeout:
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    return False
+                self._probes += 1
+            return True
+
+    def _succeeded(self):
+        with self._lock:
+            self._failures = 0
+            if self._state == self.HALF_OPEN:
+                self._transition(self.CLOSED)
+
+    def _failed(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._transition(self.OPEN)
+
+    def _submit(self, method, *args):
+        if not self._slots.acquire(blocking=False):
+            raise RuntimeError("all the %d workers are busy" % self.max_workers)
+        future = self._executor.submit(method, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def close(self):
+        """Shuts the thread pool down, without waiting for the given up
+        calls, the wrapped backend is left open."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _call(self, fallback, method, *args):
+        if not self._acquire():
+            return fallback
+        started = self._clock()
+        try:
+            if self._executor is None:
+                rv = method(*args)
+            else:
+                rv = self._submit(method, *args)
+        except Exception:
+            logger.warning("%s failed open", method.__name__, exc_info=True)
+            self._failed()
+            return fallback
+        slow = self.slow_call_threshold
+        if slow is not None and self._clock() - started > slow:
+            self._failed()
+        else:
+            self._succeeded()
+        return rv
+
+    def set(self, key, value, ttl=None):
+        return self._call(False, self.backend.set, key, value, ttl)
+
+    def replace(self, key, value, ttl=None):
+        return self._call(False, self.backend.replace, key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        return self._call(False, self.backend.add, key, value, ttl)
+
+    def get(self, key):
+        return self._call(None, self.backend.get, key)
+
+    def delete(self, key):
+        return self._call(False, self.backend.delete, key)
+
+    def set_many(self, mapping, ttl=None):
+        fallback = dict.fromkeys(mapping, False)
+        return self._call(fallback, self.backend.set_many, mapping, ttl)
+
+    def replace_many(self, mapping, ttl=None):
+        fallback = dict.fromkeys(mapping, False)
+        return self._call(fallback, self.backend.replace_many, mapping, ttl)
+
+    def add_many(self, mapping, ttl=None):
+        fallback = dict.fromkeys(mapping, False)
+        return self._call(fallback, self.backend.add_many, mapping, ttl)
+
+    def get_many(self, *keys):
+        return self._call([None] * len(keys), self.backend.get_many, *keys)
+
+    def get_dict(self, *keys):
+        return self._call(dict.fromkeys(keys), self.backend.get_dict, *keys)
+
+    def delete_many(self, *keys):
+        return self._call(False, self.backend.delete_many, *keys)
+
+    def write_batch(self, mappings, deletes=()):
+        fallback = {k: False for mapping in mappings.values() for k in mapping}
+        return self._call(fallback, self.backend.write_batch, mappings, deletes)
+
+    def has(self, key):
+        return self._call(False, self.backend.has, key)
+
+    def has_many(self, *keys):
+        return self._call(dict.fromkeys(keys, False), self.backend.has_many, *keys)
+
+    def incr(self, key, delta=1, ttl=None):
+        return self._call(None, self.backend.incr, key, delta, ttl)
+
+    def decr(self, key, delta=1, ttl=None):
+        return self._call(None, self.backend.decr, key, delta, ttl)
+
+
+class CoalescingBackend(BaseBackend):
+    """Wraps any backend, and coalesces the concurrent reads of the same key
+    from different threads into one in-flight fetch, whose result or error is
+    shared by all of them, see :class:`AsyncCoalescingBackend` for asyncio.
+
+    A read fetches the keys nobody is fetching with one `get_many` before
+    waiting for the keys already in flight, so the overlapping batches never
+    wait for each other. A write of a key forgets its in-flight fetch, the
+    following reads start a new one. The number of keys served by the fetch of
+    another read is counted in `coalesced`.
+
+    :param backend: the wrapped backend.
+    """
+
+    def __init__(self, backend):
+        super(CoalescingBackend, self).__init__(backend.default_ttl)
+        self.backend = backend
+        self.coalesced = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _release(self, owned):
+        with self._lock:
+            for key, future in owned.items():
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def _fetch(self, owned):
+        try:
+            values = self.backend.get_many(*owned)
+        except BaseException as e:
+            self._release(owned)
+            for future in owned.values():
+                future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            self._release(owned)
+            for future, value in zip(owned.values(), values):
+                future.set_result(value)
+
+    def get_many(self, *keys):
+        owned, futures = {}, {}
+        with self._lock:
+            for key in keys:
+                if key in futures:
+                    continue
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = owned[key] = Future()
+                else:
+                    self.coalesced += 1
+                futures[key] = future
+        if owned:
+            self._fetch(owned)
+        return [futures[key].result() for key in keys]
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_dict(self, *keys):
+        return dict(zip(keys, self.get_many(*keys)))
+
+    def _forget(self, keys):
+        with self._lock:
+            for key in keys:
+                self._inflight.pop(key, None)
+
+    def set(self, key, value, ttl=None):
+        self._forget((key,))
+        return self.backend.set(key, value, ttl)
+
+    def replace(self, key, value, ttl=None):
+        self._forget((key,))
+        return self.backend.replace(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        self._forget((key,))
+        return self.backend.add(key, value, ttl)
+
+    def delete(self, key):
+        self._forget((key,))
+        return self.backend.delete(key)
+
+    def set_many(self, mapping, ttl=None):
+        self._forget(mapping)
+        return self.backend.set_many(mapping, ttl)
+
+    def replace_many(self, mapping, ttl=None):
+        self._forget(mapping)
+        return self.backend.replace_many(mapping, ttl)
+
+    def add_many(self, mapping, ttl=None):
+        self._forget(mapping)
+        return self.backend.add_many(mapping, ttl)
+
+    def delete_many(self, *keys):
+        self._forget(keys)
+        return self.backend.delete_many(*keys)
+
+    def write_batch(self, mappings, deletes=()):
+        self._forget(deletes)
+        for mapping in mappings.values():
+            self._forget(mapping)
+        return self.backend.write_batch(mappings, deletes)
+
+    def has(self, key):
+        return self.backend.has(key)
+
+    def has_many(self, *keys):
+        return self.backend.has_many(*keys)
+
+    def incr(self, key, delta=1, ttl=None):
+        self._forget((key,))
+        return self.backend.incr(key, delta, ttl)
+
+    def decr(self, key, delta=1, ttl=None):
+        self._forget((key,))
+        return self.backend.decr(key, delta, ttl)
+
+
+def _close_at_exit(ref):
+    backend = ref()
+    if backend is not None:
+        backend.close()
+
+
+class WriteBehindBackend(BaseBackend):
+    """Wraps any backend, and buffers the writes in process, a background
+    thread writes them behind with one `set_many` per ttl, every
+    `flush_interval` seconds or as soon as `max_size` keys are buffered.
+    A later write of a buffered key supersedes the earlier one, which is
+    never sent, they are counted in `superseded`.
+
+    - Read-your-writes: the reads see the buffered writes.
+    - Backpressure: a write of a new key blocks while the buffer is full,
+      until the background thread takes it over.
+    - The deletes and the conditional writes (`add`, `replace`, `incr`...)
+      reach the backend at once, after the buffered writes of their keys.
+    - :meth:`flush` writes the buffer at once, :meth:`close` flushes it and
+      stops the thread, it is called at interpreter exit.
+
+    The buffered writes are lost if the process crashes, and the errors of
+    the background flushes are passed to `on_error`, the failed writes are
+    retried by the next flush unless superseded.
+
+    :param backend: the wrapped backend.
+    :param flush_interval: the maximum seconds a write stays buffered.
+    :param max_size: the number of buffered keys which triggers a flush,
+                     and blocks the writes of new keys.
+    :param on_error: a callable receiving the exceptions of the background
+                     flushes.
+    """
+
+    def __init__(self, backend, flush_interval=1.0, max_size=1000, on_error=None):
+        super(WriteBehindBackend, self).__init__(backend.default_ttl)
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.on_error = on_error
+        self.superseded = 0
+        self._pending = {}
+        self._flushing = {}
+        self._closed = False
+        self._thread = None
+        self._at_exit = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="cacheorm-write-behind", daemon=True
+            )
+            self._thread.start()
+            # a hook of its own, which `close` can unregister.
+            self._at_exit = partial(_close_at_exit, weakref.ref(self))
+            atexit.register(self._at_exit)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or len(self._pending) >= self.max_size,
+                    self.flush_interval,
+                )
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+
+    def _buffer(self, mapping, ttl):
+        with self._cond:
+            while (
+                not self._closed
+                and len(self._pending) >= self.max_size
+                and not all(key in self._pending for key in mapping)
+            ):
+                self._cond.notify_all()
+                self._cond.wait()
+            if not self._closed:
+                self._start()
+                for key, value in mapping.items():
+                    if self._pending.pop(key, None) is not None:
+                        self.superseded += 1
+                    self._pending[key] = (to_bytes(value), ttl)
+                if len(self._pending) >= self.max_size:
+                    self._cond.notify_all()
+                return dict.fromkeys(mapping, True)
+        with self._ordered(mapping):
+            return self.backend.set_many(mapping, ttl)
+
+    def _write(self, batch):
+        mappings = defaultdict(dict)
+        for key, (value, ttl) in batch.items():
+            mappings[ttl][key] = value
+        for ttl, mapping in mappings.items():
+            self.backend.set_many(mapping, ttl)
+
+    def flush(self):
+        """Writes the buffered writes to the backend."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+                self._cond.notify_all()
+            try:
+                if batch:
+                    self._write(batch)
+            except BaseException:
+                with self._cond:
+                    for key, entry in batch.items():
+                        self._pending.setdefault(key, entry)
+                raise
+            finally:
+                with self._cond:
+                    self._flushing = {}
+
+    def close(self):
+        """Flushes the buffer and stops the background thread, the following
+        writes reach the backend at once."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        if self._at_exit is not None:
+            atexit.unregister(self._at_exit)
+            self._at_exit = None
+        self.flush()
+
+    @contextmanager
+    def _ordered(self, keys, discard=False):
+        """Writes or discards the buffered writes of `keys` first, and holds
+        the flushes off meanwhile, yields the buffered keys."""
+        with self._flush_lock:
+            with self._cond:
+                batch = {k: self._pending.pop(k) for k in keys if k in self._pending}
+                self._cond.notify_all()
+            if batch and not discard:
+                self._write(batch)
+            yield batch
+
+    def _buffered(self, keys):
+        with self._cond:
+            rv = {}
+            for key in keys:
+                entry = self._pending.get(key) or self._flushing.get(key)
+                if entry is not None:
+                    rv[key] = entry[0]
+            return rv
+
+    def set(self, key, value, ttl=None):
+        return self._buffer({key: value}, ttl)[key]
+
+    def set_many(self, mapping, ttl=None):
+        return self._buffer(mapping, ttl)
+
+    def replace(self, key, value, ttl=None):
+        with self._ordered((key,)):
+            return self.backend.replace(key, value, ttl)
+
+    def replace_many(self, mapping, ttl=None):
+        with self._ordered(mapping):
+            return self.backend.replace_many(mapping, ttl)
+
+    def add(self, key, value, ttl=None):
+        with self._ordered((key,)):
+            return self.backend.add(key, value, ttl)
+
+    def add_many(self, mapping, ttl=None):
+        with self._ordered(mapping):
+            return self.backend.add_many(mapping, ttl)
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys):
+        buffered = self._buffered(keys)
+        missing = [key for key in keys if key not in buffered]
+        if missing:
+            buffered.update(zip(missing, self.backend.get_many(*missing)))
+        return [buffered[key] for key in keys]
+
+    def get_dict(self, *keys):
+        return dict(zip(keys, self.get_many(*keys)))
+
+    def delete(self, key):
+        return self.delete_many(key)
+
+    def delete_many(self, *keys):
+        with self._ordered(keys, discard=True) as discarded:
+            # the discarded keys may exist in the backend too, but they count
+            # as deleted anyway.
+            if discarded:
+                self.backend.delete_many(*discarded)
+            rest = [key for key in keys if key not in discarded]
+            return self.backend.delete_many(*rest) if rest else True
+
+    def has(self, key):
+        return self.has_many(key)[key]
+
+    def has_many(self, *keys):
+        buffered = self._buffered(keys)
+        missing = [key for key in keys if key not in buffered]
+        rv = dict.fromkeys(buffered, True)
+        if missing:
+            rv.update(self.backend.has_many(*missing))
+        return {key: rv[key] for key in keys}
+
+    def incr(self, key, delta=1, ttl=None):
+        with self._ordered((key,)):
+            return self.backend.incr(key, delta, ttl)
+
+    def decr(self, key, delta=1, ttl=None):
+        with self._ordered((key,)):
+            return self.backend.decr(key, delta, ttl)
+
+
+class AsyncBaseBackend(object):  # pragma: no cover
+    """Base class for the asyncio cache backends, every method is the
+    coroutine counterpart of the one of :class:`BaseBackend`, with the
+    same arguments and return values.
+    """
+
+    def __init__(self, default_ttl=600):
+        self.default_ttl = default_ttl
+
+    def _normalize_ttl(self, ttl):
+        if ttl is None:
+            ttl = self.default_ttl
+        return int(max(ttl, 0))
+
+    async def set(self, key, value, ttl=None):
+        return True
+
+    async def replace(self, key, value, ttl=None):
+        return True
+
+    async def add(self, key, value, ttl=None):
+        if await self.get(key) is not None:
+            return False
+        return await self.set(key, value, ttl)
+
+    async def get(self, key):
+        return None
+
+    async def delete(self, key):
+        return True
+
+    async def set_many(self, mapping, ttl=None):
+        keys = list(mapping.keys())
+        values = await asyncio.gather(*[self.set(k, mapping[k], ttl) for k in keys])
+        return dict(zip(keys, values))
+
+    async def replace_many(self, mapping, ttl=None):
+        keys = list(mapping.keys())
+        values = await asyncio.gather(*[self.replace(k, mapping[k], ttl) for k in keys])
+        return dict(zip(keys, values))
+
+    async def add_many(self, mapping, ttl=None):
+        keys = list(mapping.keys())
+        values = await asyncio.gather(*[self.add(k, mapping[k], ttl) for k in keys])
+        return dict(zip(keys, values))
+
+    async def get_many(self, *keys):
+        return list(await asyncio.gather(*[self.get(k) for k in keys]))
+
+    async def get_dict(self, *keys):
+        return dict(zip(keys, await self.get_many(*keys)))
+
+    async def delete_many(self, *keys):
+        return all(await asyncio.gather(*[self.delete(k) for k in keys]))
+
+    async def write_batch(self, mappings, deletes=()):
+        if deletes:
+            await self.delete_many(*deletes)
+        rv = {}
+        for ttl, mapping in mappings.items():
+            rv.update(await self.set_many(mapping, ttl))
+        return rv
+
+    async def has(self, key):
+        raise NotImplementedError
+
+    async def has_many(self, *keys):
+        values = await asyncio.gather(*[self.has(k) for k in keys])
+        return dict(zip(keys, values))
+
+    async def incr(self, key, delta=1, ttl=None):
+        value = int(await self.get(key) or 0) + delta
+        return value if await self.set(key, value, ttl) else None
+
+    async def decr(self, key, delta=1, ttl=None):
+        value = int(await self.get(key) or 0) - delta
+        return value if await self.set(key, value, ttl) else None
+
+
+class AsyncBackendAdapter(AsyncBaseBackend):
+    """Exposes a synchronous backend through the :class:`AsyncBaseBackend`
+    API, mainly for the tests and the in-process backends that never block,
+    such as ``AsyncBackendAdapter(SimpleBackend())``.
+
+    :param backend: the wrapped synchronous backend.
+    """
+
+    def __init__(self, backend):
+        super(AsyncBackendAdapter, self).__init__(backend.default_ttl)
+        self.backend = backend
+
+    async def set(self, key, value, ttl=None):
+        return self.backend.set(key, value, ttl)
+
+    async def replace(self, key, value, ttl=None):
+        return self.backend.replace(key, value, ttl)
+
+    async def add(self, key, value, ttl=None):
+        return self.backend.add(key, value, ttl)
+
+    async def get(self, key):
+        return self.backend.get(key)
+
+    async def delete(self, key):
+        return self.backend.delete(key)
+
+    async def set_many(self, mapping, ttl=None):
+        return self.backend.set_many(mapping, ttl)
+
+    async def replace_many(self, mapping, ttl=None):
+        return self.backend.replace_many(mapping, ttl)
+
+    async def add_many(self, mapping, ttl=None):
+        return self.backend.add_many(mapping, ttl)
+
+    async def get_many(self, *keys):
+        return self.backend.get_many(*keys)
+
+    async def get_dict(self, *keys):
+        return self.backend.get_dict(*keys)
+
+    async def delete_many(self, *keys):
+        return self.backend.delete_many(*keys)
+
+    async def write_batch(self, mappings, deletes=()):
+        return self.backend.write_batch(mappings, deletes)
+
+    async def has(self, key):
+        return self.backend.has(key)
+
+    async def has_many(self, *keys):
+        return self.backend.has_many(*keys)
+
+    async def incr(self, key, delta=1, ttl=None):
+        return self.backend.incr(key, delta, ttl)
+
+    async def decr(self, key, delta=1, ttl=None):
+        return self.backend.decr(key, delta, ttl)
+
+
+class AsyncCoalescingBackend(AsyncBaseBackend):
+    """The asyncio counterpart of :class:`CoalescingBackend`, coalesces the
+    concurrent reads of the same key from different tasks of an event loop.
+
+    :param backend: the wrapped asyncio backend.
+    """
+
+    def __init__(self, backend):
+        super(AsyncCoalescingBackend, self).__init__(backend.default_ttl)
+        self.backend = backend
+        self.coalesced = 0
+        self._inflight = {}
+
+    def _release(self, owned):
+        for key, future in owned.items():
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _fetch(self, owned):
+        try:
+            values = await self.backend.get_many(*owned)
+        except asyncio.CancelledError:
+            self._release(owned)
+            for future in owned.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            self._release(owned)
+            for future in owned.values():
+                future.set_exception(e)
+                # retrieved by the owner, don't warn for the others.
+                future.exception()
+        else:
+            self._release(owned)
+            for future, value in zip(owned.values(), values):
+                future.set_result(value)
+
+    async def get_many(self, *keys):
+        loop = asyncio.get_running_loop()
+        owned, futures = {}, {}
+        for key in keys:
+            if key in futures:
+                continue
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = owned[key] = loop.create_future()
+            else:
+                self.coalesced += 1
+            futures[key] = future
+        if owned:
+            await self._fetch(owned)
+        waiting = [f for key, f in futures.items() if key not in owned]
+        if waiting:
+            await asyncio.wait(waiting)
+        # the fetches of the cancelled tasks are retried.
+        cancelled = [key for key, f in futures.items() if f.cancelled()]
+        values = {}
+        if cancelled:
+            values = dict(zip(cancelled, await self.get_many(*cancelled)))
+        return [values[key] if key in values else futures[key].result() for key in keys]
+
+    async def get(self, key):
+        return (await self.get_many(key))[0]
+
+    async def get_dict(self, *keys):
+        return dict(zip(keys, await self.get_many(*keys)))
+
+    def _forget(self, keys):
+        for key in keys:
+            self._inflight.pop(key, None)
+
+    async def set(self, key, value, ttl=None):
+        self._forget((key,))
+        return await self.backend.set(key, value, ttl)
+
+    async def replace(self, key, value, ttl=None):
+        self._forget((key,))
+        return await self.backend.replace(key, value, ttl)
+
+    async def add(self, key, value, ttl=None):
+        self._forget((key,))
+        return await self.backend.add(key, value, ttl)
+
+    async def delete(self, key):
+        self._forget((key,))
+        return await self.backend.delete(key)
+
+    async def set_many(self, mapping, ttl=None):
+        self._forget(mapping)
+        return await self.backend.set_many(mapping, ttl)
+
+    async def replace_many(self, mapping, ttl=None):
+        self._forget(mapping)
+        return await self.backend.replace_many(mapping, ttl)
+
+    async def add_many(self, mapping, ttl=None):
+        self._forget(mapping)
+        return await self.backend.add_many(mapping, ttl)
+
+    async def delete_many(self, *keys):
+        self._forget(keys)
+        return await self.backend.delete_many(*keys)
+
+    async def has(self, key):
+        return await self.backend.has(key)
+
+    async def has_many(self, *keys):
+        return await self.backend.has_many(*keys)
+
+    async def incr(self, key, delta=1, ttl=None):
+        self._forget((key,))
+        return await self.backend.incr(key, delta, ttl)
+
+    async def decr(self, key, delta=1, ttl=None):
+        self._forget((key,))
+        return await self.backend.decr(key, delta, ttl)
+
+
+class AsyncRedisBackend(AsyncBaseBackend):
+    """Uses the Redis key-value store as an asyncio cache backend,
+    built on ``redis.asyncio``.
+
+    :param host: address string of the Redis server.
+    :param port: port number on which Redis server listens for connections.
+    :param password: password authentication for the Redis server.
+    :param db: db (zero-based numeric index) on Redis Server to connect.
+    :param client: an object resembling an instance of a redis.asyncio.Redis class.
+    :param default_ttl: the default ttl that is used if no ttl is
+                            specified on :meth:`~AsyncBaseBackend.set`. A ttl of
+                            0 indicates that the cache never expires.
+
+    Any additional keyword arguments will be passed to ``redis.asyncio.Redis``.
+    """
+
+    def __init__(
+        self,
+        host="localhost",
+        port=6379,
+        password=None,
+        db=0,
+        client=None,
+        default_ttl=600,
+        **kwargs
+    ):
+        super(AsyncRedisBackend, self).__init__(default_ttl)
+        if client is None:
+            try:
+                from redis import asyncio as aioredis
+            except ImportError:  # pragma: no cover
+                raise ModuleNotFoundError("no redis.asyncio module found")
+            self._client = aioredis.Redis(
+                host=host, port=port, password=password, db=db, **kwargs
+            )
+        else:
+            self._client = client
+
+    def _normalize_ttl(self, ttl):
+        ttl = super(AsyncRedisBackend, self)._normalize_ttl(ttl)
+        if ttl == 0:
+            ttl = None
+        return ttl
+
+    async def set(self, key, value, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        return bool(await self._client.set(key, value, ex=ttl))
+
+    async def replace(self, key, value, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        return bool(await self._client.set(key, value, ex=ttl, xx=True))
+
+    async def add(self, key, value, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        return bool(await self._client.set(key, value, ex=ttl, nx=True))
+
+    async def get(self, key):
+        return to_bytes(await self._client.get(key))
+
+    async def delete(self, key):
+        return bool(await self._client.delete(key))
+
+    async def set_many(self, mapping, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        if ttl is None:
+            await self._client.mset(mapping)
+            return {k: True for k in mapping}
+        async with self._client.pipeline() as pipe:
+            keys = list(mapping.keys())
+            for key in keys:
+                pipe.set(name=key, value=mapping[key], ex=ttl)
+            values = await pipe.execute()
+            return dict(zip(keys, values))
+
+    async def replace_many(self, mapping, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        async with self._client.pipeline() as pipe:
+            keys = list(mapping.keys())
+            for key in keys:
+                pipe.set(name=key, value=mapping[key], ex=ttl, xx=True)
+            values = await pipe.execute()
+            return dict(zip(keys, map(bool, values)))
+
+    async def add_many(self, mapping, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        async with self._client.pipeline() as pipe:
+            keys = list(mapping.keys())
+            for key in keys:
+                pipe.set(name=key, value=mapping[key], ex=ttl, nx=True)
+            values = await pipe.execute()
+            return dict(zip(keys, map(bool, values)))
+
+    async def get_many(self, *keys):
+        return [to_bytes(v) for v in await self._client.mget(keys)]
+
+    async def delete_many(self, *keys):
+        return await self._client.delete(*keys) == len(keys)
+
+    async def write_batch(self, mappings, deletes=()):
+        async with self._client.pipeline(transaction=True) as pipe:
+            if deletes:
+                pipe.delete(*deletes)
+            keys = []
+            for ttl, mapping in mappings.items():
+                ttl = self._normalize_ttl(ttl)
+                for key, value in mapping.items():
+                    pipe.set(name=key, value=value, ex=ttl)
+                    keys.append(key)
+            values = await pipe.execute()
+        return dict(zip(keys, map(bool, values[1:] if deletes else values)))
+
+    async def has(self, key):
+        return bool(await self._client.exists(key))
+
+    async def incr(self, key, delta=1, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        if ttl is None:
+            return await self._client.incr(key, delta)
+        async with self._client.pipeline() as pipe:
+            pipe.incr(key, delta)
+            pipe.expire(key, ttl)
+            values = await pipe.execute()
+            return values[0]
+
+    async def decr(self, key, delta=1, ttl=None):
+        ttl = self._normalize_ttl(ttl)
+        if ttl is None:
+            return await self._client.decr(key, delta)
+        async with self._client.pipeline() as pipe:
+            pipe.decr(key, delta)
+            pipe.expire(key, ttl)
+            values = await pipe.execute()
+            return values[0]
+
+    async def close(self):
+        """Closes the connections of the client."""
+        close = getattr(self._client, "aclose", None) or self._client.close
+        await close()
+
+
+class _MemcachedConnection(object):
+    def __init__(self, address, timeout):
+        self.sock = socket.create_connection(address, timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile("rb")
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        line = self.rfile.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by memcached server")
+        return line[:-2]
+
+    def read_values(self):
+        """Reads the response of `get`/`gets` until ``END``,
+        returns a dict of key to ``(value, cas)``."""
+        values = {}
+        while True:
+            line = self.readline()
+            if line == b"END":
+                return values
+            parts = line.split()
+            if parts[0] != b"VALUE":
+                raise ValueError("unexpected memcached response %r" % line)
+            data = self.rfile.read(int(parts[3]) + 2)
+            cas = int(parts[4]) if len(parts) > 4 else None
+            values[parts[1]] = (data[:-2], cas)
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+class PipelinedMemcachedBackend(BaseBackend):
+    """A pure Python memcached backend speaking the memcached text protocol
+    directly over sockets, no C extension is required.
+
+    Every thread (and process) keeps its own connection to every server.
+    A batch operation sends all the commands for a server with one write
+    and then reads all the responses, the servers are written to before
+    any of them is read.  Keys are distributed among the servers by the
+    crc32 of the key.
+
+    Implementation notes: keys over 250 bytes or containing whitespace or
+    control characters are handled like :class:`MemcachedBackend` does,
+    and connection errors are reported as failures of the operation.
+
+    :param servers: a list or tuple of server addresses.
+    :param noreply: send the writes(`set`, `replace` and `delete`) with
+                    ``noreply``, fire and forget, they always succeed.
+    :param timeout: the socket timeout in seconds.
+    :param default_ttl: the default ttl that is used if no ttl is
+                            specified on :meth:`~BaseBackend.set`. A ttl of
+                            0 indicates that the cache never expires.
+    :param max_value_size: the maximum size of the values stored as one item,
+                           the larger ones are split into several keys, see
+                           :class:`ChunkedBackend`. ``None`` disables it.
+    :param normalize_keys: ``True``, ``False`` or a :class:`KeyNormalizer`.
+    """
+
+    KEY_MAX_LENGTH = 250
+    _INVALID_KEY_CHARS = re.compile(rb"[\x00-\x20\x7f]")
+    _ERRORS = (OSError, ValueError)
+
+    def __init__(
+        self,
+        servers=(("localhost", 11211),),
+        noreply=False,
+        timeout=3,
+        default_ttl=600,
+        max_value_size=1000 * 1000,
+        normalize_keys=True,
+    ):
+        super(PipelinedMemcachedBackend, self).__init__(default_ttl)
+        self._chunker = _Chunker(max_value_size)
+        if normalize_keys is True:
+            normalize_keys = KeyNormalizer(self.KEY_MAX_LENGTH)
+        self.key_normalizer = normalize_keys or None
+        self._servers = [(host, int(port)) for host, port in servers]
+        self._noreply = noreply
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _normalize_ttl(self, ttl):
+        ttl = super(PipelinedMemcachedBackend, self)._normalize_ttl(ttl)
+        # After 30 days, is treated as a unix timestamp of an exact date.
+        if ttl >= 30 * 24 * 60 * 60:
+            return int(time.time()) + ttl
+        return ttl
+
+    def _encode_key(self, key):
+        if self.key_normalizer is not None:
+            key = self.key_normalizer(key)
+        key = key.encode("utf-8")
+        if len(key) > self.KEY_MAX_LENGTH or self._INVALID_KEY_CHARS.search(key):
+            return None
+        return key
+
+    def _get_pool(self):
+        pool = getattr(self._local, "pool", None)
+        if pool is None or self._local.pid != os.getpid():
+            # never share the sockets inherited from the parent process.
+            pool = self._local.pool = {}
+            self._local.pid = os.getpid()
+        return pool
+
+    def _get_connection(self, server):
+        pool = self._get_pool()
+        if server not in pool:
+            pool[server] = _MemcachedConnection(self._servers[server], self._timeout)
+        return pool[server]
+
+    def _discard_connection(self, server):
+        conn = self._get_pool().pop(server, None)
+        if conn is not None:
+            conn.close()
+
+    def _pipeline(self, keys, build, parse):
+        """Sends `build(keys)` to every server, then returns the merged
+        results of `parse(conn, keys)`, the keys of the failed servers are
+        missing from the result."""
+        groups = defaultdict(list)
+        for key in keys:
+            groups[zlib.crc32(key) % len(self._servers)].append(key)
+        sent, rv = [], {}
+        for server, server_keys in groups.items():
+            try:
+                conn = self._get_connection(server)
+                conn.send(build(server_keys))
+                sent.append((server, conn, server_keys))
+            except self._ERRORS:
+                self._discard_connection(server)
+        for server, conn, server_keys in sent:
+            try:
+                rv.update(parse(conn, server_keys))
+            except self._ERRORS:
+                self._discard_connection(server)
+        return rv
+
+    def _call(self, key, func):
+        """Calls `func(conn)` on the connection of the server of `key`,
+        returns ``None`` for errors."""
+        server = zlib.crc32(key) % len(self._servers)
+        try:
+            return func(self._get_connection(server))
+        except self._ERRORS:
+            self._discard_connection(server)
+            return None
+
+    def _store(self, command, mapping, ttl):
+        exptime = self._normalize_ttl(ttl)
+        # the result of `add` is the point of it, never send it with noreply.
+        quiet = self._noreply and command != b"add"
+        noreply = b" noreply" if quiet else b""
+        encoded = {key: self._encode_key(key) for key in mapping}
+        values = {k: to_bytes(mapping[key]) for key, k in encoded.items() if k}
+
+        def build(keys):
+            return b"".join(
+                b"%s %s 0 %d %d%s\r\n%s\r\n"
+                % (command, k, exptime, len(values[k]), noreply, values[k])
+                for k in keys
+            )
+
+        def parse(conn, keys):
+            if quiet:
+                return {k: True for k in keys}
+            return {k: conn.readline() == b"STORED" for k in keys}
+
+        rv = self._pipeline(list(values), build, parse)
+        return {key: rv.get(k, False) for key, k in encoded.items()}
+
+    def _write(self, command, mapping, ttl):
+        return self._chunker.write(
+            mapping,
+            ttl,
+            lambda m, t: self._store(command, m, t),
+            lambda m, t: self._store(b"set", m, t),
+        )
+
+    def set(self, key, value, ttl=None):
+        return self._write(b"set", {key: value}, ttl)[key]
+
+    def set_many(self, mapping, ttl=None):
+        return self._write(b"set", mapping, ttl)
+
+    def replace(self, key, value, ttl=None):
+        return self._write(b"replace", {key: value}, ttl)[key]
+
+    def add(self, key, value, ttl=None):
+        return self._write(b"add", {key: value}, ttl)[key]
+
+    def add_many(self, mapping, ttl=None):
+        return self._write(b"add", mapping, ttl)
+
+    def replace_many(self, mapping, ttl=None):
+        return self._write(b"replace", mapping, ttl)
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys):
+        mapping = self.get_dict(*keys)
+        return [mapping[key] for key in keys]
+
+    def get_dict(self, *keys):
+        return self._chunker.read(self._get_dict(*keys), self._get_dict)
+
+    def _get_dict(self, *keys):
+        encoded = {key: self._encode_key(key) for key in keys}
+        values = self._pipeline(
+            [k for k in encoded.values() if k is not None],
+            lambda ks: b"get %s\r\n" % b" ".join(ks),
+            lambda conn, ks: conn.read_values(),
+        )
+        rv = {}
+        for key, k in encoded.items():
+            value = values.get(k)
+            rv[key] = value[0] if value is not None else None
+        return rv
+
+    def delete(self, key):
+        return self.delete_many(key)
+
+    def delete_many(self, *keys):
+        encoded = [k for k in map(self._encode_key, keys) if k is not None]
+        noreply = b" noreply" if self._noreply else b""
+
+        def parse(conn, ks):
+            if self._noreply:
+                return {k: True for k in ks}
+            return {k: conn.readline() == b"DELETED" for k in ks}
+
+        rv = self._pipeline(
+            encoded,
+            lambda ks: b"".join(b"delete %s%s\r\n" % (k, noreply) for k in ks),
+            parse,
+        )
+        return len(encoded) == len(keys) and all(rv.get(k, False) for k in encoded)
+
+    def has(self, key):
+        return self.has_many(key)[key]
+
+    def has_many(self, *keys):
+        return {k: v is not None for k, v in self._get_dict(*keys).items()}
+
+    @staticmethod
+    def _add(conn, key, value, exptime):
+        value = b"%d" % value
+        conn.send(b"add %s 0 %d %d\r\n%s\r\n" % (key, exptime, len(value), value))
+        return conn.readline() == b"STORED"
+
+    def _cas_update(self, conn, key, delta, exptime):
+        """Adds `delta` to the value with a `gets`/`cas` loop."""
+        while True:
+            conn.send(b"gets %s\r\n" % key)
+            values = conn.read_values()
+            if key not in values:
+                if self._add(conn, key, delta, exptime):
+                    return delta
+                continue
+            data, cas = values[key]
+            value = int(data) + delta
+            data = b"%d" % value
+            conn.send(
+                b"cas %s 0 %d %d %d\r\n%s\r\n" % (key, exptime, len(data), cas, data)
+            )
+            if conn.readline() == b"STORED":
+                return value
+
+    def _incr(self, conn, key, delta, exptime):
+        while True:
+            conn.send(b"incr %s %d\r\ntouch %s %d\r\n" % (key, delta, key, exptime))
+            line, _ = conn.readline(), conn.readline()
+            if line.isdigit():
+                return int(line)
+            if line != b"NOT_FOUND":
+                # memcached can't increment the negative values.
+                return self._cas_update(conn, key, delta, exptime)
+            if self._add(conn, key, delta, exptime):
+                return delta
+
+    def incr(self, key, delta=1, ttl=None):
+        key = self._encode_key(key)
+        if key is None:
+            return None
+        exptime = self._normalize_ttl(ttl)
+        if delta < 0:
+            return self._call(key, lambda c: self._cas_update(c, key, delta, exptime))
+        return self._call(key, lambda c: self._incr(c, key, delta, exptime))
+
+    def decr(self, key, delta=1, ttl=None):
+        # memcached `decr` never goes below 0, so it is done with `cas`.
+        key = self._encode_key(key)
+        if key is None:
+            return None
+        exptime = self._normalize_ttl(ttl)
+        return self._call(key, lambda c: self._cas_update(c, key, -delta, exptime))
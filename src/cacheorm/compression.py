@@ -0,0 +1,86 @@
+import zlib
+from collections import Counter
+
+
+class Compressor(object):
+    """Compresses the payloads of a model, set it as ``Meta.compression``.
+
+    Only the payloads of at least `threshold` bytes are compressed, and
+    every payload is prefixed with a one-byte header telling how it is
+    stored, so the compressed and uncompressed payloads can coexist.
+    A payload whose first byte is not a known header is returned as is,
+    such as a payload cached before the compression was enabled, none of
+    the serializers starts a payload with those bytes.
+
+    :param threshold: the minimum size of the payloads to compress.
+    :param level: the zlib compression level, from 1 to 9.
+    :param zdict: an optional zlib preset dictionary, see
+                  :func:`train_dictionary`. It helps the small payloads a
+                  lot, but changing it makes the payloads compressed with
+                  the old one unreadable.
+    """
+
+    RAW = b"\x00"
+    ZLIB = b"\x01"
+    ZLIB_DICT = b"\x02"
+
+    def __init__(self, threshold=1024, level=6, zdict=None):
+        self.threshold = threshold
+        self.level = level
+        self.zdict = zdict
+
+    def compress(self, data):
+        if len(data) < self.threshold:
+            return self.RAW + data
+        if self.zdict is None:
+            header, compressed = self.ZLIB, zlib.compress(data, self.level)
+        else:
+            c = zlib.compressobj(self.level, zdict=self.zdict)
+            header, compressed = self.ZLIB_DICT, c.compress(data) + c.flush()
+        if len(compressed) >= len(data):
+            # incompressible data
+            return self.RAW + data
+        return header + compressed
+
+    def decompress(self, data):
+        header, body = data[:1], data[1:]
+        if header == self.RAW:
+            return body
+        if header == self.ZLIB:
+            return zlib.decompress(body)
+        if header == self.ZLIB_DICT:
+            if self.zdict is None:
+                raise ValueError("payload compressed with a preset dictionary")
+            d = zlib.decompressobj(zdict=self.zdict)
+            return d.decompress(body) + d.flush()
+        return data
+
+
+def train_dictionary(samples, size=4096, ngram=8):
+    """Trains a zlib preset dictionary from sample payloads.
+
+    The dictionary is made of the byte sequences of length `ngram` that
+    occur in at least two samples, the most common ones are placed at the
+    end, where zlib reaches them with the shortest distances.
+
+    :param samples: a list of sample payloads, such as the serialized
+                    payloads of some typical instances of a model.
+    :param size: the maximum size of the dictionary.
+    :param ngram: the length of the byte sequences.
+    :rtype: bytes
+    """
+    counter = Counter()
+    for sample in samples:
+        counter.update({sample[i : i + ngram] for i in range(len(sample) - ngram + 1)})
+    zdict = b""
+    for seq, count in counter.most_common():
+        if count < 2 or len(zdict) >= size:
+            break
+        if seq in zdict:
+            continue
+        # the overlapping sequences are merged.
+        if zdict.startswith(seq[1:]):
+            zdict = seq[:1] + zdict
+        else:
+            zdict = seq + zdict
+    return zdict[-size:]
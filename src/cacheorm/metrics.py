@@ -0,0 +1,227 @@
+import bisect
+import os
+import tempfile
+import threading
+
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+class MetricsSink(object):  # pragma: no cover
+    """Base class for the metrics sinks, set a sink as ``Meta.metrics`` of
+    a model to record its `insert`, `query`, `update` and `delete`
+    operations, or wrap a backend in a :class:`MetricsBackend` to record
+    every backend operation.
+    """
+
+    def record(
+        self,
+        scope,
+        name,
+        operation,
+        latency,
+        keys=0,
+        hits=0,
+        misses=0,
+        bytes_in=0,
+        bytes_out=0,
+        tombstones=0,
+    ):
+        """Records one backend round trip.
+
+        :param scope: ``"model"`` or ``"backend"``.
+        :param name: the name of the model or of the backend.
+        :param operation: the name of the operation, such as ``"query"``
+                          or ``"get_many"``.
+        :param latency: the duration of the round trip in seconds.
+        :param keys: the number of keys of the round trip.
+        :param hits: the number of keys found by a read.
+        :param misses: the number of keys missing from a read.
+        :param bytes_in: the size of the values read.
+        :param bytes_out: the size of the values written.
+        :param tombstones: the number of keys known missing by a read, see
+                           ``Meta.negative_ttl``, they are not hits.
+        """
+        raise NotImplementedError
+
+
+class OperationStats(object):
+    """The aggregated metrics of an operation of a model or backend."""
+
+    __slots__ = (
+        "calls",
+        "keys",
+        "hits",
+        "misses",
+        "bytes_in",
+        "bytes_out",
+        "tombstones",
+        "latency_sum",
+        "latency_buckets",
+    )
+
+    def __init__(self, buckets):
+        self.calls = self.keys = self.hits = self.misses = 0
+        self.bytes_in = self.bytes_out = self.tombstones = 0
+        self.latency_sum = 0.0
+        # the last one counts the latencies over the largest bucket.
+        self.latency_buckets = [0] * (len(buckets) + 1)
+
+    @property
+    def hit_ratio(self):
+        reads = self.hits + self.misses
+        return self.hits / reads if reads else None
+
+
+class InMemoryMetrics(MetricsSink):
+    """A thread-safe sink aggregating the metrics in memory, by scope, name
+    and operation, with a latency histogram of the given `buckets`.
+
+    :param buckets: the sorted upper bounds in seconds of the latency
+                    histogram buckets.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        scope,
+        name,
+        operation,
+        latency,
+        keys=0,
+        hits=0,
+        misses=0,
+        bytes_in=0,
+        bytes_out=0,
+        tombstones=0,
+    ):
+        bucket = bisect.bisect_left(self.buckets, latency)
+        with self._lock:
+            stats = self._stats.get((scope, name, operation))
+            if stats is None:
+                stats = self._stats[(scope, name, operation)] = OperationStats(
+                    self.buckets
+                )
+            stats.calls += 1
+            stats.keys += keys
+            stats.hits += hits
+            stats.misses += misses
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            stats.tombstones += tombstones
+            stats.latency_sum += latency
+            stats.latency_buckets[bucket] += 1
+
+    def get(self, scope, name, operation):
+        """Returns the :class:`OperationStats` of an operation, or ``None``."""
+        return self._stats.get((scope, name, operation))
+
+    def items(self):
+        """Returns a sorted list of ``((scope, name, operation), stats)``."""
+        with self._lock:
+            return sorted(self._stats.items())
+
+    def hit_ratio(self, scope, name):
+        """Returns the hit ratio of all the reads of a model or backend."""
+        hits = misses = 0
+        for (s, n, _), stats in self.items():
+            if (s, n) == (scope, name):
+                hits, misses = hits + stats.hits, misses + stats.misses
+        return hits / (hits + misses) if hits + misses else None
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class PrometheusExporter(object):
+    """Exports the metrics of an :class:`InMemoryMetrics` in the Prometheus
+    text exposition format, such as for the textfile collector of the node
+    exporter.
+
+    :param metrics: an :class:`InMemoryMetrics`.
+    :param namespace: the prefix of the metric names.
+    """
+
+    COUNTERS = (
+        ("calls", "Backend round trips."),
+        ("keys", "Keys of the round trips."),
+        ("hits", "Keys found by the reads."),
+        ("misses", "Keys missing from the reads."),
+        ("bytes_in", "Bytes of the values read."),
+        ("bytes_out", "Bytes of the values written."),
+        ("tombstones", "Keys known missing by the reads."),
+    )
+
+    def __init__(self, metrics, namespace="cacheorm"):
+        self.metrics = metrics
+        self.namespace = namespace
+
+    @staticmethod
+    def _labels(scope, name, operation, **extra):
+        labels = dict(scope=scope, name=name, operation=operation, **extra)
+        return ",".join(
+            '%s="%s"'
+            % (
+                k,
+                str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+            )
+            for k, v in labels.items()
+        )
+
+    def render(self):
+        """Returns the metrics as a string."""
+        items = self.metrics.items()
+        lines = []
+        for attr, doc in self.COUNTERS:
+            metric = "%s_%s_total" % (self.namespace, attr)
+            lines.append("# HELP %s %s" % (metric, doc))
+            lines.append("# TYPE %s counter" % metric)
+            for key, stats in items:
+                lines.append(
+                    "%s{%s} %d" % (metric, self._labels(*key), getattr(stats, attr))
+                )
+        metric = "%s_latency_seconds" % self.namespace
+        lines.append("# HELP %s Latency of the backend round trips." % metric)
+        lines.append("# TYPE %s histogram" % metric)
+        for key, stats in items:
+            count = 0
+            bounds = ["%r" % b for b in self.metrics.buckets] + ["+Inf"]
+            for bound, n in zip(bounds, stats.latency_buckets):
+                count += n
+                labels = self._labels(*key, le=bound)
+                lines.append("%s_bucket{%s} %d" % (metric, labels, count))
+            labels = self._labels(*key)
+            lines.append("%s_sum{%s} %r" % (metric, labels, stats.latency_sum))
+            lines.append("%s_count{%s} %d" % (metric, labels, stats.calls))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Writes the metrics to a file atomically, so that a collector never
+        reads a partial file."""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
@@ -1,11 +1,25 @@
+import asyncio
+import contextvars
 import copy
+import inspect
+import logging
+import math
+import random
+import struct
+import threading
+import time
 import uuid
+import weakref
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 
+from . import tracing
 from .fields import CompositeKey, Field, FieldAccessor, UUIDField
 from .index import IndexManager
 from .types import with_metaclass
 
+logger = logging.getLogger(__name__)
+
 
 class Metadata(object):
     def __init__(
@@ -16,12 +30,24 @@ class Metadata(object):
         ttl=None,
         name=None,
         primary_key=None,
+        compression=None,
+        metrics=None,
+        loader=None,
+        stale_ttl=None,
+        early_refresh=None,
+        negative_ttl=None,
         **kwargs
     ):
         self.model = model
         self.backend = backend
         self.serializer = serializer
         self.ttl = ttl
+        self.compression = compression
+        self.metrics = metrics
+        self.loader = loader
+        self.stale_ttl = stale_ttl
+        self.early_refresh = early_refresh
+        self.negative_ttl = negative_ttl
         self.name = name or model.__name__.lower()
 
         self.fields = {}
@@ -45,6 +71,25 @@ class Metadata(object):
         self.add_field(name, field)
         self.primary_key = field
 
+    @property
+    def revalidates(self):
+        """Whether the payloads carry their expiration time, to be refreshed
+        by the loader before or after they expire."""
+        return self.loader is not None and (
+            self.stale_ttl is not None or self.early_refresh is not None
+        )
+
+    @property
+    def fresh_ttl(self):
+        return self.ttl if self.ttl is not None else self.backend.default_ttl
+
+    @property
+    def storage_ttl(self):
+        """The ttl of the payloads, the stale ones are kept `stale_ttl` longer."""
+        if self.stale_ttl is None or not self.revalidates or not self.fresh_ttl:
+            return self.ttl
+        return self.fresh_ttl + self.stale_ttl
+
     def get_primary_key_fields(self):
         if self.composite_key:
             return tuple(
@@ -53,6 +98,18 @@ class Metadata(object):
         return (self.primary_key,)
 
 
+# the rounds of query then add, an add fails when a concurrent writer created
+# the record, or when the backend rejects it, such as a down or full backend.
+_GET_OR_CREATE_ATTEMPTS = 3
+
+
+def _get_or_create_failed(model):
+    return RuntimeError(
+        "%s: neither found nor created after %d attempts"
+        % (model._meta.name, _GET_OR_CREATE_ATTEMPTS)
+    )
+
+
 class DoesNotExist(Exception):
     pass
 
@@ -61,7 +118,18 @@ MODEL_BASE_NAME = "__metaclass_helper__"
 
 
 class ModelBase(type):
-    inheritable = {"backend", "serializer", "ttl", "primary_key"}
+    inheritable = {
+        "backend",
+        "serializer",
+        "ttl",
+        "primary_key",
+        "compression",
+        "metrics",
+        "loader",
+        "stale_ttl",
+        "early_refresh",
+        "negative_ttl",
+    }
 
     def __new__(cls, name, bases, attrs):  # noqa: C901
         if name == MODEL_BASE_NAME or bases[0].__name__ == MODEL_BASE_NAME:
@@ -183,6 +251,22 @@ class Model(with_metaclass(ModelBase, name=MODEL_BASE_NAME)):
     def delete_instance(self):
         return self.delete(**self._meta.primary_key.__key__(self._pk)).execute()
 
+    async def asave(self, force_insert=False):
+        """`save`的协程版本。"""
+        field_dict = self.__data__.copy()
+        if self._pk is not None and not force_insert:
+            inst = await self.update(**field_dict).aexecute()
+        else:
+            inst = await self.insert(**field_dict).aexecute()
+            if inst is not None:
+                self.__data__ = copy.deepcopy(inst.__data__)
+        return inst is not None
+
+    async def adelete_instance(self):
+        """`delete_instance`的协程版本。"""
+        delete = self.delete(**self._meta.primary_key.__key__(self._pk))
+        return await delete.aexecute()
+
     @classmethod
     def insert(cls, **insert):
         """
@@ -204,12 +288,41 @@ class Model(with_metaclass(ModelBase, name=MODEL_BASE_NAME)):
         """
         return ModelInsert(cls, insert_list)
 
+    @classmethod
+    def insert_if_absent(cls, **insert):
+        """
+        仅当记录不存在时插入数据到backend，不会覆盖已经存在的记录。
+        注意：设置了negative_ttl时，tombstone由get再set替换，不是原子的，
+        并发地插入同一个tombstone的key可能都返回Model对象，最后的写入生效。
+        :param insert: 同insert
+        :return: 如果成功插入则返回Model对象，如果记录已经存在则为None
+        :rtype: ModelObject
+        """
+        return ModelInsertIfAbsent(cls, insert)
+
+    @classmethod
+    def insert_many_if_absent(cls, *insert_list):
+        """
+        仅当记录不存在时插入一批数据到backend。
+        :param insert_list: 同insert_many
+        :return: [ModelObject, None, ...]
+        :rtype: list
+        """
+        return ModelInsertIfAbsent(cls, insert_list)
+
     @classmethod
     def create(cls, **kwargs):
         inst = cls(**kwargs)
         inst.save(force_insert=True)
         return inst
 
+    @classmethod
+    async def acreate(cls, **kwargs):
+        """`create`的协程版本。"""
+        inst = cls(**kwargs)
+        await inst.asave(force_insert=True)
+        return inst
+
     @classmethod
     def query(cls, **query):
         """
@@ -251,10 +364,35 @@ class Model(with_metaclass(ModelBase, name=MODEL_BASE_NAME)):
             )
         return inst
 
+    @classmethod
+    async def aget(cls, **query):
+        """`get`的协程版本。"""
+        inst = await cls.query(**query).aexecute()
+        if inst is None:
+            raise cls.DoesNotExist(
+                "%s instance matching query does not exist:\nQuery: %s" % (cls, query)
+            )
+        return inst
+
     @classmethod
     def get_by_id(cls, pk):
         return cls.get(**cls._meta.primary_key.__key__(pk))
 
+    @classmethod
+    async def aget_by_id(cls, pk):
+        """`get_by_id`的协程版本。"""
+        return await cls.aget(**cls._meta.primary_key.__key__(pk))
+
+    @classmethod
+    def loader(cls):
+        """
+        返回model在当前作用域的`ModelLoader`, 合并多处调用的`load(pk)`,
+        去重后每个backend只查询一次, 见`DataLoader`。
+        与`Meta.loader`(缓存未命中时回源)无关。
+        :rtype: ModelLoader
+        """
+        return ModelLoader(cls, DataLoader.current())
+
     @classmethod
     def get_or_none(cls, **query):
         try:
@@ -263,11 +401,45 @@ class Model(with_metaclass(ModelBase, name=MODEL_BASE_NAME)):
             return None
 
     @classmethod
-    def get_or_create(cls, **kwargs):
+    async def aget_or_none(cls, **query):
+        """`get_or_none`的协程版本。"""
         try:
-            return cls.get(**kwargs), False
+            return await cls.aget(**query)
         except DoesNotExist:
-            return cls.create(**kwargs), True
+            return None
+
+    @classmethod
+    def get_or_create(cls, **kwargs):
+        """
+        先查找记录，只在不存在时通过insert_if_absent创建，并发的创建者不会互相覆盖。
+        记录已经存在时只需要一次round trip。
+        注意：设置了negative_ttl时，并发地创建一个tombstone的key可能都返回created，
+        见insert_if_absent。
+        :return: (ModelObject, 是否创建)
+        :rtype: tuple
+        :raises RuntimeError: 重试多次后既查找不到也无法创建，例如backend不可用
+        """
+        for _ in range(_GET_OR_CREATE_ATTEMPTS):
+            inst = cls.query(**kwargs).execute()
+            if inst is not None:
+                return inst, False
+            inst = cls.insert_if_absent(**kwargs).execute()
+            if inst is not None:
+                return inst, True
+            # 记录在查找后被并发地创建了，重试
+        raise _get_or_create_failed(cls)
+
+    @classmethod
+    async def aget_or_create(cls, **kwargs):
+        """`get_or_create`的协程版本。"""
+        for _ in range(_GET_OR_CREATE_ATTEMPTS):
+            inst = await cls.query(**kwargs).aexecute()
+            if inst is not None:
+                return inst, False
+            inst = await cls.insert_if_absent(**kwargs).aexecute()
+            if inst is not None:
+                return inst, True
+        raise _get_or_create_failed(cls)
 
     @classmethod
     def update(cls, **update):
@@ -301,6 +473,18 @@ class Model(with_metaclass(ModelBase, name=MODEL_BASE_NAME)):
             )
         return inst
 
+    @classmethod
+    async def aset_by_id(cls, pk, value):
+        """`set_by_id`的协程版本。"""
+        update = copy.deepcopy(value)
+        update.update(cls._meta.primary_key.__key__(pk))
+        inst = await ModelUpdate(cls, update).aexecute()
+        if inst is None:
+            raise cls.DoesNotExist(
+                "%s instance matching query does not exist:\nQuery: %s" % (cls, pk)
+            )
+        return inst
+
     @classmethod
     def delete(cls, **delete):
         """
@@ -330,6 +514,17 @@ class Model(with_metaclass(ModelBase, name=MODEL_BASE_NAME)):
             )
         return deleted
 
+    @classmethod
+    async def adelete_by_id(cls, pk):
+        """`delete_by_id`的协程版本。"""
+        delete = ModelDelete(cls, cls._meta.primary_key.__key__(pk))
+        deleted = await delete.aexecute()
+        if deleted is False:
+            raise cls.DoesNotExist(
+                "%s instance matching query does not exist:\nQuery: %s" % (cls, pk)
+            )
+        return deleted
+
 
 class _RowScanner(object):
     """
@@ -364,6 +559,14 @@ class _RowScanner(object):
                 yield model, row
 
 
+# the header of the payloads of the models which revalidate:
+# magic, expiration timestamp, and the duration of the load.
+_FRESHNESS = struct.Struct(">4sdd")
+_FRESHNESS_MAGIC = b"\xc3swr"
+# the payload of the keys the loader confirmed missing, see `Metadata.negative_ttl`.
+TOMBSTONE = b"\xc3nil"
+
+
 class CacheBuilder(object):
     def __init__(self, model, row=None, instance=None):
         self.model = model
@@ -371,6 +574,9 @@ class CacheBuilder(object):
             instance = model(**(row or {}))
         self._instance = instance
         self._index = model._index_manager.get_primary_key_index()
+        # the freshness of the payload, see `Metadata.revalidates`.
+        self.expire_at = None
+        self.delta = 0.0
 
     def set_instance(self, instance):
         self._instance = instance
@@ -401,7 +607,7 @@ class CacheBuilder(object):
             values.append(field.cache_value(value))
         return self._index.formatter.f(*values)
 
-    def build_payload(self):
+    def cache_values(self):
         payload = {}
         for name, field in self.model._meta.fields.items():
             if name in self._index.field_names:
@@ -409,10 +615,30 @@ class CacheBuilder(object):
             value = self._get_field_value(field, nullable=True)
             if value is not None:
                 payload.update({name: field.cache_value(value)})
-        return self.model._meta.serializer.dumps(payload)
+        return payload
+
+    def dumps(self, payload):
+        s = self.model._meta.serializer.dumps(payload)
+        if self.model._meta.compression is not None:
+            s = self.model._meta.compression.compress(s)
+        if self.model._meta.revalidates:
+            ttl = self.model._meta.fresh_ttl
+            expire_at = time.time() + ttl if ttl else 0
+            s = _FRESHNESS.pack(_FRESHNESS_MAGIC, expire_at, self.delta) + s
+        return s
 
-    def load_payload(self, s, on_conflict_update=True):
-        payload = self.model._meta.serializer.loads(s)
+    def build_payload(self):
+        return self.dumps(self.cache_values())
+
+    def loads(self, s):
+        if self.model._meta.revalidates and s[:4] == _FRESHNESS_MAGIC:
+            _, self.expire_at, self.delta = _FRESHNESS.unpack_from(s)
+            s = s[_FRESHNESS.size :]
+        if self.model._meta.compression is not None:
+            s = self.model._meta.compression.decompress(s)
+        return self.model._meta.serializer.loads(s)
+
+    def python_values(self, payload, on_conflict_update=True):
         for name, field in self.model._meta.fields.items():
             if name in self._index.field_names:
                 continue
@@ -422,6 +648,437 @@ class CacheBuilder(object):
             # TODO: 如果使用Protobuf serializer，有可能字段值是不是null，但是payload中没有对应的值
             #  因为Protobuf不会存储字段的默认值，例如int型值为0时。
 
+    def load_payload(self, s, on_conflict_update=True):
+        self.python_values(self.loads(s), on_conflict_update=on_conflict_update)
+
+
+def _sync(rv):
+    if inspect.isawaitable(rv):
+        rv.close()
+        raise TypeError("asyncio backend only supports `aexecute`")
+    return rv
+
+
+async def _resolve(rv):
+    if inspect.isawaitable(rv):
+        return await rv
+    return rv
+
+
+def _gather(calls):
+    """Awaits the calls of the different backends concurrently."""
+    return asyncio.gather(*[_resolve(rv) for rv in calls])
+
+
+def _metered(builders):
+    return any(b.model._meta.metrics is not None for b in builders)
+
+
+def _record(operation, builders, latency, read=None, written=None):
+    """Records a backend round trip to the ``Meta.metrics`` of the models."""
+    stats = {}
+    for i, b in enumerate(builders):
+        if b.model._meta.metrics is None:
+            continue
+        s = stats.setdefault(b.model, [0, 0, 0, 0, 0, 0])
+        s[0] += 1
+        if read is not None:
+            if read[i] is None:
+                s[2] += 1
+            elif read[i] == TOMBSTONE:
+                s[5] += 1
+            else:
+                s[1] += 1
+                s[3] += len(read[i])
+        if written is not None:
+            s[4] += len(written[i])
+    for model, s in stats.items():
+        keys, hits, misses, bytes_in, bytes_out, tombstones = s
+        model._meta.metrics.record(
+            "model",
+            model._meta.name,
+            operation,
+            latency,
+            keys=keys,
+            hits=hits,
+            misses=misses,
+            bytes_in=bytes_in,
+            bytes_out=bytes_out,
+            tombstones=tombstones,
+        )
+
+
+def _finish(operation, builders, span, started, rv, read, written):
+    latency = time.perf_counter() - started
+    _end_span(span)
+    if _metered(builders):
+        _record(operation, builders, latency, rv if read else None, written)
+    return rv
+
+
+async def _afinish(operation, builders, span, started, rv, read, written):
+    try:
+        rv = await rv
+    except BaseException:
+        _end_span(span)
+        raise
+    return _finish(operation, builders, span, started, rv, read, written)
+
+
+def _end_span(span):
+    if span is not None:
+        span.end()
+
+
+class _AsyncCall(object):
+    """The pending call of an asyncio backend, which `_sync` closes without
+    awaiting it."""
+
+    __slots__ = ("_finish", "_rv", "_span")
+
+    def __init__(self, finish, rv, span):
+        self._finish = finish
+        self._rv = rv
+        self._span = span
+
+    def __await__(self):
+        return self._finish.__await__()
+
+    def close(self):
+        self._finish.close()
+        # the call of the backend too, or it warns it was never awaited.
+        if inspect.iscoroutine(self._rv):
+            self._rv.close()
+        _end_span(self._span)
+
+
+def _call_backend(operation, builders, method, *args, read=False, written=None, **kw):
+    """Calls a backend method, and records its metrics and its trace span."""
+    tracer = tracing.current_tracer()
+    if tracer is None and not _metered(builders):
+        return method(*args, **kw)
+    span = None
+    if tracer is not None:
+        span = tracer.start_span("backend", method=method.__name__, keys=len(builders))
+    started = time.perf_counter()
+    try:
+        rv = method(*args, **kw)
+    except BaseException:
+        # the failed calls end their span too, or the callbacks leak it.
+        _end_span(span)
+        raise
+    if inspect.isawaitable(rv):
+        return _AsyncCall(
+            _afinish(operation, builders, span, started, rv, read, written), rv, span
+        )
+    return _finish(operation, builders, span, started, rv, read, written)
+
+
+def _build_keys(builders):
+    with tracing.stage("build_key", keys=len(builders)):
+        return [b.build_key() for b in builders]
+
+
+def _build_payloads(builders):
+    with tracing.stage("cache_value", keys=len(builders)):
+        values = [b.cache_values() for b in builders]
+    with tracing.stage("dumps", keys=len(builders)):
+        return [b.dumps(v) for b, v in zip(builders, values)]
+
+
+def _set_builders(backend, ttl, builders, operation="insert"):
+    keys, payloads = _build_keys(builders), _build_payloads(builders)
+    mapping = dict(zip(keys, payloads))
+    if len(mapping) == 1:
+        # faster way when only one key/value to set
+        key, payload = mapping.popitem()
+        return _call_backend(
+            operation, builders, backend.set, key, payload, ttl=ttl, written=payloads
+        )
+    return _call_backend(
+        operation, builders, backend.set_many, mapping, ttl=ttl, written=payloads
+    )
+
+
+def _write_builders(backend, ttl, builders, operation="insert"):
+    """Sets the builders, or queues them in the current :func:`batch`."""
+    current = _current_batch.get()
+    if current is None:
+        return _set_builders(backend, ttl, builders, operation)
+    return current._set(backend, ttl, builders)
+
+
+def _add_builders(backend, ttl, builders):
+    keys, payloads = _build_keys(builders), _build_payloads(builders)
+    return _call_backend(
+        "insert_if_absent",
+        builders,
+        backend.add_many,
+        dict(zip(keys, payloads)),
+        ttl=ttl,
+        written=payloads,
+    )
+
+
+def _get_builders(backend, builders, operation="query"):
+    keys = _build_keys(builders)
+    return _call_backend(operation, builders, backend.get_many, *keys, read=True)
+
+
+def _delete_builders(backend, builders):
+    current = _current_batch.get()
+    if current is not None:
+        return current._delete(backend, builders)
+    keys = _build_keys(builders)
+    return _call_backend("delete", builders, backend.delete_many, *keys)
+
+
+def _overlay(backend, builders, payloads):
+    """Reads the writes queued in the current :func:`batch` over `payloads`."""
+    current = _current_batch.get()
+    if current is None:
+        return payloads
+    return current._overlay(backend, builders, payloads)
+
+
+def _overwritable(builders, added):
+    """Returns the builders whose add failed, maybe on a tombstone."""
+    return [
+        b
+        for b in builders
+        if not added[b.build_key()] and b.model._meta.negative_ttl is not None
+    ]
+
+
+def _tombstoned(builders, payloads):
+    return [b for b, payload in zip(builders, payloads) if payload == TOMBSTONE]
+
+
+def _add_queued(backend, ttl, builders):
+    """Adds the builders whose key is queued in the current :func:`batch`,
+    returns their results and the builders left to the backend."""
+    current = _current_batch.get()
+    if current is None:
+        return {}, builders
+    return current._add(backend, ttl, builders)
+
+
+def _add_over_tombstones(backend, ttl, builders):
+    """Adds the builders, and overwrites the tombstones, which are not
+    records, see `Metadata.negative_ttl`.
+
+    The overwrite is a get then a set, not atomic: the concurrent inserts
+    of a tombstoned key may all report created, the last write wins.
+    """
+    added, builders = _add_queued(backend, ttl, builders)
+    if not builders:
+        return added
+    added.update(_sync(_add_builders(backend, ttl, builders)))
+    candidates = _overwritable(builders, added)
+    if candidates:
+        payloads = _sync(_get_builders(backend, candidates, "insert_if_absent"))
+        tombstoned = _tombstoned(candidates, payloads)
+        if tombstoned:
+            _sync(_set_builders(backend, ttl, tombstoned, "insert_if_absent"))
+            added.update((b.build_key(), True) for b in tombstoned)
+    return added
+
+
+async def _aadd_over_tombstones(backend, ttl, builders):
+    added, builders = _add_queued(backend, ttl, builders)
+    if not builders:
+        return added
+    added.update(await _resolve(_add_builders(backend, ttl, builders)))
+    candidates = _overwritable(builders, added)
+    if candidates:
+        payloads = await _resolve(
+            _get_builders(backend, candidates, "insert_if_absent")
+        )
+        tombstoned = _tombstoned(candidates, payloads)
+        if tombstoned:
+            await _resolve(_set_builders(backend, ttl, tombstoned, "insert_if_absent"))
+            added.update((b.build_key(), True) for b in tombstoned)
+    return added
+
+
+def _load_added(builders, added):
+    for b in builders:
+        if not added[b.build_key()]:
+            b.set_instance(None)
+
+
+def _load_builders(builders, payloads, on_conflict_update=True):
+    with tracing.stage("loads", keys=len(builders)):
+        values = [
+            None if p is None or p == TOMBSTONE else b.loads(p)
+            for p, b in zip(payloads, builders)
+        ]
+    with tracing.stage("python_value", keys=len(builders)):
+        for value, b in zip(values, builders):
+            if value is None:
+                b.set_instance(None)
+                continue
+            b.python_values(value, on_conflict_update=on_conflict_update)
+
+
+def _misses(builders, payloads):
+    """Returns the missing keys of the models with a loader, as
+    ``{model: {cache_key: (builder, pk)}}``."""
+    misses = defaultdict(dict)
+    for b, payload in zip(builders, payloads):
+        if payload is None and b.model._meta.loader is not None:
+            misses[b.model][b.build_key()] = (b, b.get_instance().get_id())
+    return misses
+
+
+def _loaded_builders(model, rows, delta):
+    builders = []
+    for row in rows or ():
+        if isinstance(row, model):
+            builder = CacheBuilder(model, instance=row)
+        else:
+            builder = CacheBuilder(model, row=row)
+        builder.delta = delta
+        builders.append(builder)
+    return builders
+
+
+def _write_tombstones(model, keys, builders):
+    """Writes the tombstones of the `keys` the loader didn't return, with
+    `add_many`, so that a row inserted while loading is never hidden."""
+    meta = model._meta
+    if meta.negative_ttl is None:
+        return None
+    loaded = {b.build_key() for b in builders}
+    missing = {key: pk for key, pk in keys.items() if key not in loaded}
+    if not missing:
+        return None
+    tombstones = [
+        CacheBuilder(model, row=meta.primary_key.__key__(pk)) for pk in missing.values()
+    ]
+    return _call_backend(
+        "load",
+        tombstones,
+        meta.backend.add_many,
+        dict.fromkeys(missing, TOMBSTONE),
+        ttl=meta.negative_ttl,
+        written=[TOMBSTONE] * len(missing),
+    )
+
+
+def _load(model, keys):
+    """Loads the rows of `keys`, ``{cache_key: pk}``, with one ``Meta.loader``
+    call, writes them back to the backend, and the tombstones of the missing
+    ones."""
+    meta = model._meta
+    started = time.perf_counter()
+    with tracing.stage("loader", keys=len(keys)):
+        rows = _sync(meta.loader(list(keys.values())))
+    builders = _loaded_builders(model, rows, time.perf_counter() - started)
+    if builders:
+        _sync(_set_builders(meta.backend, meta.storage_ttl, builders, "load"))
+    _sync(_write_tombstones(model, keys, builders))
+    return builders
+
+
+async def _aload(model, keys):
+    meta = model._meta
+    started = time.perf_counter()
+    with tracing.stage("loader", keys=len(keys)):
+        rows = await _resolve(meta.loader(list(keys.values())))
+    builders = _loaded_builders(model, rows, time.perf_counter() - started)
+    if builders:
+        await _resolve(_set_builders(meta.backend, meta.storage_ttl, builders, "load"))
+    await _resolve(_write_tombstones(model, keys, builders))
+    return builders
+
+
+def _fill(missing, builders):
+    for loaded in builders:
+        key = loaded.build_key()
+        if key in missing:
+            missing[key][0].set_instance(loaded.get_instance())
+
+
+def _stale(builders):
+    """Returns the keys to refresh in the background, as
+    ``{model: {cache_key: pk}}``: the expired payloads served while stale,
+    and the ones expiring soon, with the probabilistic early expiration of
+    XFetch, which refreshes the slow to load payloads earlier."""
+    now = time.time()
+    stale = defaultdict(dict)
+    for b in builders:
+        if not b.expire_at:
+            continue
+        instance = b.get_instance()
+        if instance is None:
+            continue
+        beta = b.model._meta.early_refresh or 0
+        if now - b.delta * beta * math.log(1.0 - random.random()) >= b.expire_at:
+            stale[b.model][b.build_key()] = instance.get_id()
+    return stale
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_refresher = None
+
+
+def _claim(keys):
+    """Claims the keys nobody is refreshing."""
+    with _refreshing_lock:
+        keys = {k: pk for k, pk in keys.items() if k not in _refreshing}
+        _refreshing.update(keys)
+    return keys
+
+
+def _release(keys):
+    with _refreshing_lock:
+        _refreshing.difference_update(keys)
+
+
+def _refresh(model, keys):
+    try:
+        _load(model, keys)
+    finally:
+        _release(keys)
+
+
+def _log_refresh_error(future):
+    """Logs the failure of a background refresh, nobody waits for it."""
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        logger.warning("background refresh failed", exc_info=exc)
+
+
+def _revalidate(builders):
+    global _refresher
+    for model, keys in _stale(builders).items():
+        keys = _claim(keys)
+        if not keys:
+            continue
+        with _refreshing_lock:
+            if _refresher is None:
+                _refresher = ThreadPoolExecutor(4, thread_name_prefix="cacheorm")
+        _refresher.submit(_refresh, model, keys).add_done_callback(_log_refresh_error)
+
+
+_refreshing_tasks = set()
+
+
+def _arevalidate(builders):
+    for model, keys in _stale(builders).items():
+        keys = _claim(keys)
+        if not keys:
+            continue
+        task = asyncio.ensure_future(_aload(model, keys))
+        _refreshing_tasks.add(task)
+        task.add_done_callback(_refreshing_tasks.discard)
+        task.add_done_callback(lambda _, keys=keys: _release(keys))
+        task.add_done_callback(_log_refresh_error)
+
 
 class Insert(object):
     # TODO(leosocy): support chunk_size
@@ -434,28 +1091,51 @@ class Insert(object):
         """
         self._insert_list = insert_list
 
-    def execute(self):
+    def _group(self):
         builders = []
         group_by_meta = defaultdict(list)
         for model, row in _RowScanner.scan(self._insert_list):
             builder = CacheBuilder(model, row=row)
             builders.append(builder)
             meta = model._meta
-            group_by_meta[(meta.backend, meta.ttl)].append(builder)
-        if len(group_by_meta) == 1:
-            backend, ttl = list(group_by_meta.keys())[0]
-            builder = list(group_by_meta.values())[0][0]
-            backend.set(builder.build_key(), builder.build_payload(), ttl=ttl)
-        for (backend, ttl), bs in group_by_meta.items():
-            if len(bs) == 1:
-                # faster way when only one key/value to set
-                b = bs[0]
-                backend.set(b.build_key(), b.build_payload(), ttl=ttl)
-            else:
-                backend.set_many(
-                    {b.build_key(): b.build_payload() for b in bs}, ttl=ttl
-                )
-        return [builder.get_instance() for builder in builders]
+            group_by_meta[(meta.backend, meta.storage_ttl)].append(builder)
+        return builders, group_by_meta
+
+    def execute(self):
+        with tracing.stage("insert"):
+            builders, group_by_meta = self._group()
+            for (backend, ttl), bs in group_by_meta.items():
+                _sync(_write_builders(backend, ttl, bs))
+            return [builder.get_instance() for builder in builders]
+
+    async def aexecute(self):
+        with tracing.stage("insert"):
+            builders, group_by_meta = self._group()
+            await _gather(
+                _write_builders(backend, ttl, bs)
+                for (backend, ttl), bs in group_by_meta.items()
+            )
+            return [builder.get_instance() for builder in builders]
+
+
+class InsertIfAbsent(Insert):
+    def execute(self):
+        with tracing.stage("insert_if_absent"):
+            builders, group_by_meta = self._group()
+            for (backend, ttl), bs in group_by_meta.items():
+                _load_added(bs, _add_over_tombstones(backend, ttl, bs))
+            return [builder.get_instance() for builder in builders]
+
+    async def aexecute(self):
+        with tracing.stage("insert_if_absent"):
+            builders, group_by_meta = self._group()
+            groups = list(group_by_meta.items())
+            results = await _gather(
+                _aadd_over_tombstones(backend, ttl, bs) for (backend, ttl), bs in groups
+            )
+            for (_, bs), added in zip(groups, results):
+                _load_added(bs, added)
+            return [builder.get_instance() for builder in builders]
 
 
 class Query(object):
@@ -467,22 +1147,48 @@ class Query(object):
         """
         self._query_list = query_list
 
-    def execute(self):
+    def _group(self):
         builders = []
         group_by_backend = defaultdict(list)
         for model, row in _RowScanner.scan(self._query_list):
             builder = CacheBuilder(model, row=row)
             builders.append(builder)
             group_by_backend[model._meta.backend].append(builder)
-        for backend, bs in group_by_backend.items():
-            cache_keys = [b.build_key() for b in bs]
-            payloads = backend.get_many(*cache_keys)
-            for payload, b in zip(payloads, bs):
-                if payload is None:
-                    b.set_instance(None)
-                    continue
-                b.load_payload(payload)
-        return [builder.get_instance() for builder in builders]
+        return builders, group_by_backend
+
+    def execute(self):
+        with tracing.stage("query"):
+            builders, group_by_backend = self._group()
+            for backend, bs in group_by_backend.items():
+                payloads = _overlay(backend, bs, _sync(_get_builders(backend, bs)))
+                misses = _misses(bs, payloads)
+                _load_builders(bs, payloads)
+                for model, missing in misses.items():
+                    keys = {key: pk for key, (_, pk) in missing.items()}
+                    _fill(missing, _load(model, keys))
+                _revalidate(bs)
+            return [builder.get_instance() for builder in builders]
+
+    async def aexecute(self):
+        with tracing.stage("query"):
+            builders, group_by_backend = self._group()
+            groups = list(group_by_backend.items())
+            results = await _gather(
+                _get_builders(backend, bs) for backend, bs in groups
+            )
+            misses = {}
+            for (backend, bs), payloads in zip(groups, results):
+                payloads = _overlay(backend, bs, payloads)
+                misses.update(_misses(bs, payloads))
+                _load_builders(bs, payloads)
+            loaded = await _gather(
+                _aload(model, {key: pk for key, (_, pk) in missing.items()})
+                for model, missing in misses.items()
+            )
+            for missing, bs in zip(misses.values(), loaded):
+                _fill(missing, bs)
+            _arevalidate(builders)
+            return [builder.get_instance() for builder in builders]
 
 
 class Update(object):
@@ -494,7 +1200,7 @@ class Update(object):
         """
         self._update_list = update_list
 
-    def execute(self):
+    def _group(self):
         builders = []
         group_by_backend = defaultdict(list)
         group_by_meta = defaultdict(list)
@@ -503,41 +1209,354 @@ class Update(object):
             builders.append(builder)
             meta = model._meta
             group_by_backend[meta.backend].append(builder)
-            group_by_meta[(meta.backend, meta.ttl)].append(builder)
-        for backend, bs in group_by_backend.items():
-            cache_keys = [b.build_key() for b in bs]
-            payloads = backend.get_many(*cache_keys)
-            for payload, b in zip(payloads, bs):
-                if payload is None:
-                    b.set_instance(None)
-                    continue
-                b.load_payload(payload, on_conflict_update=False)
+            group_by_meta[(meta.backend, meta.storage_ttl)].append(builder)
+        return builders, group_by_backend, group_by_meta
+
+    @staticmethod
+    def _existing(group_by_meta):
         for (backend, ttl), bs in group_by_meta.items():
-            mapping = {}
-            for b in bs:
-                if b.get_instance() is not None:
-                    mapping[b.build_key()] = b.build_payload()
-            if len(mapping) == 1:
-                backend.set(*mapping.popitem(), ttl=ttl)
-            elif len(mapping) > 1:
-                backend.set_many(mapping, ttl=ttl)
-        return [builder.get_instance() for builder in builders]
+            bs = [b for b in bs if b.get_instance() is not None]
+            if bs:
+                yield backend, ttl, bs
+
+    def execute(self):
+        with tracing.stage("update"):
+            builders, group_by_backend, group_by_meta = self._group()
+            for backend, bs in group_by_backend.items():
+                payloads = _sync(_get_builders(backend, bs, "update"))
+                payloads = _overlay(backend, bs, payloads)
+                _load_builders(bs, payloads, on_conflict_update=False)
+            for backend, ttl, bs in self._existing(group_by_meta):
+                _sync(_write_builders(backend, ttl, bs, "update"))
+            return [builder.get_instance() for builder in builders]
+
+    async def aexecute(self):
+        with tracing.stage("update"):
+            builders, group_by_backend, group_by_meta = self._group()
+            groups = list(group_by_backend.items())
+            results = await _gather(
+                _get_builders(backend, bs, "update") for backend, bs in groups
+            )
+            for (backend, bs), payloads in zip(groups, results):
+                payloads = _overlay(backend, bs, payloads)
+                _load_builders(bs, payloads, on_conflict_update=False)
+            await _gather(
+                _write_builders(backend, ttl, bs, "update")
+                for backend, ttl, bs in self._existing(group_by_meta)
+            )
+            return [builder.get_instance() for builder in builders]
 
 
 class Delete(object):
     def __init__(self, delete_list):
         self._delete_list = delete_list
 
-    def execute(self):
+    def _group(self):
         group_by_backend = defaultdict(list)
         for model, row in _RowScanner.scan(self._delete_list):
             builder = CacheBuilder(model, row=row)
             group_by_backend[model._meta.backend].append(builder)
-        return all(
-            backend.delete_many(*[b.build_key() for b in bs])
-            for backend, bs in group_by_backend.items()
+        return group_by_backend
+
+    def execute(self):
+        with tracing.stage("delete"):
+            # deletes from every backend, even if some keys are missing.
+            results = [
+                _sync(_delete_builders(backend, bs))
+                for backend, bs in self._group().items()
+            ]
+            return all(results)
+
+    async def aexecute(self):
+        with tracing.stage("delete"):
+            results = await _gather(
+                _delete_builders(backend, bs) for backend, bs in self._group().items()
+            )
+            return all(results)
+
+
+_current_batch = contextvars.ContextVar("cacheorm_batch", default=None)
+
+
+class Batch(object):
+    """A unit of work, see :func:`batch`."""
+
+    def __init__(self):
+        # {backend: {key: (builder, payload, ttl)}}, a ``None`` payload is a
+        # delete, the last operation of a key wins.
+        self._writes = defaultdict(dict)
+        self._token = None
+
+    def _queue(self, backend, keys, builders, payloads, ttl):
+        writes = self._writes[backend]
+        for key, builder, payload in zip(keys, builders, payloads):
+            writes[key] = (builder, payload, ttl)
+        return True
+
+    def _set(self, backend, ttl, builders):
+        keys, payloads = _build_keys(builders), _build_payloads(builders)
+        return self._queue(backend, keys, builders, payloads, ttl)
+
+    def _delete(self, backend, builders):
+        keys = _build_keys(builders)
+        return self._queue(backend, keys, builders, [None] * len(keys), None)
+
+    def _add(self, backend, ttl, builders):
+        writes = self._writes.get(backend) or {}
+        added, pending = {}, []
+        for builder in builders:
+            key = builder.build_key()
+            write = writes.get(key)
+            if write is None:
+                pending.append(builder)
+            elif write[1] is None:
+                # the key will be deleted, the add takes the place of the delete.
+                added[key] = self._set(backend, ttl, [builder])
+            else:
+                added[key] = False
+        return added, pending
+
+    def _overlay(self, backend, builders, payloads):
+        writes = self._writes.get(backend)
+        if not writes:
+            return payloads
+        payloads = list(payloads)
+        for i, builder in enumerate(builders):
+            write = writes.get(builder.build_key())
+            if write is not None:
+                payloads[i] = write[1]
+        return payloads
+
+    def _flushes(self):
+        writes, self._writes = self._writes, defaultdict(dict)
+        for backend, queued in writes.items():
+            mappings, deletes = defaultdict(dict), []
+            builders, written = [], []
+            for key, (builder, payload, ttl) in queued.items():
+                builders.append(builder)
+                if payload is None:
+                    deletes.append(key)
+                    written.append(b"")
+                else:
+                    mappings[ttl][key] = payload
+                    written.append(payload)
+            yield _call_backend(
+                "batch",
+                builders,
+                backend.write_batch,
+                dict(mappings),
+                deletes,
+                written=written,
+            )
+
+    def flush(self):
+        """Sends the queued writes, one `write_batch` per backend."""
+        with tracing.stage("batch"):
+            for rv in self._flushes():
+                _sync(rv)
+
+    async def aflush(self):
+        with tracing.stage("batch"):
+            await _gather(self._flushes())
+
+    def __enter__(self):
+        self._token = _current_batch.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_batch.reset(self._token)
+        if exc_type is None:
+            self.flush()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        _current_batch.reset(self._token)
+        if exc_type is None:
+            await self.aflush()
+
+
+def batch():
+    """Returns a unit of work: inside it, the insert, update and delete
+    operations of every model are queued instead of sent, and sent on exit
+    grouped by backend, with one `write_batch` per backend, a MULTI/EXEC
+    pipeline on Redis. The last write or delete of a key wins, and the query
+    and update operations inside it read the queued writes. The queued writes
+    are dropped if the context raises.
+
+    `insert_if_absent` relies on the atomic add of the backends, it is sent
+    at once, except for the keys queued in the unit of work: a key with a
+    queued write exists, and the add of a key with a queued delete is queued
+    in place of the delete. Every thread and asyncio task has its own unit of work, use
+    ``async with co.batch():`` with the asyncio backends.
+
+    >>> with co.batch():
+    ...     user.save()
+    ...     article.save()
+    ...     Collection.create(collector=user, article=article)
+    """
+    return Batch()
+
+
+_current_dataloader = contextvars.ContextVar("cacheorm_dataloader", default=None)
+_thread_dataloaders = threading.local()
+_loop_dataloaders = weakref.WeakKeyDictionary()
+
+
+class _LazyFuture(Future):
+    """A future of a :class:`DataLoader` load, resolving it dispatches the
+    pending loads."""
+
+    def __init__(self, dataloader):
+        super(_LazyFuture, self).__init__()
+        self._dataloader = dataloader
+
+    def result(self, timeout=None):
+        if not self.done():
+            self._dataloader.dispatch()
+        return super(_LazyFuture, self).result(timeout)
+
+    def exception(self, timeout=None):
+        if not self.done():
+            self._dataloader.dispatch()
+        return super(_LazyFuture, self).exception(timeout)
+
+
+class DataLoader(object):
+    """Collects the loads of primary keys from different call sites, and
+    queries them together, deduplicated, with one `Query` whose keys are
+    read with one `get_many` per backend.
+
+    - In a coroutine, `load` returns an awaitable future, and the loads of a
+      tick of the event loop are queried together, at the next tick.
+    - Otherwise, `load` returns a :class:`concurrent.futures.Future`, and
+      the pending loads are queried together as soon as one of their results
+      is needed, or when the scope exits.
+
+    The default data loader is per event loop or per thread, use a data
+    loader as a context manager to scope the batching to a request::
+
+        with co.DataLoader():
+            futures = [Article.loader().load(pk) for pk in (1, 2, 3)]
+            articles = [f.result() for f in futures]
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._apending = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._token = None
+
+    @staticmethod
+    def current():
+        """Returns the data loader of the current scope, or the default one
+        of the running event loop or of the current thread."""
+        dataloader = _current_dataloader.get()
+        if dataloader is not None:
+            return dataloader
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            dataloader = getattr(_thread_dataloaders, "dataloader", None)
+            if dataloader is None:
+                dataloader = _thread_dataloaders.dataloader = DataLoader()
+            return dataloader
+        dataloader = _loop_dataloaders.get(loop)
+        if dataloader is None:
+            dataloader = _loop_dataloaders[loop] = DataLoader()
+        return dataloader
+
+    def load(self, model, pk):
+        """Returns a future of the instance of `model` whose primary key is
+        `pk`, or ``None``."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            pending = self._pending if loop is None else self._apending
+            future = pending.get((model, pk))
+            if future is None:
+                if loop is None:
+                    future = _LazyFuture(self)
+                else:
+                    if not self._apending:
+                        loop.call_soon(self._adispatch)
+                    future = loop.create_future()
+                pending[(model, pk)] = future
+        if loop is not None:
+            # the callers share the future, but cancelling one mustn't cancel
+            # the others.
+            return asyncio.shield(future)
+        return future
+
+    @staticmethod
+    def _query(pending):
+        return Query(
+            [(model, (model._meta.primary_key.__key__(pk),)) for model, pk in pending]
         )
 
+    @staticmethod
+    def _resolve(pending, instances):
+        for future, instance in zip(pending.values(), instances):
+            if not future.done():
+                future.set_result(instance)
+
+    @staticmethod
+    def _fail(pending, error):
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def dispatch(self):
+        """Queries the pending loads outside of the coroutines."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            instances = self._query(pending).execute()
+        except Exception as e:
+            self._fail(pending, e)
+        else:
+            self._resolve(pending, instances)
+
+    def _adispatch(self):
+        with self._lock:
+            pending, self._apending = self._apending, {}
+        task = asyncio.ensure_future(self._aquery(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _aquery(self, pending):
+        try:
+            instances = await self._query(pending).aexecute()
+        except Exception as e:
+            self._fail(pending, e)
+        else:
+            self._resolve(pending, instances)
+
+    def __enter__(self):
+        self._token = _current_dataloader.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_dataloader.reset(self._token)
+        self.dispatch()
+
+
+class ModelLoader(object):
+    """The loads of a model in a :class:`DataLoader`, see `Model.loader`."""
+
+    def __init__(self, model, dataloader):
+        self.model = model
+        self.dataloader = dataloader
+
+    def load(self, pk):
+        return self.dataloader.load(self.model, pk)
+
 
 class _ModelOpHelper(object):
     def __init__(self, model, rows):
@@ -560,11 +1579,19 @@ class _ModelOpHelper(object):
         instances = super(_ModelOpHelper, self).execute()
         return instances[0] if self._single else instances
 
+    async def aexecute(self):
+        instances = await super(_ModelOpHelper, self).aexecute()
+        return instances[0] if self._single else instances
+
 
 class ModelInsert(_ModelOpHelper, Insert):
     pass
 
 
+class ModelInsertIfAbsent(_ModelOpHelper, InsertIfAbsent):
+    pass
+
+
 class ModelQuery(_ModelOpHelper, Query):
     pass
 
@@ -576,3 +1603,6 @@ class ModelUpdate(_ModelOpHelper, Update):
 class ModelDelete(_ModelOpHelper, Delete):
     def execute(self):
         return super(_ModelOpHelper, self).execute()
+
+    async def aexecute(self):
+        return await super(_ModelOpHelper, self).aexecute()
@@ -0,0 +1,160 @@
+import contextlib
+import contextvars
+import time
+from collections import defaultdict
+
+_current_tracer = contextvars.ContextVar("cacheorm_tracer", default=None)
+_current_span = contextvars.ContextVar("cacheorm_span", default=None)
+_NOOP = contextlib.nullcontext()
+
+
+class Span(object):
+    """A timed stage of an operation, such as ``build_key``, ``dumps`` or
+    ``backend``. The times are nanoseconds since the epoch, like the ones
+    of OpenTelemetry.
+    """
+
+    __slots__ = ("name", "parent", "attributes", "start_time", "end_time", "_tracer")
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self._tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes or {}
+        self.start_time = time.time_ns()
+        self.end_time = None
+
+    @property
+    def duration(self):
+        """The duration in seconds, ``None`` until the span ends."""
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) / 1e9
+
+    def end(self):
+        self.end_time = time.time_ns()
+        self._tracer._end(self)
+
+    def __repr__(self):
+        return "<Span: %s %s>" % (self.name, self.attributes)
+
+
+class TraceCallback(object):  # pragma: no cover
+    """Receives the spans of a trace as they start and end, like the
+    ``SpanProcessor`` of OpenTelemetry, see :class:`OpenTelemetryCallback`.
+    """
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        pass
+
+
+class Tracer(object):
+    """Collects the spans of the operations run inside :func:`trace`.
+
+    :param callbacks: the :class:`TraceCallback` notified of the spans.
+    """
+
+    def __init__(self, callbacks=()):
+        self.spans = []
+        self.callbacks = list(callbacks)
+
+    def start_span(self, name, **attributes):
+        span = Span(self, name, _current_span.get(), attributes)
+        for callback in self.callbacks:
+            callback.on_start(span)
+        return span
+
+    def _end(self, span):
+        self.spans.append(span)
+        for callback in self.callbacks:
+            callback.on_end(span)
+
+    @contextlib.contextmanager
+    def stage(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def summary(self):
+        """Returns the total duration in seconds of the spans by name."""
+        rv = defaultdict(float)
+        for span in self.spans:
+            rv[span.name] += span.duration
+        return dict(rv)
+
+
+@contextlib.contextmanager
+def trace(*callbacks):
+    """Traces the operations run in the context, in the current thread or
+    asyncio task and the tasks it creates.
+
+    >>> with trace() as t:
+    ...     User.query_many({"id": 1}, {"id": 2}).execute()
+    >>> t.summary()
+    {'build_key': ..., 'backend': ..., 'loads': ..., 'python_value': ..., ...}
+
+    :param callbacks: the :class:`TraceCallback` notified of the spans.
+    """
+    tracer = Tracer(callbacks)
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+def current_tracer():
+    """Returns the :class:`Tracer` of the current context, or ``None``."""
+    return _current_tracer.get()
+
+
+def stage(name, **attributes):
+    """Returns a context manager recording a span of the current trace,
+    which does nothing when there is no trace.
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return _NOOP
+    return tracer.stage(name, **attributes)
+
+
+class OpenTelemetryCallback(TraceCallback):
+    """Mirrors the spans to OpenTelemetry, as children of the current
+    OpenTelemetry span.
+
+    :param tracer_provider: an optional OpenTelemetry ``TracerProvider``,
+                            defaults to the global one.
+    """
+
+    def __init__(self, tracer_provider=None):
+        try:
+            from opentelemetry import trace as otel_trace
+        except ImportError:  # pragma: no cover
+            raise ModuleNotFoundError("no opentelemetry module found")
+        self._otel_trace = otel_trace
+        self._tracer = otel_trace.get_tracer(
+            "cacheorm", tracer_provider=tracer_provider
+        )
+        self._spans = {}
+
+    def on_start(self, span):
+        parent = self._spans.get(span.parent)
+        context = None
+        if parent is not None:
+            context = self._otel_trace.set_span_in_context(parent)
+        self._spans[span] = self._tracer.start_span(
+            span.name,
+            context=context,
+            attributes=span.attributes,
+            start_time=span.start_time,
+        )
+
+    def on_end(self, span):
+        self._spans.pop(span).end(end_time=span.end_time)
@@ -1,9 +1,23 @@
 import os
+import time
 
 import cacheorm as co
 import pytest
 
 
+@pytest.fixture()
+def wait_until():
+    """Returns a function polling a predicate until it is true."""
+
+    def wait(predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+
+    return wait
+
+
 @pytest.fixture()
 def redis_client_args():
     host = os.getenv("TEST_BACKENDS_REDIS_HOST", "localhost")
@@ -34,21 +48,72 @@ def memcached_client(memcached_client_args):
     import pylibmc
 
     client = pylibmc.Client(
-        ["{}:{}".format(*s) for s in memcached_client_args["servers"]]
+        ["{}:{}".format(*s) for s in memcached_client_args["servers"]],
+        behaviors={"cas": True},
     )
     client.flush_all()
     yield client
     client.flush_all()
 
 
-@pytest.fixture(params=("simple", "redis", "memcached"))
-def backend(redis_client, memcached_client, request):
-    if request.param == "simple":
-        return co.SimpleBackend()
-    elif request.param == "redis":
-        return co.RedisBackend(client=redis_client)
-    elif request.param == "memcached":
-        return co.MemcachedBackend(client=memcached_client)
+@pytest.fixture(
+    params=(
+        "simple",
+        "concurrent_simple",
+        "filesystem",
+        "shared_memory",
+        "sqlite",
+        "tiered",
+        "sharded",
+        "redis",
+        "memcached",
+        "pipelined_memcached",
+        "metrics",
+        "resilient",
+        "coalescing",
+        "write_behind",
+    )
+)
+def backend(redis_client, memcached_client, memcached_client_args, tmp_path, request):
+    factories = {
+        "simple": lambda: co.SimpleBackend(),
+        "concurrent_simple": lambda: co.ConcurrentSimpleBackend(),
+        "filesystem": lambda: co.FileSystemBackend(str(tmp_path)),
+        "shared_memory": lambda: co.SharedMemoryBackend(str(tmp_path / "cache.shm")),
+        "sqlite": lambda: co.SQLiteBackend(str(tmp_path / "cache.db")),
+        "tiered": lambda: co.TieredBackend(
+            co.SimpleBackend(), co.RedisBackend(client=redis_client)
+        ),
+        "sharded": lambda: co.ShardedBackend(
+            [
+                co.SimpleBackend(),
+                co.SimpleBackend(),
+                co.RedisBackend(client=redis_client),
+            ]
+        ),
+        "redis": lambda: co.RedisBackend(client=redis_client),
+        "memcached": lambda: co.MemcachedBackend(client=memcached_client),
+        "pipelined_memcached": lambda: co.PipelinedMemcachedBackend(
+            **memcached_client_args
+        ),
+        "metrics": lambda: co.MetricsBackend(
+            co.RedisBackend(client=redis_client), co.InMemoryMetrics()
+        ),
+        "resilient": lambda: co.ResilientBackend(
+            co.RedisBackend(client=redis_client), timeout=5
+        ),
+        "coalescing": lambda: co.CoalescingBackend(
+            co.RedisBackend(client=redis_client)
+        ),
+        "write_behind": lambda: co.WriteBehindBackend(
+            co.SimpleBackend(), flush_interval=0.01
+        ),
+    }
+    backend = factories[request.param]()
+    yield backend
+    if request.param in ("sharded", "resilient", "write_behind"):
+        # stops their threads, and the atexit hook of write_behind.
+        backend.close()
 
 
 @pytest.fixture()
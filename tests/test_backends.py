@@ -1,7 +1,36 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
 import time
 
+import cacheorm as co
 import mock
-from cacheorm.backends import MemcachedBackend, RedisBackend, SimpleBackend
+import pytest
+from cacheorm.backends import (
+    AsyncBackendAdapter,
+    AsyncCoalescingBackend,
+    AsyncRedisBackend,
+    ChunkedBackend,
+    CoalescingBackend,
+    ConcurrentSimpleBackend,
+    FileSystemBackend,
+    KeyNormalizer,
+    LocalInvalidationChannel,
+    MemcachedBackend,
+    PipelinedMemcachedBackend,
+    RedisBackend,
+    RedisInvalidationChannel,
+    ResilientBackend,
+    ShardedBackend,
+    SharedMemoryBackend,
+    SimpleBackend,
+    SQLiteBackend,
+    TieredBackend,
+    WriteBehindBackend,
+)
 from cacheorm.types import to_bytes
 
 
@@ -49,6 +78,24 @@ def test_general_flow_set_get_delete_many(backend):
         assert not backend.has(k)
 
 
+def test_general_flow_write_batch(backend):
+    backend.set_many({"foo": "foo.test", "bar": "bar.test"})
+    rv = backend.write_batch(
+        {None: {"baz": "baz.test"}, 1: {"qux": "qux.test", "quux": 1}},
+        deletes=["foo", "unknown"],
+    )
+    assert rv == {"baz": True, "qux": True, "quux": True}
+    assert backend.get_many("foo", "bar", "baz", "qux", "quux") == [
+        None,
+        b"bar.test",
+        b"baz.test",
+        b"qux.test",
+        b"1",
+    ]
+    assert backend.write_batch({}, deletes=["bar"]) == {}
+    assert backend.get("bar") is None
+
+
 def test_general_flow_cache_expired(backend):
     key = "foo"
     value = "foo.test"
@@ -99,6 +146,19 @@ def test_general_flow_replace_many(backend):
     assert not backend.has("bar")
 
 
+def test_general_flow_add(backend):
+    assert backend.add("foo", "foo.test", ttl=1) is True
+    assert backend.add("foo", "foo.new") is False
+    assert backend.get("foo") == b"foo.test"
+    rv = backend.add_many({"foo": "foo.new", "bar": "bar.test"}, ttl=0)
+    assert rv == {"foo": False, "bar": True}
+    assert backend.get_many("foo", "bar") == [b"foo.test", b"bar.test"]
+    time.sleep(1.1)
+    # the expired key is absent.
+    assert backend.add("foo", "foo.new") is True
+    assert backend.get("foo") == b"foo.new"
+
+
 def test_general_flow_incr_decr(backend):
     key = "foo"
     assert backend.incr(key, ttl=0) == 1
@@ -113,14 +173,14 @@ def test_general_flow_incr_decr(backend):
 
 def test_simple_backend_exceeded_threshold():
     # no keys expired，randomly pop
-    backend = SimpleBackend(threshold=2)
+    backend = SimpleBackend(threshold=2, policy="random")
     backend.set("foo", "foo.test", ttl=0)
     backend.set("bar", "bar.test", ttl=1)
     backend.set("baz", "baz.test", ttl=0)
     assert 2 == len(backend._store)
     assert backend.has("baz")
     # bar expired, be pruned
-    backend = SimpleBackend(threshold=2)
+    backend = SimpleBackend(threshold=2, policy="random")
     backend.set("foo", "foo.test", ttl=0)
     backend.set("bar", "bar.test", ttl=1)
     time.sleep(1.1)
@@ -129,6 +189,567 @@ def test_simple_backend_exceeded_threshold():
     assert backend.has("baz")
 
 
+def test_simple_backend_lru_eviction():
+    backend = SimpleBackend(threshold=3)
+    for key in ("foo", "bar", "baz"):
+        backend.set(key, key + ".test", ttl=0)
+    # `foo` becomes the most recently used one, `bar` is the least.
+    assert backend.get("foo") == b"foo.test"
+    backend.set("qux", "qux.test", ttl=0)
+    assert 3 == len(backend._store)
+    assert not backend.has("bar")
+    assert backend.has("foo")
+    # overwrite an existing key never evicts others.
+    backend.set("baz", "baz.new", ttl=0)
+    assert 3 == len(backend._store)
+    assert backend.replace("foo", "foo.new", ttl=0)
+    backend.set("quux", "quux.test", ttl=0)
+    assert list(backend._store.keys()) == ["baz", "foo", "quux"]
+
+
+class FakeClock(object):
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_simple_backend_reclaim_expired_incrementally():
+    clock = FakeClock()
+    backend = SimpleBackend(threshold=1000, clock=clock)
+    batch = SimpleBackend.RECLAIM_BATCH_SIZE
+    backend.set_many({"short.%d" % i: i for i in range(3 * batch)}, ttl=1)
+    backend.set("long", "long.test", ttl=10)
+    backend.set("forever", "forever.test", ttl=0)
+    clock.now += 2
+    assert backend.get("short.0") is None
+    # each write reclaims a bounded number of expired keys.
+    backend.set("foo", "foo.test", ttl=0)
+    assert len(backend._store) == 3 * batch + 3 - batch
+    backend.set("bar", "bar.test", ttl=0)
+    backend.set("baz", "baz.test", ttl=0)
+    assert sorted(backend._store) == ["bar", "baz", "foo", "forever", "long"]
+    clock.now += 10
+    backend.set("qux", "qux.test", ttl=0)
+    assert "long" not in backend._store
+
+
+def test_simple_backend_expiry_index_skips_outdated_entries():
+    clock = FakeClock()
+    backend = SimpleBackend(threshold=1000, clock=clock)
+    backend.set("foo", "foo.test", ttl=1)
+    backend.set("foo", "foo.new", ttl=10)
+    assert backend.replace("foo", "foo.replaced", ttl=20)
+    clock.now += 11
+    backend.set("bar", "bar.test", ttl=0)
+    assert backend.get("foo") == b"foo.replaced"
+    # overwriting the same key never grows the index without bound.
+    for i in range(1000):
+        backend.set("baz", i, ttl=100)
+    assert len(backend._expiry) <= 2 * len(backend._store) + 1 + (
+        SimpleBackend.RECLAIM_BATCH_SIZE
+    )
+
+
+def test_simple_backend_max_bytes():
+    backend = SimpleBackend(threshold=1000, max_bytes=10)
+    assert backend.set("foo", "a" * 4, ttl=0)
+    assert backend.set("bar", "b" * 4, ttl=0)
+    assert backend.get("foo") == b"aaaa"
+    # `bar` is the least recently used one.
+    assert backend.set("baz", "c" * 4, ttl=0)
+    assert sorted(backend._store) == ["baz", "foo"]
+    assert backend._used_bytes == 8
+    # values are stored as bytes.
+    assert backend._store["foo"][1] == b"aaaa"
+    assert backend.set("foo", 1, ttl=0)
+    assert backend._used_bytes == 5
+    # larger than the capacity, never stored.
+    assert backend.set("qux", "d" * 11, ttl=0) is False
+    assert backend.get("qux") is None
+    # and the value it should have overwritten is dropped.
+    assert backend.replace("foo", "d" * 11, ttl=0) is False
+    assert backend.get("foo") is None
+    assert backend._used_bytes == 4
+    assert backend.set("baz", "d" * 11, ttl=0) is False
+    assert not backend.has("baz") and backend._used_bytes == 0
+
+
+def test_simple_backend_quotas():
+    backend = SimpleBackend(
+        threshold=1000, max_bytes=100, quotas={"m:": 50, "m:user:": 10}
+    )
+    backend.set("m:user:id:1", "a" * 6, ttl=0)
+    backend.set("m:article:id:1", "b" * 40, ttl=0)
+    backend.set("m:user:id:2", "c" * 6, ttl=0)
+    # only the most specific quota is applied.
+    assert not backend.has("m:user:id:1")
+    assert backend.has("m:article:id:1")
+    backend.set("m:article:id:2", "d" * 20, ttl=0)
+    assert not backend.has("m:article:id:1")
+    assert backend.has("m:user:id:2")
+    backend.set("other", "e" * 80, ttl=0)
+    assert backend._used_bytes == 6 + 20 + 80 - 20
+    assert backend.set("m:user:id:2", "f" * 11, ttl=0) is False
+    assert not backend.has("m:user:id:2")
+    backend.incr("m:user:id:4", delta=100, ttl=0)
+    assert backend.get("m:user:id:4") == b"100"
+    assert [q.used_bytes for q in backend._quotas] == [3, 0]
+
+
+def test_simple_backend_unsupported_policy():
+    with pytest.raises(ValueError, match="unsupported eviction policy"):
+        SimpleBackend(policy="lfu")
+
+
+def _run_threads(target, nthreads):
+    errors = []
+
+    def wrapper(n):
+        try:
+            target(n)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrapper, args=(n,)) for n in range(nthreads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def test_concurrent_simple_backend_stress():
+    # a small threshold keeps the shards pruning while other threads write.
+    backend = ConcurrentSimpleBackend(shards=8, threshold=64, policy="random")
+    counter = ConcurrentSimpleBackend(shards=8)
+    nthreads, rounds = 16, 500
+
+    def worker(n):
+        for i in range(rounds):
+            mapping = {"%d.%d.%d" % (n, i, j): j for j in range(4)}
+            backend.set_many(mapping, ttl=0)
+            backend.get_many(*mapping.keys())
+            backend.delete_many(*list(mapping.keys())[:2])
+            counter.incr("counter", ttl=0)
+
+    assert not _run_threads(worker, nthreads)
+    assert sum(len(shard._store) for _, shard in backend._shards) <= 64
+    # incr is atomic, no lost updates.
+    assert int(counter.get("counter")) == nthreads * rounds
+
+
+def test_concurrent_simple_backend_invalid_shards():
+    with pytest.raises(ValueError, match="shards"):
+        ConcurrentSimpleBackend(shards=0)
+
+
+def test_filesystem_backend_layout(tmp_path):
+    backend = FileSystemBackend(str(tmp_path))
+    backend.set_many({"foo": "foo.test", "bar": "bar.test"}, ttl=0)
+    filename = backend._get_filename("foo")
+    digest = os.path.basename(filename)
+    assert filename == os.path.join(str(tmp_path), digest[:2], digest[2:4], digest)
+    with open(filename, "rb") as f:
+        assert f.read() == FileSystemBackend.HEADER.pack(0) + b"foo.test"
+    # no temporary files are left behind.
+    assert sorted(backend._list_files()) == sorted(
+        [filename, backend._get_filename("bar")]
+    )
+    assert not [
+        name
+        for _, _, names in os.walk(str(tmp_path))
+        for name in names
+        if name.endswith(FileSystemBackend.TMP_SUFFIX)
+    ]
+    # the cache survives the restarts.
+    assert FileSystemBackend(str(tmp_path)).get("foo") == b"foo.test"
+
+
+def test_filesystem_backend_reject_expired_by_header(tmp_path):
+    backend = FileSystemBackend(str(tmp_path))
+    filename = backend._get_filename("foo")
+    backend.set("foo", "foo.test", ttl=0)
+    with open(filename, "wb") as f:
+        f.write(FileSystemBackend.HEADER.pack(time.time() - 1) + b"foo.test")
+    assert backend.get("foo") is None
+    assert backend.has("foo") is False
+    assert backend.delete("foo") is False
+    assert not os.path.exists(filename)
+    # corrupted files are treated as missing.
+    backend.set("foo", "foo.test", ttl=0)
+    with open(filename, "wb") as f:
+        f.write(b"foo")
+    assert backend.get("foo") is None
+
+
+def test_filesystem_backend_cleanup(tmp_path):
+    entry_size = FileSystemBackend.HEADER.size + 10
+    backend = FileSystemBackend(str(tmp_path), max_bytes=5 * entry_size)
+    backend.set("expired", "e" * 10, ttl=1)
+    for i in range(4):
+        backend.set("foo.%d" % i, "f" * 10, ttl=0)
+        os.utime(backend._get_filename("foo.%d" % i), (i, i))
+    time.sleep(1.1)
+    assert len(list(backend._list_files())) == 5
+    # exceeds max_bytes, the expired one and the least recently written ones
+    # are removed.
+    backend.set_many({"bar": "b" * 10, "baz": "b" * 10}, ttl=0)
+    assert not backend.has("foo.0")
+    assert not backend.has("foo.1")
+    assert backend.has("foo.3") and backend.has("bar") and backend.has("baz")
+    assert len(list(backend._list_files())) == 4
+    assert backend._approx_bytes == 4 * entry_size
+    assert backend.cleanup() == 0
+    # the overwrites do not grow the cache.
+    with mock.patch.object(backend, "cleanup") as cleanup:
+        for _ in range(10):
+            backend.set("bar", "b" * 10, ttl=0)
+        backend.set("bar", "b" * 5, ttl=0)
+        cleanup.assert_not_called()
+    assert backend._approx_bytes == 4 * entry_size - 5
+
+
+def test_filesystem_backend_write_error(tmp_path):
+    backend = FileSystemBackend(str(tmp_path))
+    with mock.patch("os.replace", side_effect=PermissionError):
+        assert backend.set("foo", "foo.test") is False
+    assert not list(os.walk(str(tmp_path)))[0][2]
+    assert backend.replace("foo", "foo.test") is False
+
+
+def _shared_memory_incr(path, rounds):
+    backend = SharedMemoryBackend(path)
+    for _ in range(rounds):
+        backend.incr("counter", ttl=0)
+    backend.set("child.%d" % os.getpid(), "done", ttl=0)
+    backend.close()
+
+
+def test_shared_memory_backend_across_processes(tmp_path):
+    path = str(tmp_path / "cache.shm")
+    backend = SharedMemoryBackend(path)
+    ctx = multiprocessing.get_context("fork")
+    processes = [
+        ctx.Process(target=_shared_memory_incr, args=(path, 200)) for _ in range(4)
+    ]
+    for p in processes:
+        p.start()
+    for _ in range(200):
+        backend.incr("counter", ttl=0)
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+        assert backend.get("child.%d" % p.pid) == b"done"
+    assert backend.get("counter") == b"1000"
+    backend.close()
+
+
+def test_shared_memory_backend_large_values_and_reopen(tmp_path):
+    path = str(tmp_path / "cache.shm")
+    backend = SharedMemoryBackend(path, capacity=16, max_bytes=4096, chunk_size=64)
+    value = bytes(range(256)) * 4
+    assert backend.set("foo", value, ttl=0)
+    assert backend.get("foo") == value
+    # larger than the slab area.
+    assert backend.set("bar", b"b" * 4096, ttl=0) is False
+    # the geometry stored in the file is used.
+    other = SharedMemoryBackend(path, capacity=1024)
+    assert other._capacity == 16
+    assert other.get("foo") == value
+    assert other.delete("foo")
+    assert backend.get("foo") is None
+    other.close()
+    backend.close()
+    with open(path, "r+b") as f:
+        f.write(b"XXXX")
+    with pytest.raises(ValueError, match="not a shared memory cache file"):
+        SharedMemoryBackend(path)
+    with pytest.raises(ValueError, match="invalid"):
+        SharedMemoryBackend(path, chunk_size=4)
+
+
+def test_shared_memory_backend_eviction(tmp_path):
+    path = str(tmp_path / "cache.shm")
+    backend = SharedMemoryBackend(path, capacity=8, max_bytes=1024, chunk_size=64)
+    backend.set("expired", "e", ttl=1)
+    time.sleep(1.1)
+    for i in range(7):
+        backend.set("foo.%d" % i, "f", ttl=0)
+    # the table is full, the expired one is evicted first.
+    backend.set("bar", "b", ttl=0)
+    assert all(backend.has("foo.%d" % i) for i in range(7))
+    assert backend.has("bar")
+    backend.set("baz", "b", ttl=0)
+    assert backend._get_u32(SharedMemoryBackend.COUNT_OFFSET) == 8
+    assert backend.has("baz")
+    # the slab area is full.
+    assert backend.set("qux", "q" * 900, ttl=0)
+    assert backend.get("qux") == b"q" * 900
+    assert backend._get_u32(SharedMemoryBackend.USED_CHUNKS_OFFSET) <= 16
+    keys = ["foo.%d" % i for i in range(7)] + ["bar", "baz", "qux"]
+    alive = [k for k in keys if backend.has(k)]
+    assert backend.delete_many(*alive)
+    assert backend._get_u32(SharedMemoryBackend.COUNT_OFFSET) == 0
+    assert backend._get_u32(SharedMemoryBackend.USED_CHUNKS_OFFSET) == 0
+    backend.close()
+
+
+def test_shared_memory_backend_consistent_with_dict(tmp_path):
+    import random
+
+    backend = SharedMemoryBackend(
+        str(tmp_path / "cache.shm"), capacity=64, max_bytes=64 * 256, chunk_size=32
+    )
+    rnd = random.Random(0)
+    expected = {}
+    for _ in range(3000):
+        key = "key.%d" % rnd.randrange(48)
+        if rnd.random() < 0.6:
+            value = b"v" * rnd.randrange(100)
+            backend.set(key, value, ttl=0)
+            expected[key] = value
+        else:
+            assert backend.delete(key) is (expected.pop(key, None) is not None)
+    assert backend.get_dict(*expected) == expected
+    assert backend._get_u32(SharedMemoryBackend.COUNT_OFFSET) == len(expected)
+    backend.close()
+
+
+def test_shared_memory_backend_reader_falls_back_to_lock(tmp_path):
+    backend = SharedMemoryBackend(str(tmp_path / "cache.shm"))
+    backend.set("foo", "foo.test", ttl=0)
+    # a writer crashed and left an odd sequence number.
+    backend.SEQ.pack_into(backend._mm, backend.SEQ_OFFSET, 7)
+    assert backend.get("foo") == b"foo.test"
+    assert backend._get_seq() == 8
+    backend.close()
+
+
+def test_sqlite_backend_batch_once_statement(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.db"))
+    mapping = {"foo.%d" % i: "foo.test" for i in range(2000)}
+    statements = []
+    backend._get_connection().set_trace_callback(statements.append)
+    assert all(backend.set_many(mapping, ttl=0).values())
+    # one transaction
+    assert statements[0] == "BEGIN IMMEDIATE" and statements[-1] == "COMMIT"
+    assert 1 == sum(s.startswith("BEGIN") for s in statements)
+    statements.clear()
+    keys = list(mapping.keys())
+    assert backend.get_many(*keys) == [b"foo.test"] * len(keys)
+    # chunked by `MAX_VARIABLES`
+    assert 3 == len(statements)
+    statements.clear()
+    assert backend.delete_many(*keys)
+    assert 2 + 2 * 3 == len(statements)
+    backend.set_many({"foo": 1, "bar": 2})
+    assert backend.delete_many("foo", "bar", "foo")
+    assert not backend.delete_many("foo", "baz", "foo")
+
+
+def test_sqlite_backend_persistent_and_cleanup(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = SQLiteBackend(path, table="items")
+    backend.set("foo", "foo.test", ttl=1)
+    backend.set("bar", "bar.test", ttl=0)
+    other = SQLiteBackend(path, table="items")
+    assert other.get("foo") == b"foo.test"
+    assert other._get_connection().execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    time.sleep(1.1)
+    assert other.cleanup() == 1
+    assert other.get("bar") == b"bar.test"
+    with pytest.raises(ValueError, match="invalid table name"):
+        SQLiteBackend(path, table="items; DROP TABLE items")
+
+
+def test_sqlite_backend_atomic_incr(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.db"), timeout=30)
+
+    def worker(n):
+        for _ in range(50):
+            backend.incr("counter", ttl=0)
+
+    assert not _run_threads(worker, 8)
+    assert backend.get("counter") == b"400"
+    # failed transactions are rolled back.
+    with pytest.raises(sqlite3.OperationalError):
+        with backend._transaction() as conn:
+            conn.execute("SELECT * FROM unknown")
+    assert backend.incr("counter", ttl=0) == 401
+
+
+def test_tiered_backend_read_through_once_io():
+    l2 = SimpleBackend()
+    backend = TieredBackend(SimpleBackend(), l2)
+    l2.set_many({"foo": "foo.test", "bar": "bar.test"})
+    backend.l1.set("baz", "baz.test")
+    with mock.patch.object(l2, "get_many", wraps=l2.get_many) as mock_get_many:
+        assert backend.get_many("foo", "bar", "baz", "unknown") == [
+            b"foo.test",
+            b"bar.test",
+            b"baz.test",
+            None,
+        ]
+        mock_get_many.assert_called_once_with("foo", "bar", "unknown")
+        mock_get_many.reset_mock()
+        # populated to L1
+        assert backend.get_many("foo", "bar", "baz") == [
+            b"foo.test",
+            b"bar.test",
+            b"baz.test",
+        ]
+        mock_get_many.assert_not_called()
+    assert backend.l1.get("unknown") is None
+    # without l1_ttl, only the writes populate L1.
+    backend = TieredBackend(SimpleBackend(), l2, l1_ttl=None)
+    assert backend.get("foo") == b"foo.test"
+    assert not backend.l1.has("foo")
+    backend.set("foo", "foo.new")
+    assert backend.l1.get("foo") == b"foo.new"
+
+
+def test_tiered_backend_l1_never_outlives_writes():
+    clock = FakeClock()
+    l1, l2 = SimpleBackend(clock=clock), SimpleBackend(clock=clock)
+    backend = TieredBackend(l1, l2, l1_ttl=300)
+    backend.set("foo", "foo.test", ttl=10)
+    backend.set_many({"bar": "bar.test"}, ttl=0)
+    backend.set("baz", "baz.test", ttl=600)
+    clock.now += 11
+    assert backend.get_many("foo", "bar") == [None, b"bar.test"]
+    clock.now += 300
+    assert not l1.has("bar") and not l1.has("baz")
+    assert backend.get("baz") == b"baz.test"
+    # the reads populate L1 for l1_ttl capped to the default ttl of L2.
+    l1, l2 = SimpleBackend(clock=clock), SimpleBackend(default_ttl=10, clock=clock)
+    l2.set("foo", "foo.test", ttl=0)
+    backend = TieredBackend(l1, l2)
+    assert backend.get("foo") == b"foo.test" and l1.has("foo")
+    clock.now += 11
+    assert not l1.has("foo")
+
+
+def test_tiered_backend_invalidate_peers():
+    l2, channel = SimpleBackend(), LocalInvalidationChannel()
+    foo = TieredBackend(SimpleBackend(), l2, channel=channel, l1_ttl=60)
+    bar = TieredBackend(SimpleBackend(), l2, channel=channel, l1_ttl=60)
+    foo.set("key", "foo.test")
+    assert bar.get("key") == b"foo.test"
+    assert bar.l1.has("key")
+    assert foo.incr("counter") == 1 and bar.get("counter") == b"1"
+    foo.set_many({"key": "foo.new", "counter": 10})
+    assert not bar.l1.has("key") and not bar.l1.has("counter")
+    assert bar.get("key") == b"foo.new"
+    foo.delete("key")
+    assert bar.get("key") is None
+
+
+def test_tiered_backend_redis_invalidation_channel(redis_client):
+    l2 = RedisBackend(client=redis_client)
+    foo_channel = RedisInvalidationChannel(redis_client)
+    bar_channel = RedisInvalidationChannel(redis_client)
+    foo = TieredBackend(SimpleBackend(), l2, channel=foo_channel, l1_ttl=60)
+    bar = TieredBackend(SimpleBackend(), l2, channel=bar_channel, l1_ttl=60)
+    try:
+        foo.set("key", "foo.test")
+        assert bar.get("key") == b"foo.test"
+        foo.replace_many({"key": "foo.new"})
+        for _ in range(100):
+            if not bar.l1.has("key"):
+                break
+            time.sleep(0.01)
+        assert bar.get("key") == b"foo.new"
+    finally:
+        foo_channel.close()
+        bar_channel.close()
+
+
+def test_sharded_backend_fan_out_in_order():
+    shards = [SimpleBackend(threshold=1000) for _ in range(4)]
+    backend = ShardedBackend(shards)
+    mapping = {"key.%d" % i: i for i in range(100)}
+    with mock.patch.object(
+        backend._executor, "submit", wraps=backend._executor.submit
+    ) as mock_submit:
+        assert all(backend.set_many(mapping, ttl=0).values())
+        assert 4 == mock_submit.call_count
+    for key in mapping:
+        assert backend.get_backend(key).has(key)
+    assert sum(len(shard._store) for shard in shards) == 100
+    keys = list(reversed(list(mapping))) + ["unknown"]
+    assert backend.get_many(*keys) == [str(mapping[k]).encode() for k in keys[:-1]] + [
+        None
+    ]
+    # only one shard involved, no thread is used.
+    with mock.patch.object(backend._executor, "submit") as mock_submit:
+        assert backend.get_many("key.1") == [b"1"]
+        mock_submit.assert_not_called()
+    backend.close()
+    with pytest.raises(RuntimeError):
+        backend.get_many(*keys)
+    with pytest.raises(ValueError):
+        ShardedBackend([])
+
+
+def test_sharded_backend_rebalance():
+    keys = ["m:user:id:%d" % i for i in range(10000)]
+    names = ["redis-%d" % i for i in range(4)]
+    before = ShardedBackend({name: SimpleBackend() for name in names})
+    after = ShardedBackend({name: SimpleBackend() for name in names + ["redis-4"]})
+    moved = [k for k in keys if before.get_shard_name(k) != after.get_shard_name(k)]
+    # about 1/5 of the keys move, all of them to the new shard.
+    assert 0.15 < len(moved) / len(keys) < 0.25
+    assert {after.get_shard_name(k) for k in moved} == {"redis-4"}
+    # removing a shard only moves its own keys.
+    removed = ShardedBackend({name: SimpleBackend() for name in names[1:]})
+    for key in keys:
+        if before.get_shard_name(key) != "redis-0":
+            assert removed.get_shard_name(key) == before.get_shard_name(key)
+
+
+@pytest.mark.parametrize("name", ("simple", "redis"))
+def test_async_backend_general_flow(name, redis_client, redis_client_args):
+    async def flow():
+        if name == "simple":
+            backend = AsyncBackendAdapter(SimpleBackend())
+        else:
+            backend = AsyncRedisBackend(**redis_client_args)
+        mapping = {"foo": "foo.test", "bar": "bar.test"}
+        assert await backend.get_many("foo", "bar") == [None, None]
+        assert await backend.replace_many(mapping) == {"foo": False, "bar": False}
+        assert await backend.set_many(mapping, ttl=0) == {"foo": True, "bar": True}
+        assert await backend.set_many(mapping, ttl=600) == {"foo": True, "bar": True}
+        assert await backend.get_dict("foo", "bar") == {
+            "foo": b"foo.test",
+            "bar": b"bar.test",
+        }
+        assert await backend.replace("foo", "foo.new") is True
+        assert await backend.set("baz", "baz.test") is True
+        assert await backend.get("foo") == b"foo.new"
+        assert await backend.has("baz") is True
+        assert await backend.add("baz", "baz.new") is False
+        assert await backend.add_many({"baz": 1, "qux": 2}) == {
+            "baz": False,
+            "qux": True,
+        }
+        assert await backend.delete("baz") is True
+        assert await backend.delete_many("foo", "bar") is True
+        assert await backend.incr("counter", ttl=0) == 1
+        assert await backend.incr("counter", delta=2, ttl=1) == 3
+        assert await backend.decr("counter", ttl=0) == 2
+        assert await backend.decr("counter", ttl=1) == 1
+        if name == "redis":
+            await backend.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(flow())
+    finally:
+        loop.close()
+
+
 def test_redis_backend_initialization(redis_client_args):
     redis_backend = RedisBackend(**redis_client_args)
     key = "test"
@@ -194,7 +815,7 @@ def test_memcached_backend_get_set_delete_many_once_io(memcached_client):
 
 
 def test_memcached_backend_too_long_key_length(memcached_client):
-    memcached_backend = MemcachedBackend(client=memcached_client)
+    memcached_backend = MemcachedBackend(client=memcached_client, normalize_keys=False)
     too_long_key = "a" * 251
     mapping = {"foo": "foo.test", too_long_key: "too_long"}
     assert memcached_backend.set(too_long_key, "too_long") is False
@@ -215,6 +836,713 @@ def test_memcached_backend_too_long_key_length(memcached_client):
     assert memcached_backend.has("foo") is False
 
 
+def test_memcached_backend_add_replace_has_many(memcached_client):
+    memcached_backend = MemcachedBackend(client=memcached_client, normalize_keys=False)
+    too_long_key = "a" * 251
+    assert memcached_backend.add("foo", "foo.test") is True
+    assert memcached_backend.add("foo", "foo.new") is False
+    assert memcached_backend.add(too_long_key, 1) is False
+    assert memcached_backend.add_many(
+        {"foo": "foo.new", "bar": "bar.test", too_long_key: 1}
+    ) == {"foo": False, "bar": True, too_long_key: False}
+    assert memcached_backend.replace_many(
+        {"foo": "foo.new", "baz": "baz.test", too_long_key: 1}
+    ) == {"foo": True, "baz": False, too_long_key: False}
+    assert memcached_backend.get_many("foo", "bar") == [b"foo.new", b"bar.test"]
+    with mock.patch.object(memcached_client, "append") as mock_append:
+        assert memcached_backend.has_many("foo", "baz", too_long_key) == {
+            "foo": True,
+            "baz": False,
+            too_long_key: False,
+        }
+        assert memcached_backend.has("bar") is True
+        mock_append.assert_not_called()
+
+
+def test_memcached_backend_atomic_incr_decr(memcached_client):
+    memcached_backend = MemcachedBackend(client=memcached_client)
+    nthreads, rounds = 8, 50
+
+    def worker(n):
+        # pylibmc clients are not thread safe.
+        backend = MemcachedBackend(client=memcached_client.clone())
+        for _ in range(rounds):
+            backend.incr("counter", 2)
+            backend.decr("counter")
+
+    assert not _run_threads(worker, nthreads)
+    assert memcached_backend.get("counter") == b"%d" % (nthreads * rounds)
+    assert memcached_backend.decr("negative", 2) == -2
+    assert memcached_backend.incr("negative") == -1
+    assert memcached_backend.incr("negative", -1) == -2
+    assert memcached_backend.incr("negative", 3) == 1
+    assert memcached_backend.incr("negative", 1) == 2
+
+
+def test_memcached_backend_decr_without_cas_behavior(
+    memcached_client, memcached_client_args
+):
+    import pylibmc
+
+    client = pylibmc.Client(
+        ["{}:{}".format(*s) for s in memcached_client_args["servers"]]
+    )
+    memcached_backend = MemcachedBackend(client=client)
+    assert memcached_backend.decr("counter", 2) == -2
+    assert memcached_backend.incr("counter", 3) == 1
+
+
+def test_memcached_backend_incr_with_compatible_client(memcached_client):
+    import pylibmc
+
+    class CompatibleClient(object):
+        """Like python-memcached, returns ``None`` on a missing key."""
+
+        def __getattr__(self, name):
+            return getattr(memcached_client, name)
+
+        def incr(self, key, delta=1):
+            try:
+                return memcached_client.incr(key, delta)
+            except pylibmc.NotFound:
+                return None
+
+    memcached_backend = MemcachedBackend(client=CompatibleClient())
+    assert memcached_backend.incr("counter", 2) == 2
+    assert memcached_backend.incr("counter") == 3
+
+
+def test_pipelined_memcached_backend_add_has_many(
+    memcached_client, memcached_client_args
+):
+    memcached_backend = PipelinedMemcachedBackend(noreply=True, **memcached_client_args)
+    assert memcached_backend.add("foo", "foo.test") is True
+    assert memcached_backend.add("foo", "foo.new") is False
+    assert memcached_backend.add_many({"foo": 1, "bar": 2}) == {
+        "foo": False,
+        "bar": True,
+    }
+    assert memcached_backend.has_many("foo", "bar", "baz") == {
+        "foo": True,
+        "bar": True,
+        "baz": False,
+    }
+
+
+@pytest.mark.parametrize("name", ("simple", "memcached", "pipelined_memcached"))
+def test_chunked_large_values(name, memcached_client, memcached_client_args):
+    if name == "simple":
+        backend = ChunkedBackend(SimpleBackend(), max_value_size=100, chunk_size=30)
+    elif name == "memcached":
+        backend = MemcachedBackend(client=memcached_client, max_value_size=100)
+    else:
+        backend = PipelinedMemcachedBackend(max_value_size=100, **memcached_client_args)
+    large, small = b"x" * 250 + b"y" * 50, b"small"
+    assert backend.set("foo", large) is True
+    assert backend.get("foo") == large
+    assert backend.set_many({"foo": large + b"z", "bar": small}) == {
+        "foo": True,
+        "bar": True,
+    }
+    assert backend.get_dict("foo", "bar", "baz") == {
+        "foo": large + b"z",
+        "bar": small,
+        "baz": None,
+    }
+    assert backend.replace("bar", large) is True
+    assert backend.replace("baz", large) is False
+    assert backend.add("baz", large) is True
+    assert backend.add("baz", small) is False
+    assert backend.add_many({"baz": large, "qux": large}) == {
+        "baz": False,
+        "qux": True,
+    }
+    assert backend.get_many("bar", "baz", "qux") == [large] * 3
+    assert backend.has("qux") is True
+    assert backend.delete_many("foo", "bar", "baz", "qux") is True
+    assert backend.get_many("foo", "qux") == [None, None]
+
+
+def test_chunked_backend_batches_and_generations():
+    simple = SimpleBackend(threshold=1000)
+    backend = ChunkedBackend(simple, max_value_size=10)
+    first, second = b"a" * 25, b"b" * 35
+    with mock.patch.object(simple, "set_many", wraps=simple.set_many) as mock_set:
+        assert backend.set_many({"foo": first, "bar": second, "baz": 1})
+        assert mock_set.call_count == 2
+        chunks = mock_set.call_args_list[0][0][0]
+        assert len(chunks) == 3 + 4
+    with mock.patch.object(simple, "get_dict", wraps=simple.get_dict) as mock_get:
+        assert backend.get_many("foo", "bar", "baz") == [first, second, b"1"]
+        assert mock_get.call_count == 2
+    manifest = simple.get("foo")
+    assert backend.set("foo", second) is True
+    # a reader holding the old manifest still assembles the old chunks.
+    assert backend._chunker.read({"foo": manifest}, simple.get_dict)["foo"] == first
+    assert backend.get("foo") == second
+    # evicted chunks make the value missing.
+    simple.delete(next(k for k in chunks if k.startswith("bar:chunk:")))
+    assert backend.get("bar") is None
+    assert backend.incr("counter", 2) == 2
+    assert backend.decr("counter") == 1
+    assert backend.has_many("counter", "qux") == {"counter": True, "qux": False}
+    # failed chunk writes fail the value.
+    with mock.patch.object(
+        simple, "set_many", side_effect=lambda m, t: dict.fromkeys(m, False)
+    ):
+        assert backend.set("qux", first) is False
+    assert backend.get("qux") is None
+
+
+def test_chunked_backend_long_keys_and_magic_values():
+    simple = SimpleBackend(threshold=1000)
+    backend = ChunkedBackend(simple, max_value_size=10, max_key_length=100)
+    long_key, value = "k" * 60, b"a" * 25
+    with mock.patch.object(simple, "set_many", wraps=simple.set_many) as mock_set:
+        assert backend.set(long_key, value) is True
+        chunks = mock_set.call_args_list[0][0][0]
+    assert all(len(k) <= 100 and not k.startswith(long_key) for k in chunks)
+    assert backend.get(long_key) == value
+    # the ordinary values starting with the magic are not manifests.
+    for ordinary in (b"", b"a:b", b"x:y:z", b"g:1:2:3", b"g:-1:2"):
+        ordinary = backend._chunker.MAGIC + ordinary
+        assert backend.set("foo", ordinary) is True
+        assert backend.get("foo") == ordinary
+
+
+def test_memcached_backend_chunks_by_default(memcached_client):
+    memcached_backend = MemcachedBackend(client=memcached_client)
+    value = b"x" * (1000 * 1000 + 1)
+    with mock.patch.object(
+        memcached_client, "set_multi", wraps=memcached_client.set_multi
+    ) as mock_set:
+        assert memcached_backend.set("foo", value) is True
+        mock_set.assert_called()
+    assert memcached_backend.get("foo") == value
+    assert MemcachedBackend(client=memcached_client, max_value_size=None).set(
+        "bar", b"small"
+    )
+
+
+def test_pipelined_memcached_backend_one_write_and_read_per_batch(
+    memcached_client, memcached_client_args
+):
+    memcached_backend = PipelinedMemcachedBackend(**memcached_client_args)
+    mapping = {"foo": "foo.test", "bar": "bar.test", "baz": "baz.test"}
+    assert memcached_backend.set("warmup", 1) is True
+    conn = memcached_backend._get_connection(0)
+    with mock.patch.object(conn, "send", wraps=conn.send) as mock_send:
+        assert memcached_backend.set_many(mapping) == dict.fromkeys(mapping, True)
+        mock_send.assert_called_once()
+        mock_send.reset_mock()
+        with mock.patch.object(
+            conn, "read_values", wraps=conn.read_values
+        ) as mock_read:
+            rv = memcached_backend.get_many(*mapping.keys())
+            mock_read.assert_called_once()
+        assert list(map(to_bytes, mapping.values())) == rv
+        mock_send.assert_called_once()
+        mock_send.reset_mock()
+        assert memcached_backend.delete_many(*mapping.keys()) is True
+        mock_send.assert_called_once()
+    assert memcached_client.get_multi(list(mapping)) == {}
+
+
+def test_pipelined_memcached_backend_noreply(memcached_client, memcached_client_args):
+    memcached_backend = PipelinedMemcachedBackend(noreply=True, **memcached_client_args)
+    mapping = {"foo": "foo.test", "bar": "bar.test"}
+    assert memcached_backend.set_many(mapping) == {"foo": True, "bar": True}
+    assert memcached_backend.replace("foo", "foo.new") is True
+    assert memcached_backend.get_dict("foo", "bar") == {
+        "foo": b"foo.new",
+        "bar": b"bar.test",
+    }
+    assert memcached_backend.delete_many("foo", "bar") is True
+    assert memcached_backend.get_many("foo", "bar") == [None, None]
+
+
+def test_pipelined_memcached_backend_incr_decr(memcached_client, memcached_client_args):
+    memcached_backend = PipelinedMemcachedBackend(**memcached_client_args)
+    assert memcached_backend.decr("counter") == -1
+    assert memcached_backend.incr("counter", 3) == 2
+    assert memcached_backend.incr("counter", -5) == -3
+    assert memcached_backend.incr("counter") == -2
+
+
+class FaultyBackend(SimpleBackend):
+    """A stand-in backend which injects errors and delays."""
+
+    def __init__(self, clock=None):
+        super(FaultyBackend, self).__init__()
+        self.error = None
+        self.delay = 0
+        self.clock = clock
+        self.calls = 0
+
+    def _fault(self):
+        self.calls += 1
+        if self.clock is not None:
+            self.clock.now += self.delay
+        elif self.delay:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+    def get_many(self, *keys):
+        self._fault()
+        return super(FaultyBackend, self).get_many(*keys)
+
+    def set_many(self, mapping, ttl=None):
+        self._fault()
+        return super(FaultyBackend, self).set_many(mapping, ttl)
+
+    def set(self, key, value, ttl=None):
+        self._fault()
+        return super(FaultyBackend, self).set(key, value, ttl)
+
+
+def test_resilient_backend_circuit_breaker():
+    clock, transitions = FakeClock(), []
+    faulty = FaultyBackend()
+    backend = ResilientBackend(
+        faulty,
+        failure_threshold=3,
+        recovery_timeout=10,
+        on_state_change=lambda old, new: transitions.append((old, new)),
+        clock=clock,
+    )
+    assert backend.set("foo", "bar") is True
+    faulty.error = ConnectionError("node down")
+    for _ in range(3):
+        assert backend.get_many("foo", "bar") == [None, None]
+    assert backend.state == ResilientBackend.OPEN
+    assert backend.set_many({"foo": 1, "bar": 2}) == {"foo": False, "bar": False}
+    assert faulty.calls == 4
+    clock.now += 10
+    assert backend.set("foo", "baz") is False
+    assert transitions == [
+        ("closed", "open"),
+        ("open", "half_open"),
+        ("half_open", "open"),
+    ]
+    clock.now += 10
+    faulty.error = None
+    assert backend.get_many("foo") == [b"bar"]
+    assert backend.state == ResilientBackend.CLOSED
+    assert transitions[-2:] == [("open", "half_open"), ("half_open", "closed")]
+    # a success resets the consecutive failures.
+    faulty.error = ConnectionError("flapping")
+    backend.set("foo", 1)
+    backend.set("foo", 1)
+    faulty.error = None
+    backend.set("foo", 1)
+    faulty.error = ConnectionError("flapping")
+    backend.set("foo", 1)
+    assert backend.state == ResilientBackend.CLOSED
+
+
+def test_resilient_backend_half_open_probes():
+    clock = FakeClock()
+    faulty = FaultyBackend()
+    backend = ResilientBackend(
+        faulty, failure_threshold=1, recovery_timeout=5, clock=clock
+    )
+    faulty.error = ConnectionError("node down")
+    assert backend.get_many("foo") == [None]
+    assert backend.state == ResilientBackend.OPEN
+    clock.now += 5
+    assert backend._acquire() is True
+    assert backend.state == ResilientBackend.HALF_OPEN
+    # only one probe at a time.
+    assert backend._acquire() is False
+    assert backend.get_dict("foo") == {"foo": None}
+
+
+def test_resilient_backend_deadline_and_slow_calls():
+    faulty = FaultyBackend()
+    backend = ResilientBackend(faulty, timeout=0.05, failure_threshold=2)
+    faulty.delay = 0.5
+    started = time.time()
+    assert backend.get_many("foo") == [None]
+    assert time.time() - started < 0.4
+    assert backend.state == ResilientBackend.CLOSED
+    assert backend.set("foo", "bar") is False
+    assert backend.state == ResilientBackend.OPEN
+    backend.close()
+
+    clock = FakeClock()
+    faulty = FaultyBackend(clock)
+    backend = ResilientBackend(
+        faulty, failure_threshold=2, slow_call_threshold=1, clock=clock
+    )
+    faulty.delay = 2
+    # the slow calls return their results, but open the circuit.
+    assert backend.set("foo", "bar") is True
+    assert backend.get_many("foo") == [b"bar"]
+    assert backend.state == ResilientBackend.OPEN
+    assert backend.get_many("foo") == [None]
+
+
+def test_resilient_backend_bounds_given_up_calls(caplog, wait_until):
+    blocking = BlockingBackend()
+    backend = ResilientBackend(
+        blocking, timeout=0.05, failure_threshold=10, max_workers=1
+    )
+    assert backend.get_many("foo") == [None]
+    # the given up call still holds the worker, the next ones are rejected
+    # instead of queued behind it.
+    assert backend.get_many("bar") == [None]
+    assert backend.set("bar", "bar.test") is False
+    assert blocking.fetched == [("foo",)] and blocking.get("bar") is None
+    assert "all the 1 workers are busy" in caplog.text
+    blocking.release.set()
+    wait_until(lambda: backend._slots.acquire(blocking=False))
+    backend._slots.release()
+    assert backend.get_many("foo") == [None]
+    assert backend.set("bar", "bar.test") is True
+    backend.close()
+    # the calls after close fail open.
+    assert backend.get_many("bar") == [None]
+
+
+def test_resilient_backend_model_degrades_to_misses(registry):
+    faulty = FaultyBackend()
+
+    class Article(co.Model):
+        id = co.IntegerField(primary_key=True)
+        title = co.StringField()
+
+        class Meta:
+            backend = ResilientBackend(faulty, failure_threshold=1)
+            serializer = registry.get_by_name("json")
+
+    article = Article.create(id=1, title="foo")
+    assert Article.get_by_id(1) == article
+    faulty.error = ConnectionError("node down")
+    assert Article.get_or_none(id=1) is None
+    assert Article.query_many({"id": 1}, {"id": 2}).execute() == [None, None]
+    assert Article.insert(id=2, title="bar").execute().title == "bar"
+    assert faulty.calls == 3
+
+
+class BlockingBackend(SimpleBackend):
+    """A stand-in backend whose reads block until `release` is set."""
+
+    def __init__(self):
+        super(BlockingBackend, self).__init__()
+        self.release = threading.Event()
+        self.fetched = []
+        self.error = None
+
+    def get_many(self, *keys):
+        self.fetched.append(keys)
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return super(BlockingBackend, self).get_many(*keys)
+
+
+def test_coalescing_backend_single_flight(wait_until):
+    blocking = BlockingBackend()
+    blocking.set("foo", "bar")
+    backend = CoalescingBackend(blocking)
+    results = []
+    _start = threading.Thread(
+        target=lambda: _run_threads(
+            lambda n: results.append(backend.get("foo")), nthreads=8
+        )
+    )
+    _start.start()
+    wait_until(lambda: backend.coalesced == 7)
+    blocking.release.set()
+    _start.join()
+    assert results == [b"bar"] * 8
+    assert blocking.fetched == [("foo",)]
+    # the finished fetches are forgotten.
+    assert backend.get_dict("foo", "foo") == {"foo": b"bar"}
+    assert len(blocking.fetched) == 2
+
+
+def test_coalescing_backend_overlapping_batches_and_errors(wait_until):
+    blocking = BlockingBackend()
+    blocking.set_many({"a": 1, "b": 2, "c": 3})
+    backend = CoalescingBackend(blocking)
+    results = {}
+
+    def read(n):
+        keys = [("a", "b"), ("b", "c")][n]
+        if n == 1:
+            wait_until(lambda: len(blocking.fetched) == 1)
+        results[n] = backend.get_many(*keys)
+
+    thread = threading.Thread(target=_run_threads, args=(read, 2))
+    thread.start()
+    wait_until(lambda: len(blocking.fetched) == 2)
+    blocking.release.set()
+    thread.join()
+    assert results == {0: [b"1", b"2"], 1: [b"2", b"3"]}
+    assert blocking.fetched == [("a", "b"), ("c",)]
+
+    blocking.release.clear()
+    blocking.error = ConnectionError("node down")
+    errors = []
+
+    def failing_read(n):
+        try:
+            backend.get_many("a")
+        except ConnectionError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=_run_threads, args=(failing_read, 4))
+    thread.start()
+    wait_until(lambda: backend.coalesced == 4)
+    blocking.release.set()
+    thread.join()
+    assert len(errors) == 4 and len(set(map(id, errors))) == 1
+    blocking.error = None
+    assert backend.get("a") == b"1"
+
+
+def test_coalescing_backend_writes_forget_inflight_reads(wait_until):
+    blocking = BlockingBackend()
+    backend = CoalescingBackend(blocking)
+    thread = threading.Thread(target=backend.get, args=("foo",))
+    thread.start()
+    wait_until(lambda: blocking.fetched)
+    assert backend.set("foo", "bar") is True
+    blocking.release.set()
+    thread.join()
+    assert backend.get("foo") == b"bar"
+    assert backend.coalesced == 0
+
+
+def test_async_coalescing_backend():
+    class SlowAsyncBackend(AsyncBackendAdapter):
+        fetched = []
+        error = None
+
+        async def get_many(self, *keys):
+            self.fetched.append(keys)
+            await asyncio.sleep(0.01)
+            if self.error is not None:
+                raise self.error
+            return self.backend.get_many(*keys)
+
+    slow = SlowAsyncBackend(SimpleBackend())
+    backend = AsyncCoalescingBackend(slow)
+
+    async def run():
+        await backend.set_many({"a": 1, "b": 2, "c": 3})
+        rv = await asyncio.gather(
+            backend.get("a"),
+            backend.get_many("a", "b"),
+            backend.get_dict("b", "c"),
+        )
+        assert rv == [b"1", [b"1", b"2"], {"b": b"2", "c": b"3"}]
+        assert slow.fetched == [("a",), ("b",), ("c",)]
+        assert backend.coalesced == 2
+        slow.error = ConnectionError("node down")
+        rv = await asyncio.gather(
+            backend.get("a"), backend.get("a"), return_exceptions=True
+        )
+        assert all(isinstance(e, ConnectionError) for e in rv)
+        slow.error = None
+        task = asyncio.ensure_future(backend.get("a"))
+        await asyncio.sleep(0)
+        task.cancel()
+        assert await backend.get("a") == b"1"
+        assert await backend.delete("a") is True
+        assert await backend.has_many("b", "c") == {"b": True, "c": True}
+
+    asyncio.run(run())
+
+
+class RecordingBackend(SimpleBackend):
+    """A stand-in backend recording the `set_many` calls, which block while
+    `release` is clear."""
+
+    def __init__(self):
+        super(RecordingBackend, self).__init__()
+        self.release = threading.Event()
+        self.release.set()
+        self.written = []
+        self.error = None
+
+    def set_many(self, mapping, ttl=None):
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.written.append((dict(mapping), ttl))
+        return super(RecordingBackend, self).set_many(mapping, ttl)
+
+
+def test_write_behind_backend_coalesces_writes():
+    recording = RecordingBackend()
+    backend = WriteBehindBackend(recording, flush_interval=60)
+    for i in range(100):
+        assert backend.set("counter", i) is True
+    backend.set_many({"foo": "foo.test", "bar": "bar.test"}, ttl=10)
+    # read-your-writes from the buffer.
+    assert backend.get_many("counter", "foo", "unknown") == [b"99", b"foo.test", None]
+    assert backend.has_many("counter", "unknown") == {"counter": True, "unknown": False}
+    assert recording.written == [] and backend.superseded == 99
+    backend.flush()
+    assert recording.written == [
+        ({"counter": b"99"}, None),
+        ({"foo": b"foo.test", "bar": b"bar.test"}, 10),
+    ]
+    assert recording.get("counter") == b"99"
+    backend.close()
+    assert not backend._thread.is_alive()
+    # writes through once closed.
+    assert backend.set("counter", 100) is True
+    assert recording.get("counter") == b"100"
+
+
+def test_write_behind_backend_flushes_in_background(wait_until):
+    recording = RecordingBackend()
+    backend = WriteBehindBackend(recording, flush_interval=0.01)
+    backend.set("foo", "foo.test")
+    wait_until(lambda: recording.get("foo") == b"foo.test")
+    assert backend._at_exit is not None
+    backend.close()
+    assert backend._at_exit is None and not backend._thread.is_alive()
+    backend = WriteBehindBackend(recording, flush_interval=60, max_size=10)
+    backend.set_many({str(i): i for i in range(10)})
+    wait_until(lambda: recording.get("9") == b"9")
+    backend.close()
+
+
+def test_write_behind_backend_backpressure(wait_until):
+    recording = RecordingBackend()
+    backend = WriteBehindBackend(recording, flush_interval=60, max_size=2)
+    recording.release.clear()
+    backend.set_many({"a": 1, "b": 2})
+    # the background thread takes the full buffer over, and blocks writing it.
+    wait_until(lambda: backend._flushing)
+    assert backend.get_many("a", "b") == [b"1", b"2"]
+    backend.set_many({"c": 3, "d": 4})
+    thread = threading.Thread(target=backend.set, args=("e", 5))
+    thread.start()
+    time.sleep(0.05)
+    assert thread.is_alive()
+    # superseding a buffered key doesn't block.
+    backend.set("c", 33)
+    recording.release.set()
+    thread.join()
+    backend.close()
+    assert recording.get_many("a", "c", "d", "e") == [b"1", b"33", b"4", b"5"]
+
+
+def test_write_behind_backend_orders_deletes_and_conditional_writes():
+    recording = RecordingBackend()
+    backend = WriteBehindBackend(recording, flush_interval=60)
+    backend.set("foo", "foo.test")
+    assert backend.delete("foo") is True
+    assert backend.get("foo") is None and recording.written == []
+    recording.set("bar", "bar.old")
+    backend.set_many({"bar": "bar.test", "baz": "baz.test"})
+    assert backend.delete_many("bar", "baz") is True
+    assert recording.get("bar") is None
+    backend.set("foo", 1)
+    assert backend.add("foo", 2) is False
+    assert backend.incr("foo", 2) == 3
+    backend.set("foo", 5)
+    assert backend.replace_many({"foo": 6, "qux": 0}) == {"foo": True, "qux": False}
+    assert backend.decr("foo") == 5
+    assert backend.add_many({"qux": 1}) == {"qux": True}
+    assert backend.replace("qux", 2) is True
+    assert backend.get_dict("foo", "qux") == {"foo": b"5", "qux": b"2"}
+    backend.close()
+
+
+def test_write_behind_backend_flush_errors(wait_until):
+    recording = RecordingBackend()
+    errors = []
+    backend = WriteBehindBackend(recording, flush_interval=0.01, on_error=errors.append)
+    recording.error = ConnectionError("node down")
+    backend.set_many({"foo": "foo.test", "bar": "bar.test"})
+    wait_until(lambda: errors)
+    # the failed writes are retried unless superseded.
+    backend.set("foo", "foo.new")
+    recording.error = None
+    wait_until(lambda: recording.get_many("foo", "bar") == [b"foo.new", b"bar.test"])
+    backend.close()
+
+
+def test_key_normalizer():
+    normalizer = KeyNormalizer(max_length=64)
+    assert normalizer("foo") == "foo"
+    assert normalizer.normalizations == 0
+    long_key = "user:" + "a" * 100
+    key = normalizer(long_key)
+    assert len(key) == 64 and key.startswith("user:aaa")
+    assert key == normalizer(long_key) != normalizer(long_key + "b")
+    key = normalizer("with space\n")
+    assert key.startswith("with_space_:") and normalizer.is_valid(key)
+    assert normalizer.normalizations == 4
+    key = normalizer("中" * 30)
+    assert len(key.encode("utf-8")) <= 64 and key.startswith("中")
+    normalizer = KeyNormalizer(normalize_all=True, digest_size=8)
+    digest = hashlib.blake2b(b"foo", digest_size=8).hexdigest()
+    assert normalizer("foo") == "foo:%s" % digest
+    assert normalizer.normalizations == 1
+
+
+@pytest.mark.parametrize("backend", ["memcached", "pipelined_memcached"], indirect=True)
+def test_memcached_backend_normalize_keys(backend):
+    long_key, spaced_key = "a" * 251, "with space"
+    mapping = {"foo": b"foo", long_key: b"long", spaced_key: b"spaced"}
+    assert backend.set_many(mapping) == dict.fromkeys(mapping, True)
+    assert backend.get_dict(*mapping) == mapping
+    assert backend.set(long_key, b"long.new") is True
+    assert backend.get(long_key) == b"long.new"
+    assert backend.has_many(long_key, spaced_key, "bar") == {
+        long_key: True,
+        spaced_key: True,
+        "bar": False,
+    }
+    assert backend.incr(long_key + "counter", 2) == 2
+    assert backend.decr(long_key + "counter") == 1
+    assert backend.delete_many(long_key, spaced_key) is True
+    assert backend.get_many(long_key, spaced_key) == [None, None]
+    assert backend.key_normalizer.normalizations > 0
+
+
+def test_memcached_backend_normalize_all_keys(memcached_client):
+    normalizer = KeyNormalizer(normalize_all=True)
+    memcached_backend = MemcachedBackend(
+        client=memcached_client, normalize_keys=normalizer
+    )
+    assert memcached_backend.set("foo", "foo.test") is True
+    assert memcached_backend.get("foo") == b"foo.test"
+    assert memcached_client.get("foo") is None
+    assert to_bytes(memcached_client.get(normalizer("foo"))) == b"foo.test"
+    assert normalizer.normalizations == 3
+
+
+def test_pipelined_memcached_backend_connection_errors(memcached_client_args):
+    host, port = memcached_client_args["servers"][0]
+    memcached_backend = PipelinedMemcachedBackend(
+        servers=((host, port), ("127.0.0.1", 1)), timeout=1
+    )
+    mapping = {str(i): i for i in range(20)}
+    rv = memcached_backend.set_many(mapping)
+    assert set(rv.values()) == {True, False}
+    stored = memcached_backend.get_dict(*mapping)
+    assert {k for k, v in rv.items() if v} == {k for k, v in stored.items() if v}
+    assert memcached_backend.delete_many(*mapping) is False
+    failed = next(k for k, v in rv.items() if not v)
+    assert memcached_backend.incr(failed) is None
+
+
+def test_pipelined_memcached_backend_reconnect_after_fork(memcached_client_args):
+    memcached_backend = PipelinedMemcachedBackend(**memcached_client_args)
+    conn = memcached_backend._get_connection(0)
+    with mock.patch("os.getpid", return_value=-1):
+        assert memcached_backend._get_connection(0) is not conn
+
+
 def test_benchmark_backend_set(benchmark, backend):
     def do_set(k, v, ttl=None):
         backend.set(k, v, ttl)
@@ -275,3 +1603,30 @@ def test_benchmark_backend_delete_many(benchmark, backend):
 
     backend.set_many({"foo": "bar", "bar": "baz"}, 10 * 60)
     benchmark(do_delete_many, "foo", "bar")
+
+
+# SimpleBackend is not thread safe, it runs the same work in one thread, as
+# the baseline of the lock contention of ConcurrentSimpleBackend.
+@pytest.mark.parametrize(
+    "backend_factory, threaded",
+    ((SimpleBackend, False), (ConcurrentSimpleBackend, True)),
+    ids=("simple_sequential", "concurrent_simple"),
+)
+def test_benchmark_backend_threaded_get_set_many(benchmark, backend_factory, threaded):
+    backend = backend_factory(threshold=1600)
+    nthreads, rounds = 8, 50
+
+    def worker(n):
+        for i in range(rounds):
+            mapping = {"%d.%d" % (n, j): i for j in range(10)}
+            backend.set_many(mapping, 10 * 60)
+            backend.get_many(*mapping.keys())
+
+    def do_threaded_get_set_many():
+        if not threaded:
+            for n in range(nthreads):
+                worker(n)
+            return
+        assert not _run_threads(worker, nthreads)
+
+    benchmark(do_threaded_get_set_many)
@@ -0,0 +1,66 @@
+import json
+import zlib
+
+import pytest
+from cacheorm.compression import Compressor, train_dictionary
+
+
+def _payload(i):
+    return json.dumps(
+        {"id": i, "name": "user%d" % i, "email": "user%d@example.com" % i, "bio": ""},
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def test_compressor_threshold_and_header():
+    compressor = Compressor(threshold=64)
+    small = b'{"foo":"bar"}'
+    assert compressor.compress(small) == Compressor.RAW + small
+    large = b'{"content":"%s"}' % (b"foo" * 100)
+    compressed = compressor.compress(large)
+    assert compressed[:1] == Compressor.ZLIB
+    assert len(compressed) < len(large)
+    assert compressor.decompress(compressed) == large
+    assert compressor.decompress(compressor.compress(small)) == small
+    # incompressible payloads are stored raw.
+    noise = zlib.compress(large) * 2
+    assert compressor.compress(noise) == Compressor.RAW + noise
+    # payloads without header, written before the compression is enabled.
+    assert compressor.decompress(large) == large
+
+
+def test_compressor_with_preset_dictionary():
+    zdict = train_dictionary([_payload(i) for i in range(100)], size=256)
+    assert 0 < len(zdict) <= 256
+    plain = Compressor(threshold=0)
+    preset = Compressor(threshold=0, zdict=zdict)
+    payload = _payload(1000)
+    compressed = preset.compress(payload)
+    assert compressed[:1] == Compressor.ZLIB_DICT
+    assert len(compressed) < len(plain.compress(payload))
+    assert preset.decompress(compressed) == payload
+    assert preset.decompress(plain.compress(payload)) == payload
+    with pytest.raises(ValueError):
+        plain.decompress(compressed)
+
+
+@pytest.mark.parametrize("kind", ("none", "zlib", "zlib_dict"))
+def test_benchmark_compression(benchmark, kind):
+    samples = [_payload(i) for i in range(100)]
+    compressor = {
+        "none": None,
+        "zlib": Compressor(threshold=0),
+        "zlib_dict": Compressor(threshold=0, zdict=train_dictionary(samples)),
+    }[kind]
+    payloads = [_payload(i) for i in range(1000, 1100)]
+
+    def do_compress():
+        if compressor is None:
+            return payloads
+        return [compressor.decompress(compressor.compress(p)) for p in payloads]
+
+    assert benchmark(do_compress) == payloads
+    size = sum(map(len, payloads))
+    if compressor is not None:
+        compressed = sum(len(compressor.compress(p)) for p in payloads)
+        benchmark.extra_info["saved_ratio"] = 1 - compressed / size
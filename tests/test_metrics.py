@@ -0,0 +1,82 @@
+import threading
+
+from cacheorm.backends import MetricsBackend, SimpleBackend
+from cacheorm.metrics import InMemoryMetrics, PrometheusExporter
+
+
+def test_in_memory_metrics():
+    metrics = InMemoryMetrics(buckets=(0.001, 0.01))
+    metrics.record("model", "user", "query", 0.0005, keys=2, hits=1, misses=1)
+    metrics.record("model", "user", "query", 0.005, keys=1, hits=1, bytes_in=10)
+    metrics.record("model", "user", "insert", 0.5, keys=3, bytes_out=30)
+    stats = metrics.get("model", "user", "query")
+    assert (stats.calls, stats.keys, stats.hits, stats.misses) == (2, 3, 2, 1)
+    assert stats.bytes_in == 10 and stats.latency_buckets == [1, 1, 0]
+    assert stats.hit_ratio == 2 / 3
+    assert metrics.get("model", "user", "insert").latency_buckets == [0, 0, 1]
+    assert metrics.get("model", "user", "insert").hit_ratio is None
+    assert metrics.hit_ratio("model", "user") == 2 / 3
+    assert metrics.hit_ratio("model", "article") is None
+    assert [key for key, _ in metrics.items()] == [
+        ("model", "user", "insert"),
+        ("model", "user", "query"),
+    ]
+    metrics.reset()
+    assert metrics.items() == []
+
+
+def test_in_memory_metrics_concurrently():
+    metrics = InMemoryMetrics()
+
+    def record():
+        for _ in range(1000):
+            metrics.record("backend", "redis", "get", 0.001, keys=1, hits=1)
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = metrics.get("backend", "redis", "get")
+    assert stats.calls == stats.hits == 8000
+
+
+def test_prometheus_exporter(tmp_path):
+    metrics = InMemoryMetrics(buckets=(0.001, 0.01))
+    metrics.record("model", 'we"ird', "query", 0.005, keys=2, hits=1, misses=1)
+    metrics.record("model", 'we"ird', "query", 0.02, keys=1, hits=1)
+    exporter = PrometheusExporter(metrics)
+    text = exporter.render()
+    labels = 'scope="model",name="we\\"ird",operation="query"'
+    assert "# TYPE cacheorm_calls_total counter" in text
+    assert "cacheorm_calls_total{%s} 2" % labels in text
+    assert "cacheorm_hits_total{%s} 2" % labels in text
+    assert "cacheorm_misses_total{%s} 1" % labels in text
+    assert "# TYPE cacheorm_latency_seconds histogram" in text
+    assert 'cacheorm_latency_seconds_bucket{%s,le="0.001"} 0' % labels in text
+    assert 'cacheorm_latency_seconds_bucket{%s,le="0.01"} 1' % labels in text
+    assert 'cacheorm_latency_seconds_bucket{%s,le="+Inf"} 2' % labels in text
+    assert "cacheorm_latency_seconds_count{%s} 2" % labels in text
+    path = tmp_path / "cacheorm.prom"
+    exporter.write(str(path))
+    assert path.read_text() == text
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_metrics_backend():
+    metrics = InMemoryMetrics()
+    backend = MetricsBackend(SimpleBackend(), metrics, name="local")
+    assert backend.set_many({"foo": "bar", "baz": b"qux"}) == {
+        "foo": True,
+        "baz": True,
+    }
+    assert backend.get_many("foo", "baz", "missing") == [b"bar", b"qux", None]
+    assert backend.get("missing") is None
+    stats = metrics.get("backend", "local", "set_many")
+    assert (stats.calls, stats.keys, stats.bytes_out) == (1, 2, 6)
+    stats = metrics.get("backend", "local", "get_many")
+    assert (stats.keys, stats.hits, stats.misses, stats.bytes_in) == (3, 2, 1, 6)
+    assert metrics.hit_ratio("backend", "local") == 0.5
+    assert backend.incr("counter") == 1
+    assert metrics.get("backend", "local", "incr").calls == 1
+    assert MetricsBackend(SimpleBackend(), metrics).name == "SimpleBackend"
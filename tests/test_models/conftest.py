@@ -15,6 +15,27 @@ def user_model(registry, redis_client):
     return TestUser
 
 
+@pytest.fixture()
+def article_model_factory(registry):
+    """Returns a factory of ``Article`` models, the options override its Meta."""
+
+    def factory(**options):
+        class Article(co.Model):
+            id = co.IntegerField(primary_key=True)
+            title = co.StringField()
+
+            class Meta:
+                backend = co.SimpleBackend()
+                serializer = registry.get_by_name("json")
+                ttl = 60
+
+        for k, v in options.items():
+            setattr(Article._meta, k, v)
+        return Article
+
+    return factory
+
+
 @pytest.fixture()
 def users_data():
     return [
@@ -0,0 +1,140 @@
+import asyncio
+import gc
+import warnings
+
+import cacheorm as co
+import pytest
+
+from .base_models import User
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.fixture(params=("simple", "redis"))
+def async_user_model(registry, redis_client, redis_client_args, request):
+    if request.param == "simple":
+        backend = co.AsyncBackendAdapter(co.SimpleBackend())
+    else:
+        backend = co.AsyncRedisBackend(**redis_client_args)
+
+    class AsyncUser(User):
+        class Meta:
+            serializer = registry.get_by_name("msgpack")
+            ttl = 10 * 60
+
+    AsyncUser._meta.backend = backend
+    return AsyncUser
+
+
+def test_async_insert_query(async_user_model, users_data):
+    async def flow():
+        users = await async_user_model.insert_many(*users_data).aexecute()
+        got = await async_user_model.query_many(
+            *[{"id": u.id} for u in users], {"id": 10}
+        ).aexecute()
+        assert got[:-1] == users and got[-1] is None
+        sam = await async_user_model.acreate(id=5, name="Sam", height=178.6)
+        assert await async_user_model.aget_by_id(5) == sam
+        assert await async_user_model.aget_or_none(id=10) is None
+        with pytest.raises(async_user_model.DoesNotExist):
+            await async_user_model.aget(id=10)
+        user, created = await async_user_model.aget_or_create(
+            id=6, name="Amy", height=167.5
+        )
+        assert created and user == await async_user_model.aget_by_id(6)
+        _, created = await async_user_model.aget_or_create(id=6, name="Amy")
+        assert not created
+
+    run(flow())
+
+
+def test_async_update_delete(async_user_model, users_data):
+    async def flow():
+        await async_user_model.insert_many(*users_data).aexecute()
+        sam = await async_user_model.aset_by_id(1, {"married": True})
+        assert sam.married and sam.name == "Sam"
+        with pytest.raises(async_user_model.DoesNotExist):
+            await async_user_model.aset_by_id(10, {"married": True})
+        sam.height = 180
+        assert await sam.asave()
+        assert (await async_user_model.aget_by_id(1)).height == 180
+        users = await async_user_model.update_many(
+            {"id": 2, "married": False}, {"id": 10, "married": False}
+        ).aexecute()
+        assert users[0].married is False and users[1] is None
+        assert await sam.adelete_instance()
+        assert await async_user_model.adelete_by_id(2)
+        with pytest.raises(async_user_model.DoesNotExist):
+            await async_user_model.adelete_by_id(2)
+        assert await async_user_model.delete_many({"id": 3}, {"id": 4}).aexecute()
+
+    run(flow())
+
+
+def test_async_multiple_backends_awaited_concurrently(registry):
+    started = []
+
+    class SlowBackend(co.AsyncBackendAdapter):
+        async def get_many(self, *keys):
+            started.append(keys)
+            await self.gate.wait()
+            return await super(SlowBackend, self).get_many(*keys)
+
+    class Foo(User):
+        class Meta:
+            serializer = registry.get_by_name("json")
+
+    class Bar(User):
+        class Meta:
+            serializer = registry.get_by_name("json")
+
+    async def flow():
+        gate = asyncio.Event()
+        for model in (Foo, Bar):
+            model._meta.backend = SlowBackend(co.SimpleBackend())
+            model._meta.backend.gate = gate
+            await model.acreate(id=1, name=model.__name__, height=170)
+        query = co.Query([(Foo, ({"id": 1},)), (Bar, ({"id": 1},))]).aexecute()
+        task = asyncio.ensure_future(query)
+        await asyncio.sleep(0.01)
+        # both backends are waiting at the same time.
+        assert 2 == len(started)
+        gate.set()
+        foo, bar = await task
+        assert foo.name == "Foo" and bar.name == "Bar"
+
+    run(flow())
+
+
+def test_async_backend_in_sync_execute(registry):
+    class Foo(User):
+        class Meta:
+            serializer = registry.get_by_name("json")
+            backend = co.AsyncBackendAdapter(co.SimpleBackend())
+
+    with pytest.raises(TypeError, match="aexecute"):
+        Foo.create(id=1, name="Sam", height=170)
+    with pytest.raises(TypeError, match="aexecute"):
+        Foo.get_or_none(id=1)
+    # the traced calls close the call of the backend and end its span.
+    Foo._meta.metrics = co.InMemoryMetrics()
+    with warnings.catch_warnings(record=True) as caught, co.trace() as t:
+        warnings.simplefilter("always")
+        with pytest.raises(TypeError, match="aexecute"):
+            Foo.get_or_none(id=1)
+        gc.collect()
+    assert not [w for w in caught if "never awaited" in str(w.message)]
+    assert all(s.end_time is not None for s in t.spans)
+    assert [s.name for s in t.spans].count("backend") == 1
+
+
+def test_sync_backend_in_aexecute(user_model):
+    sam = run(user_model.acreate(id=1, name="Sam", height=178.6))
+    assert user_model.get_by_id(1) == sam
+    assert run(user_model.aget_by_id(1)) == sam
@@ -0,0 +1,128 @@
+import asyncio
+
+import cacheorm as co
+import mock
+import pytest
+
+from .base_models import User
+
+
+def test_batch_one_round_trip_per_backend(
+    user_model, users_data, redis_client, article_model_factory
+):
+    simple = co.SimpleBackend()
+
+    class Article(article_model_factory(backend=simple)):
+        author = co.ForeignKeyField(user_model)
+
+    sam = user_model.create(**users_data[0])
+    redis = user_model._meta.backend
+    with mock.patch.object(
+        redis, "write_batch", wraps=redis.write_batch
+    ) as redis_batch, mock.patch.object(
+        simple, "write_batch", wraps=simple.write_batch
+    ) as simple_batch:
+        with co.batch():
+            sam.married = True
+            assert sam.save() is True
+            amy = user_model.create(**users_data[1])
+            article = Article.create(id=1, author=sam, title="CacheORM")
+            assert user_model.delete_by_id(3) is True
+            # nothing is sent before the exit, but the batch reads its writes.
+            assert redis_client.exists("m:testuser:id:2") == 0
+            assert user_model.get_by_id(2) == amy
+            assert Article.get_by_id(1) == article
+        assert redis_batch.call_count == simple_batch.call_count == 1
+    assert user_model.get_by_id(1).married is True
+    assert user_model.get_by_id(2) == amy
+    assert Article.get_by_id(1).title == "CacheORM"
+
+
+def test_batch_keeps_write_and_delete_ordering(user_model, users_data):
+    user_model.create(**users_data[0])
+    with co.batch():
+        user_model.delete_by_id(1)
+        assert user_model.get_or_none(id=1) is None
+        user_model.create(**users_data[1])
+        user_model.set_by_id(2, {"height": 170})
+        user_model.delete_by_id(2)
+        user_model.create(**users_data[2])
+        user_model.set_by_id(3, {"height": 190})
+    assert user_model.get_or_none(id=1) is None
+    assert user_model.get_or_none(id=2) is None
+    assert user_model.get_by_id(3).height == 190
+
+
+def test_batch_dropped_on_error(user_model, users_data):
+    with pytest.raises(RuntimeError):
+        with co.batch():
+            user_model.create(**users_data[0])
+            raise RuntimeError
+    assert user_model.get_or_none(id=1) is None
+    # insert_if_absent is not queued.
+    with co.batch():
+        assert user_model.insert_if_absent(**users_data[0]).execute() is not None
+        assert user_model.insert_if_absent(**users_data[0]).execute() is None
+
+
+def test_batch_insert_if_absent_reads_queued_writes(user_model, users_data):
+    backend = user_model._meta.backend
+    user_model.create(**users_data[0])
+    with mock.patch.object(backend, "add_many", wraps=backend.add_many) as add_many:
+        with co.batch():
+            user_model.delete_by_id(1)
+            user_model.create(**users_data[1])
+            # a queued delete frees the key, a queued write takes it.
+            sam, amy = user_model.insert_many_if_absent(*users_data[:2]).execute()
+            assert sam is not None and amy is None
+            user, created = user_model.get_or_create(**users_data[1])
+            assert not created and user.name == "Amy"
+            # the add in place of the delete is queued too.
+            assert user_model.get_by_id(1) == sam
+        add_many.assert_not_called()
+    assert user_model.get_by_id(1) == sam
+    assert user_model.get_by_id(2).name == "Amy"
+
+
+def test_batch_metrics_and_tracing(redis_client, users_data):
+    sink = co.InMemoryMetrics()
+
+    class MeteredUser(User):
+        class Meta:
+            serializer = co.registry.get_by_name("json")
+            backend = co.RedisBackend(client=redis_client)
+            metrics = sink
+
+    with co.trace() as t:
+        with co.batch():
+            MeteredUser.insert_many(*users_data[:2]).execute()
+            MeteredUser.delete_by_id(1)
+    stats = sink.get("model", MeteredUser._meta.name, "batch")
+    assert (stats.calls, stats.keys) == (1, 2)
+    assert sink.get("model", MeteredUser._meta.name, "insert") is None
+    assert [s.name for s in t.spans if s.name in ("batch", "backend")] == [
+        "backend",
+        "batch",
+    ]
+
+
+def test_batch_asyncio(registry, users_data):
+    class AsyncUser(User):
+        class Meta:
+            serializer = registry.get_by_name("msgpack")
+
+    AsyncUser._meta.backend = co.AsyncBackendAdapter(co.SimpleBackend())
+
+    async def run():
+        async with co.batch():
+            await AsyncUser.insert_many(*users_data[:2]).aexecute()
+            assert (await AsyncUser.aget_by_id(2)).name == "Amy"
+            await AsyncUser.update(id=1, married=True).aexecute()
+            assert await AsyncUser.delete(id=2).aexecute() is True
+            added = await AsyncUser.insert_many_if_absent(*users_data[:3]).aexecute()
+            assert [u is not None for u in added] == [False, True, True]
+            assert AsyncUser._meta.backend.backend.get("m:asyncuser:id:1") is None
+        assert (await AsyncUser.aget_by_id(1)).married is True
+        assert (await AsyncUser.aget_by_id(2)).name == "Amy"
+
+    asyncio.run(run())
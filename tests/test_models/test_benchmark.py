@@ -1,3 +1,7 @@
+import cacheorm as co
+import pytest
+
+
 def test_benchmark_insert(benchmark, user_model, users_data):
     def do_insert():
         return user_model.insert(**users_data[0]).execute()
@@ -72,3 +76,16 @@ def test_benchmark_delete_many(benchmark, user_model, users_data):
     benchmark(do_delete_many, [{"id": u.id} for u in users])
     for u in users:
         assert user_model.get_or_none(id=u.id) is None
+
+
+@pytest.mark.parametrize("metrics", ("disabled", "enabled"))
+def test_benchmark_query_many_metrics(benchmark, user_model, users_data, metrics):
+    if metrics == "enabled":
+        user_model._meta.metrics = co.InMemoryMetrics()
+
+    def do_query_many(query_list):
+        return user_model.query_many(*query_list).execute()
+
+    users = user_model.insert_many(*users_data).execute()
+    got_users = benchmark(do_query_many, [{"id": u.id} for u in users])
+    assert users == got_users
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import cacheorm as co
+import mock
+import pytest
+
+from .base_models import User
+
+
+def test_dataloader_threads(user_model, users_data, article_model_factory):
+    users = user_model.insert_many(*users_data).execute()
+    article_model = article_model_factory(backend=user_model._meta.backend)
+    article = article_model.create(id=1, title="CacheORM")
+    backend = user_model._meta.backend
+    with mock.patch.object(backend, "get_many", wraps=backend.get_many) as get_many:
+        with co.DataLoader():
+            futures = [user_model.loader().load(u.id) for u in users]
+            duplicate = user_model.loader().load(users[0].id)
+            missing = user_model.loader().load(100)
+            article_future = article_model.loader().load(1)
+            assert get_many.call_count == 0
+            assert [f.result() for f in futures] == users
+        assert get_many.call_count == 1
+        assert len(get_many.call_args[0]) == len(users) + 2
+    assert duplicate is futures[0]
+    assert missing.result() is None
+    assert article_future.result() == article
+    # the default data loader is per thread, resolved on demand.
+    future = user_model.loader().load(2)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(future.result()))
+    thread.start()
+    thread.join()
+    assert results == [users[1]]
+
+
+def test_dataloader_errors(user_model):
+    user_model._meta.backend = co.AsyncBackendAdapter(co.SimpleBackend())
+    with co.DataLoader():
+        future = user_model.loader().load(1)
+        assert isinstance(future.exception(), TypeError)
+        with pytest.raises(TypeError):
+            future.result()
+
+
+def test_dataloader_asyncio(registry, users_data):
+    class AsyncUser(User):
+        class Meta:
+            serializer = registry.get_by_name("msgpack")
+
+    backend = co.AsyncBackendAdapter(co.SimpleBackend())
+    AsyncUser._meta.backend = backend
+
+    async def resolve(pk):
+        return await AsyncUser.loader().load(pk)
+
+    async def run():
+        users = await AsyncUser.insert_many(*users_data[:3]).aexecute()
+        with mock.patch.object(backend, "get_many", wraps=backend.get_many) as get_many:
+            rv = await asyncio.gather(resolve(1), resolve(2), resolve(1), resolve(9))
+            assert rv == [users[0], users[1], users[0], None]
+            assert get_many.call_count == 1
+            assert await resolve(3) == users[2]
+            assert get_many.call_count == 2
+            # a cancelled load doesn't break the others.
+            cancelled = asyncio.ensure_future(resolve(1))
+            other = asyncio.ensure_future(resolve(2))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            assert await other == users[1]
+            # neither does cancelling one of the loads of the same key.
+            cancelled = asyncio.ensure_future(resolve(1))
+            same = asyncio.ensure_future(resolve(1))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            assert await same == users[0]
+            with mock.patch.object(get_many, "side_effect", ConnectionError):
+                with pytest.raises(ConnectionError):
+                    await resolve(1)
+
+    asyncio.run(run())
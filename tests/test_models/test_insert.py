@@ -1,5 +1,6 @@
 from unittest import mock
 
+import cacheorm as co
 import pytest
 from cacheorm.fields import IntegerField, StringField
 
@@ -73,3 +74,47 @@ def test_insert_many_empty(user_model):
     ) as mock_set_many:
         user_model.insert_many()
         mock_set_many.assert_not_called()
+
+
+def test_insert_if_absent(user_model):
+    sam = user_model.insert_if_absent(id=1, name="Sam", height=178.6).execute()
+    assert sam == user_model.get_by_id(1)
+    assert user_model.insert_if_absent(id=1, name="Amy", height=167.5).execute() is None
+    assert user_model.get_by_id(1).name == "Sam"
+
+
+def test_insert_many_if_absent(user_model):
+    user_model.create(id=1, name="Sam", height=178.6)
+    rows = [
+        {"id": 1, "name": "Amy", "height": 167.5},
+        user_model(id=2, name="Daming", height=180),
+    ]
+    with mock.patch.object(
+        user_model._meta.backend, "add_many", wraps=user_model._meta.backend.add_many
+    ) as mock_add_many:
+        insts = user_model.insert_many_if_absent(*rows).execute()
+        mock_add_many.assert_called_once()
+    assert insts[0] is None
+    assert insts[1] == user_model.get_by_id(2)
+    assert user_model.get_by_id(1).name == "Sam"
+
+
+def test_insert_with_compression(user_model):
+    class CompressedUser(user_model):
+        class Meta:
+            compression = co.Compressor(threshold=64)
+
+    class Student(CompressedUser):
+        number = StringField()
+
+    assert Student._meta.compression is CompressedUser._meta.compression
+    sam = CompressedUser.create(id=1, name="Sam" * 100, height=178.6)
+    amy = CompressedUser.create(id=2, name="Amy", height=167.5)
+    backend = user_model._meta.backend
+    raw_sam, raw_amy = backend.get_many(
+        "m:compresseduser:id:1", "m:compresseduser:id:2"
+    )
+    assert raw_sam[:1] == co.Compressor.ZLIB
+    assert raw_amy[:1] == co.Compressor.RAW
+    assert CompressedUser.get_by_id(1).name == sam.name
+    assert CompressedUser.get_by_id(2) == amy
@@ -0,0 +1,224 @@
+import asyncio
+import time
+
+import cacheorm as co
+import mock
+import pytest
+
+
+class Database(object):
+    def __init__(self, rows):
+        self.rows = {row["id"]: row for row in rows}
+        self.calls = []
+
+    def load(self, pks):
+        self.calls.append(list(pks))
+        return [self.rows[pk] for pk in pks if pk in self.rows]
+
+
+@pytest.fixture()
+def database():
+    return Database([{"id": i, "title": "title%d" % i} for i in range(1, 4)])
+
+
+@pytest.fixture()
+def make_article_model(article_model_factory, database):
+    def make(**options):
+        options.setdefault("loader", database.load)
+        return article_model_factory(**options)
+
+    return make
+
+
+def test_loader_fills_misses_in_one_call(database, make_article_model):
+    article_model = make_article_model()
+    article_model.insert(id=1, title="cached").execute()
+    articles = article_model.query_many({"id": 1}, {"id": 2}, {"id": 3}, {"id": 4})
+    articles = articles.execute()
+    assert [a and a.title for a in articles] == ["cached", "title2", "title3", None]
+    assert database.calls == [[2, 3, 4]]
+    # the loaded rows are written back.
+    assert article_model.get_by_id(3).title == "title3"
+    assert article_model.get_or_none(id=4) is None
+    assert database.calls == [[2, 3, 4], [4]]
+
+
+def test_loader_returns_instances(make_article_model):
+    article_model = make_article_model()
+    article_model._meta.loader = lambda pks: [
+        article_model(id=pk, title="t") for pk in pks
+    ]
+    assert article_model.get_by_id(1).title == "t"
+    assert article_model._meta.backend.has("m:article:id:1")
+
+
+def test_loader_stale_while_revalidate(database, make_article_model, wait_until):
+    article_model = make_article_model(stale_ttl=600)
+    assert article_model._meta.storage_ttl == 660
+    assert article_model.get_by_id(1).title == "title1"
+    database.rows[1]["title"] = "new title"
+    # still fresh.
+    assert article_model.get_by_id(1).title == "title1"
+    assert database.calls == [[1]]
+    with mock.patch("time.time", return_value=time.time() + 120):
+        # expired, served stale while refreshing in the background.
+        assert article_model.get_by_id(1).title == "title1"
+        wait_until(lambda: len(database.calls) == 2)
+        wait_until(lambda: article_model.get_by_id(1).title == "new title")
+    assert database.calls == [[1], [1]]
+
+
+def test_loader_logs_background_refresh_errors(
+    database, make_article_model, wait_until, caplog
+):
+    async def load(pks):
+        raise ConnectionError("down")
+
+    article_model = make_article_model(stale_ttl=600)
+    assert article_model.get_by_id(1).title == "title1"
+    article_model._meta.loader = mock.Mock(side_effect=ConnectionError)
+    with mock.patch("time.time", return_value=time.time() + 120):
+        assert article_model.get_by_id(1).title == "title1"
+        wait_until(lambda: caplog.records)
+    article_model._meta.loader = load
+    article_model._meta.backend = co.AsyncBackendAdapter(co.SimpleBackend())
+
+    async def run():
+        await article_model.acreate(id=2, title="title2")
+        with mock.patch("time.time", return_value=time.time() + 120):
+            assert (await article_model.aget_by_id(2)).title == "title2"
+            for _ in range(10):
+                await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert [r.message for r in caplog.records] == ["background refresh failed"] * 2
+    assert all(isinstance(r.exc_info[1], ConnectionError) for r in caplog.records)
+
+
+def test_loader_probabilistic_early_refresh(database, make_article_model, wait_until):
+    article_model = make_article_model(early_refresh=1.0)
+    assert article_model._meta.storage_ttl == 60
+    assert article_model.get_by_id(1).title == "title1"
+    database.rows[1]["title"] = "new title"
+    with mock.patch("random.random", return_value=0.0):
+        assert article_model.get_by_id(1).title == "title1"
+    assert database.calls == [[1]]
+    article_model._meta.early_refresh = 1e12
+    with mock.patch("random.random", return_value=0.5):
+        assert article_model.get_by_id(1).title == "title1"
+        wait_until(lambda: len(database.calls) == 2)
+    wait_until(lambda: article_model.get_by_id(1).title == "new title")
+
+
+def test_loader_asyncio(database, make_article_model):
+    async def load(pks):
+        await asyncio.sleep(0)
+        return database.load(pks)
+
+    article_model = make_article_model(loader=load, stale_ttl=600)
+    article_model._meta.backend = co.AsyncBackendAdapter(co.SimpleBackend())
+
+    async def run():
+        articles = await article_model.query_many({"id": 1}, {"id": 5}).aexecute()
+        assert [a and a.title for a in articles] == ["title1", None]
+        database.rows[1]["title"] = "new title"
+        with mock.patch("time.time", return_value=time.time() + 120):
+            assert (await article_model.aget_by_id(1)).title == "title1"
+            for _ in range(10):
+                await asyncio.sleep(0)
+        assert (await article_model.aget_by_id(1)).title == "new title"
+
+    asyncio.run(run())
+    assert database.calls == [[1, 5], [1]]
+
+
+def test_negative_caching(database, make_article_model):
+    metrics = co.InMemoryMetrics()
+    article_model = make_article_model(negative_ttl=5, metrics=metrics)
+    backend = article_model._meta.backend
+    assert article_model.query_many({"id": 1}, {"id": 4}).execute()[1] is None
+    assert backend.get("m:article:id:4") == co.model.TOMBSTONE
+    assert backend.get("m:article:id:1") != co.model.TOMBSTONE
+    # the tombstone is a definitive miss, neither loaded nor deserialized.
+    with mock.patch.object(co.model.CacheBuilder, "loads") as loads:
+        assert article_model.get_or_none(id=4) is None
+        loads.assert_not_called()
+    assert database.calls == [[1, 4]]
+    stats = metrics.get("model", "article", "query")
+    assert (stats.hits, stats.misses, stats.tombstones) == (0, 2, 1)
+    assert metrics.hit_ratio("model", "article") == 0
+    assert "cacheorm_tombstones_total" in co.PrometheusExporter(metrics).render()
+
+
+def test_negative_caching_insert_overwrites_tombstones(database, make_article_model):
+    article_model = make_article_model(negative_ttl=5)
+    articles = article_model.query_many({"id": 1}, {"id": 4}, {"id": 5}, {"id": 6})
+    assert [a and a.title for a in articles.execute()] == ["title1", None, None, None]
+    article_model.insert(id=4, title="title4").execute()
+    assert article_model.get_by_id(4).title == "title4"
+    created = article_model.insert_many_if_absent(
+        {"id": 1, "title": "new title"}, {"id": 5, "title": "title5"}
+    ).execute()
+    assert [a and a.title for a in created] == [None, "title5"]
+    assert article_model.get_by_id(5).title == "title5"
+    article, created = article_model.get_or_create(id=6, title="title6")
+    assert created and article_model.get_by_id(6).title == "title6"
+    assert database.calls == [[1, 4, 5, 6]]
+
+
+def test_negative_caching_concurrent_inserts_of_a_tombstone(
+    database, make_article_model
+):
+    article_model = make_article_model(negative_ttl=5)
+    assert article_model.get_or_none(id=5) is None
+    backend = article_model._meta.backend
+    get_many, others = backend.get_many, []
+
+    def racing_get_many(*keys):
+        payloads = get_many(*keys)
+        if not others:
+            others.append(None)
+            # another writer sees the tombstone too, before our set.
+            others[0] = article_model.insert_if_absent(id=5, title="other").execute()
+        return payloads
+
+    with mock.patch.object(backend, "get_many", side_effect=racing_get_many):
+        ours = article_model.insert_if_absent(id=5, title="ours").execute()
+    # the documented limitation: both report created, the last write wins.
+    assert others[0].title == "other" and ours.title == "ours"
+    assert article_model.get_by_id(5).title == "ours"
+
+
+def test_negative_caching_asyncio(database, make_article_model):
+    article_model = make_article_model(negative_ttl=5)
+    article_model._meta.backend = co.AsyncBackendAdapter(co.SimpleBackend())
+
+    async def run():
+        assert await article_model.aget_or_none(id=4) is None
+        assert await article_model.aget_or_none(id=4) is None
+        created = await article_model.insert_if_absent(id=4, title="t4").aexecute()
+        assert created.title == "t4"
+        assert (await article_model.aget_by_id(4)).title == "t4"
+
+    asyncio.run(run())
+    assert database.calls == [[4]]
+
+
+def test_negative_caching_never_hides_rows_inserted_while_loading(
+    database, make_article_model
+):
+    metrics = co.InMemoryMetrics()
+    article_model = make_article_model(negative_ttl=5, metrics=metrics)
+
+    def load(pks):
+        rows = database.load(pks)
+        # inserted after the loader read its database.
+        article_model.insert(id=4, title="title4").execute()
+        return rows
+
+    article_model._meta.loader = load
+    assert article_model.get_or_none(id=4) is None
+    assert article_model.get_by_id(4).title == "title4"
+    stats = metrics.get("model", "article", "load")
+    assert (stats.calls, stats.keys) == (1, 1)
+    assert stats.bytes_out == len(co.model.TOMBSTONE)
@@ -0,0 +1,63 @@
+import asyncio
+
+import cacheorm as co
+
+from .base_models import User
+
+
+def _user_model(cache_backend, sink):
+    class MeteredUser(User):
+        class Meta:
+            serializer = co.registry.get_by_name("json")
+            backend = cache_backend
+            metrics = sink
+
+    return MeteredUser
+
+
+def test_model_metrics(redis_client, users_data):
+    metrics = co.InMemoryMetrics()
+    user_model = _user_model(co.RedisBackend(client=redis_client), metrics)
+    users = user_model.insert_many(*users_data).execute()
+    assert user_model.insert_if_absent(**users_data[0]).execute() is None
+    user_model.query_many({"id": 1}, {"id": 2}, {"id": 100}).execute()
+    user_model.update(id=1, married=True).execute()
+    user_model.delete_by_id(1)
+    name = user_model._meta.name
+    stats = metrics.get("model", name, "insert")
+    assert (stats.calls, stats.keys) == (1, len(users))
+    assert stats.bytes_out > 0 and stats.bytes_in == 0
+    assert metrics.get("model", name, "insert_if_absent").keys == 1
+    stats = metrics.get("model", name, "query")
+    assert (stats.keys, stats.hits, stats.misses) == (3, 2, 1)
+    assert stats.bytes_in > 0 and stats.latency_sum > 0
+    stats = metrics.get("model", name, "update")
+    assert (stats.calls, stats.keys, stats.hits) == (2, 2, 1)
+    assert stats.bytes_in > 0 and stats.bytes_out > 0
+    assert metrics.get("model", name, "delete").keys == 1
+
+
+def test_model_metrics_only_for_metered_models(redis_client):
+    metrics = co.InMemoryMetrics()
+    backend = co.RedisBackend(client=redis_client)
+    metered, plain = _user_model(backend, metrics), _user_model(backend, None)
+    co.Query([(metered, ({"id": 1}, {"id": 2})), (plain, ({"id": 3},))]).execute()
+    assert [key for key, _ in metrics.items()] == [
+        ("model", metered._meta.name, "query")
+    ]
+    assert metrics.get("model", metered._meta.name, "query").misses == 2
+
+
+def test_model_metrics_asyncio(users_data):
+    metrics = co.InMemoryMetrics()
+    backend = co.AsyncBackendAdapter(co.SimpleBackend())
+    user_model = _user_model(backend, metrics)
+
+    async def run():
+        await user_model.insert_many(*users_data).aexecute()
+        await user_model.query_many({"id": 1}, {"id": 100}).aexecute()
+
+    asyncio.run(run())
+    stats = metrics.get("model", user_model._meta.name, "query")
+    assert (stats.hits, stats.misses) == (1, 1)
+    assert metrics.get("model", user_model._meta.name, "insert").keys == 4
@@ -1,5 +1,9 @@
+import asyncio
+import threading
 import time
 
+import cacheorm as co
+import mock
 import pytest
 
 
@@ -48,6 +52,65 @@ def test_get_or_create(user_model, inserted_users_data):
     user, created = user_model.get_or_create(id=5, name="Susan", height=170)
     assert created
     assert user == user_model.get_by_id(5)
+    user, created = user_model.get_or_create(id=5, name="Susan")
+    assert not created and user.height == 170
+    with pytest.raises(ValueError, match=r"missing value"):
+        user_model.get_or_create(id=6, name="Amy")
+
+
+def test_get_or_create_concurrently(user_model):
+    results = []
+
+    def create(name):
+        results.append(user_model.get_or_create(id=7, name=name, height=170))
+
+    threads = [threading.Thread(target=create, args=("user%d" % i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(created for _, created in results) == 1
+    winner = next(user for user, created in results if created)
+    assert {user.name for user, _ in results} == {winner.name}
+    assert user_model.get_by_id(7).name == winner.name
+
+
+def test_get_or_create_round_trips(user_model):
+    backend = user_model._meta.backend
+    with mock.patch.object(
+        backend, "add_many", wraps=backend.add_many
+    ) as mock_add_many, mock.patch.object(
+        backend, "get_many", wraps=backend.get_many
+    ) as mock_get_many:
+        _, created = user_model.get_or_create(id=8, name="Sam", height=178.6)
+        assert created
+        assert (mock_get_many.call_count, mock_add_many.call_count) == (1, 1)
+        mock_get_many.reset_mock()
+        mock_add_many.reset_mock()
+        # the common path, the record exists: one round trip.
+        _, created = user_model.get_or_create(id=8, name="Sam", height=178.6)
+        assert not created
+        mock_get_many.assert_called_once()
+        mock_add_many.assert_not_called()
+
+
+def test_get_or_create_gives_up(user_model):
+    class FullUser(user_model):
+        class Meta:
+            backend = co.SimpleBackend(max_bytes=10)
+
+    backend = FullUser._meta.backend
+    with mock.patch.object(backend, "add_many", wraps=backend.add_many) as add_many:
+        with pytest.raises(RuntimeError, match="neither found nor created"):
+            FullUser.get_or_create(id=1, name="Sam", height=178.6)
+        assert add_many.call_count == 3
+
+    class AsyncFullUser(user_model):
+        class Meta:
+            backend = co.AsyncBackendAdapter(co.SimpleBackend(max_bytes=10))
+
+    with pytest.raises(RuntimeError, match="neither found nor created"):
+        asyncio.run(AsyncFullUser.aget_or_create(id=1, name="Sam", height=178.6))
 
 
 def test_get_when_cache_expired(user_model):
@@ -61,3 +124,19 @@ def test_get_when_cache_expired(user_model):
     time.sleep(1.1)
     with pytest.raises(WrappedUser.DoesNotExist):
         WrappedUser.get_by_id(1)
+
+
+def test_query_through_tiered_backend(user_model, redis_client):
+    l2 = co.RedisBackend(client=redis_client)
+
+    class TieredUser(user_model):
+        class Meta:
+            backend = co.TieredBackend(co.SimpleBackend(), l2)
+
+    sam = TieredUser.create(id=1, name="Sam", height=178.6)
+    assert TieredUser.get_by_id(1) == sam
+    with mock.patch.object(l2, "get_many", wraps=l2.get_many) as mock_get_many:
+        assert TieredUser.get_by_id(1) == sam
+        mock_get_many.assert_not_called()
+    TieredUser.set_by_id(1, {"height": 180})
+    assert TieredUser.get_by_id(1).height == 180
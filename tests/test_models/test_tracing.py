@@ -0,0 +1,98 @@
+import asyncio
+
+import cacheorm as co
+import pytest
+
+
+def test_trace_query_many(user_model, users_data):
+    user_model.insert_many(*users_data).execute()
+    with co.trace() as t:
+        users = user_model.query_many({"id": 1}, {"id": 2}, {"id": 100}).execute()
+    assert users[2] is None
+    assert [s.name for s in t.spans] == [
+        "build_key",
+        "backend",
+        "loads",
+        "python_value",
+        "query",
+    ]
+    query = t.spans[-1]
+    assert all(s.parent is query for s in t.spans[:-1])
+    backend = t.spans[1]
+    assert backend.attributes == {"method": "get_many", "keys": 3}
+    assert set(t.summary()) == {s.name for s in t.spans}
+
+
+def test_trace_insert_update_delete(user_model, users_data):
+    with co.trace() as t:
+        user_model.insert(**users_data[0]).execute()
+        user_model.update(id=1, married=True).execute()
+        user_model.delete_by_id(1)
+    names = [s.name for s in t.spans]
+    assert names[:5] == ["build_key", "cache_value", "dumps", "backend", "insert"]
+    assert names.count("backend") == 4
+    assert [s.attributes["method"] for s in t.spans if s.name == "backend"] == [
+        "set",
+        "get_many",
+        "set",
+        "delete_many",
+    ]
+    assert names[-2:] == ["backend", "delete"]
+
+
+def test_trace_asyncio(users_data):
+    class AsyncUser(co.Model):
+        id = co.IntegerField(primary_key=True)
+        name = co.StringField()
+
+        class Meta:
+            backend = co.AsyncBackendAdapter(co.SimpleBackend())
+            serializer = co.registry.get_by_name("json")
+
+    async def run():
+        with co.trace() as t:
+            await AsyncUser.insert_many({"id": 1, "name": "Sam"}).aexecute()
+            await AsyncUser.query_many({"id": 1}, {"id": 2}).aexecute()
+        return t
+
+    t = asyncio.run(run())
+    backends = [s for s in t.spans if s.name == "backend"]
+    assert [s.attributes["method"] for s in backends] == ["set", "get_many"]
+    assert [s.parent.name for s in backends] == ["insert", "query"]
+
+
+def test_trace_ends_failed_backend_spans():
+    class BrokenBackend(co.SimpleBackend):
+        def get_many(self, *keys):
+            raise ConnectionError("down")
+
+    class Callback(object):
+        def __init__(self):
+            self.started = set()
+
+        def on_start(self, span):
+            self.started.add(span)
+
+        def on_end(self, span):
+            self.started.remove(span)
+
+    def user_model(broken):
+        class User(co.Model):
+            id = co.IntegerField(primary_key=True)
+
+            class Meta:
+                backend = broken
+                serializer = co.registry.get_by_name("json")
+
+        return User
+
+    callback = Callback()
+    with co.trace(callback) as t:
+        with pytest.raises(ConnectionError):
+            user_model(BrokenBackend()).get_by_id(1)
+        with pytest.raises(ConnectionError):
+            asyncio.run(
+                user_model(co.AsyncBackendAdapter(BrokenBackend())).aget_by_id(1)
+            )
+    assert not callback.started
+    assert [s.name for s in t.spans].count("backend") == 2
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+import pytest
+from cacheorm.tracing import OpenTelemetryCallback, current_tracer, stage, trace
+
+
+class RecordingCallback(object):
+    def __init__(self):
+        self.events = []
+
+    def on_start(self, span):
+        self.events.append(("start", span.name))
+
+    def on_end(self, span):
+        self.events.append(("end", span.name))
+
+
+def test_trace_stages():
+    callback = RecordingCallback()
+    assert current_tracer() is None
+    with stage("ignored") as span:
+        assert span is None
+    with trace(callback) as t:
+        assert current_tracer() is t
+        with stage("outer", model="user") as outer:
+            with stage("inner") as inner:
+                assert inner.parent is outer
+                assert inner.duration is None
+    assert current_tracer() is None
+    assert [s.name for s in t.spans] == ["inner", "outer"]
+    assert outer.parent is None and outer.attributes == {"model": "user"}
+    assert outer.duration >= inner.duration >= 0
+    assert set(t.summary()) == {"outer", "inner"}
+    assert callback.events == [
+        ("start", "outer"),
+        ("start", "inner"),
+        ("end", "inner"),
+        ("end", "outer"),
+    ]
+
+
+def test_trace_is_scoped_to_context():
+    seen = []
+    with trace() as t:
+        thread = threading.Thread(target=lambda: seen.append(current_tracer()))
+        thread.start()
+        thread.join()
+
+        async def child():
+            with stage("child") as span:
+                return span
+
+        async def run():
+            with stage("parent") as parent:
+                spans = await asyncio.gather(child(), child())
+            return parent, spans
+
+        parent, spans = asyncio.run(run())
+    assert seen == [None]
+    assert all(span.parent is parent for span in spans)
+    assert len(t.spans) == 3
+
+
+def test_open_telemetry_callback():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    with trace(OpenTelemetryCallback(provider)):
+        with stage("outer"):
+            with stage("inner", keys=2):
+                pass
+    inner, outer = exporter.get_finished_spans()
+    assert (inner.name, outer.name) == ("inner", "outer")
+    assert inner.parent.span_id == outer.context.span_id
+    assert inner.attributes["keys"] == 2